@@ -0,0 +1,634 @@
+"""
+Benchmarks de desempenho da mesa.
+
+Tudo roda num banco descartável (o mesmo que os testes usam), nunca no
+banco real:
+
+    python manage.py benchmark query-plans --rows 100000
+    python manage.py benchmark party
+    python manage.py benchmark table-session --players 6 --npcs 20 --rows 20000
+    python manage.py benchmark map-patch --map-kb 1024 --moves 50
+"""
+import contextlib
+import json
+import random
+import statistics
+import time
+from dataclasses import dataclass, field
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import (
+    Profile, Campaign, CampaignBan, Character, CharacterNote, Item, RollRequest,
+    Skill, Ability, PersonalityTrait, Stand, CursedTechnique, Zanpakuto,
+    DiceRoll, Notification,
+)
+
+BATCH_SIZE = 2000
+STATS = ('forca', 'destreza', 'vigor', 'inteligencia', 'sabedoria', 'carisma')
+
+
+@contextlib.contextmanager
+def isolated_database():
+    """Cria um banco de teste vazio (com migrations) e o descarta no fim"""
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+# ============== FIXTURES ==============
+
+@dataclass
+class TableFixture:
+    campaign: Campaign
+    master: User
+    players: list = field(default_factory=list)
+    characters: list = field(default_factory=list)
+    npcs: list = field(default_factory=list)
+
+
+def _make_users(prefix, count, is_game_master=False):
+    password = make_password(None)
+    users = User.objects.bulk_create(
+        User(username=f'{prefix}{i}', password=password) for i in range(count)
+    )
+    # bulk_create não dispara o signal que cria o Profile
+    Profile.objects.bulk_create(
+        Profile(user=user, is_game_master=is_game_master) for user in users
+    )
+    return users
+
+
+def _random_dice(rng):
+    return [rng.choice((-1, 0, 1)) for _ in range(4)]
+
+
+def build_table(
+    *,
+    name='Mesa',
+    campaign_type='generic',
+    players=6,
+    npcs=10,
+    items_per_character=5,
+    notes_per_character=2,
+    rolls=0,
+    notifications=0,
+    roll_requests=0,
+    rng=None,
+):
+    """Campanha completa com jogadores, NPCs, fichas e histórico"""
+    rng = rng or random.Random(0)
+    prefix = f'{name.lower().replace(" ", "-")}-'
+    master = _make_users(f'{prefix}mestre', 1, is_game_master=True)[0]
+    player_users = _make_users(f'{prefix}jogador', players)
+    campaign = Campaign.objects.create(name=name, campaign_type=campaign_type, owner=master)
+
+    skills = Skill.objects.bulk_create(
+        Skill(name=f'Skill {i}', use_status=STATS[i % len(STATS)], bonus=i % 3, campaign=campaign)
+        for i in range(10)
+    )
+    traits = PersonalityTrait.objects.bulk_create(
+        PersonalityTrait(name=f'Traço {i}', use_status=STATS[i % len(STATS)], bonus=1, campaign=campaign)
+        for i in range(10)
+    )
+    abilities = Ability.objects.bulk_create(
+        Ability(name=f'Habilidade {i}', campaign=campaign) for i in range(6)
+    )
+
+    characters = Character.objects.bulk_create(
+        [
+            Character(
+                name=f'Personagem {i}', owner=user, campaign=campaign,
+                **{stat: rng.randint(0, 4) for stat in STATS},
+            )
+            for i, user in enumerate(player_users)
+        ] + [
+            Character(name=f'NPC {i}', owner=master, campaign=campaign, is_npc=True)
+            for i in range(npcs)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    _attach_sheet(characters, campaign, skills, traits, abilities,
+                  items_per_character, notes_per_character, master, rng)
+
+    fixture = TableFixture(
+        campaign=campaign,
+        master=master,
+        players=player_users,
+        characters=characters[:players],
+        npcs=characters[players:],
+    )
+    if rolls:
+        build_rolls(fixture, rolls, rng)
+    if notifications:
+        build_notifications(fixture, notifications, rng)
+    if roll_requests:
+        build_roll_requests(fixture, roll_requests, rng)
+    return fixture
+
+
+def _attach_sheet(characters, campaign, skills, traits, abilities,
+                  items_per_character, notes_per_character, master, rng):
+    """Relações da ficha: traços, skills, habilidades, itens, notas e poderes"""
+    links = (
+        (Character.personality_traits.through, 'personalitytrait_id', traits, 5),
+        (Character.skills.through, 'skill_id', skills, 3),
+        (Character.abilities.through, 'ability_id', abilities, 2),
+    )
+    for through, column, pool, per_character in links:
+        through.objects.bulk_create(
+            (
+                through(character_id=character.id, **{column: related.id})
+                for character in characters
+                for related in rng.sample(pool, per_character)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+
+    item_types = [choice for choice, _ in Item.ITEM_TYPES]
+    Item.objects.bulk_create(
+        (
+            Item(
+                name=f'Item {i}', item_type=rng.choice(item_types), owner_character=character,
+                bonus_status=rng.choice(STATS), bonus_value=rng.randint(0, 2),
+            )
+            for character in characters
+            for i in range(items_per_character)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    CharacterNote.objects.bulk_create(
+        (
+            CharacterNote(character=character, author=master, content=f'Nota {i}')
+            for character in characters
+            for i in range(notes_per_character)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+    if campaign.campaign_type == 'jojo':
+        powers = Stand.objects.bulk_create(
+            Stand(name=f'Stand {c.id}', owner_character=c) for c in characters
+        )
+        m2m = [(Stand.abilities.through, 'stand_id')]
+    elif campaign.campaign_type == 'bleach':
+        powers = Zanpakuto.objects.bulk_create(
+            Zanpakuto(name=f'Zanpakutou {c.id}', owner_character=c) for c in characters
+        )
+        m2m = [
+            (Zanpakuto.shikai_abilities.through, 'zanpakuto_id'),
+            (Zanpakuto.bankai_abilities.through, 'zanpakuto_id'),
+        ]
+    elif campaign.campaign_type == 'jjk':
+        powers = CursedTechnique.objects.bulk_create(
+            CursedTechnique(name=f'Técnica {c.id}', owner_character=c) for c in characters
+        )
+        m2m = [(CursedTechnique.abilities.through, 'cursedtechnique_id')]
+    else:
+        return
+    for through, column in m2m:
+        through.objects.bulk_create(
+            (
+                through(ability_id=ability.id, **{column: power.id})
+                for power in powers
+                for ability in rng.sample(abilities, 2)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+
+
+def build_rolls(fixture, count, rng):
+    pool = fixture.characters + fixture.npcs
+    skills = list(Skill.objects.filter(campaign=fixture.campaign))
+
+    def _roll():
+        dice = _random_dice(rng)
+        total = sum(dice)
+        bonus = rng.randint(0, 6)
+        return DiceRoll(
+            character=rng.choice(pool), campaign=fixture.campaign,
+            dice_1=dice[0], dice_2=dice[1], dice_3=dice[2], dice_4=dice[3],
+            dice_total=total, final_total=total,
+            skill_used=rng.choice(skills), hidden_bonus=bonus, hidden_total=total + bonus,
+            seen_by_master=True,
+        )
+
+    return DiceRoll.objects.bulk_create((_roll() for _ in range(count)), batch_size=BATCH_SIZE)
+
+
+def build_notifications(fixture, count, rng, read_ratio=0.9):
+    recipients = [fixture.master] + fixture.players
+    types = [choice for choice, _ in Notification.NOTIFICATION_TYPES if choice != 'digest']
+    return Notification.objects.bulk_create(
+        (
+            Notification(
+                campaign=fixture.campaign, recipient=rng.choice(recipients),
+                notification_type=rng.choice(types), title='Benchmark', message='Benchmark',
+                is_read=rng.random() < read_ratio,
+            )
+            for _ in range(count)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+def build_roll_requests(fixture, count, rng, open_ratio=0.05):
+    return RollRequest.objects.bulk_create(
+        (
+            RollRequest(
+                campaign=fixture.campaign, character=rng.choice(fixture.characters),
+                requested_by=fixture.master, is_open=rng.random() < open_ratio,
+            )
+            for _ in range(count)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+# ============== MEDIÇÃO ==============
+
+def summarize(samples):
+    """Percentis em milissegundos"""
+    ordered = sorted(samples)
+
+    def pct(p):
+        index = min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1)))
+        return round(ordered[index] * 1000, 3)
+
+    return {
+        'runs': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p50_ms': pct(50),
+        'p90_ms': pct(90),
+        'p99_ms': pct(99),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+def time_call(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def count_queries(func):
+    with CaptureQueriesContext(connection) as captured:
+        func()
+    return len(captured)
+
+
+# ============== CENÁRIOS ==============
+
+def hot_queries(fixture):
+    """As consultas quentes como as views as montam"""
+    from .views import poll_state_queryset
+
+    campaign = fixture.campaign
+    player = fixture.players[0]
+    return {
+        'poll_state': lambda: poll_state_queryset(player).filter(id=campaign.id),
+        'poll_notifications': lambda: Notification.objects.filter(
+            campaign=campaign, recipient=player, is_read=False,
+        ).order_by('-created_at')[:10],
+        'poll_recent_rolls': lambda: DiceRoll.objects.filter(
+            campaign=campaign,
+        ).order_by('-created_at')[:10],
+        'poll_roll_requests': lambda: RollRequest.objects.filter(
+            campaign=campaign, is_open=True, character__owner=player,
+        ).order_by('-created_at')[:10],
+        'ban_check': lambda: CampaignBan.objects.filter(
+            campaign=campaign, user=player, is_active=True,
+        )[:1],
+        'party': lambda: Character.objects.filter(
+            campaign=campaign, is_npc=False,
+        ).order_by('name'),
+        'npcs': lambda: Character.objects.filter(
+            campaign=campaign, is_npc=True,
+        ).order_by('name'),
+        'player_character': lambda: Character.objects.filter(
+            campaign=campaign, owner=player, is_npc=False,
+        )[:1],
+        'notification_list': lambda: Notification.objects.filter(
+            recipient=player, campaign=campaign,
+        ).order_by('-created_at')[:100],
+        'unread_count': lambda: Notification.objects.filter(
+            recipient=player, campaign=campaign, is_read=False,
+        ).values('id'),
+    }
+
+
+@contextlib.contextmanager
+def without_indexes(models):
+    """Remove temporariamente os índices compostos declarados em Meta.indexes"""
+    dropped = [(model, index) for model in models for index in model._meta.indexes]
+    with connection.schema_editor() as editor:
+        for model, index in dropped:
+            editor.remove_index(model, index)
+    try:
+        yield
+    finally:
+        with connection.schema_editor() as editor:
+            for model, index in dropped:
+                editor.add_index(model, index)
+
+
+def _explain_all(queries, repeat):
+    report = {}
+    for name, build in queries.items():
+        report[name] = {
+            'plan': build().explain().splitlines(),
+            'timing': time_call(lambda: list(build()), repeat),
+        }
+    return report
+
+
+def run_query_plans(options):
+    rng = random.Random(options['seed'])
+    campaigns = max(1, options['campaigns'])
+    per_campaign = max(1, options['rows'] // campaigns)
+    tables = [
+        build_table(
+            name=f'Mesa {i}', players=6, npcs=10,
+            items_per_character=1, notes_per_character=0,
+            rolls=per_campaign, notifications=per_campaign,
+            roll_requests=max(1, per_campaign // 10), rng=rng,
+        )
+        for i in range(campaigns)
+    ]
+    queries = hot_queries(tables[0])
+    with without_indexes((Notification, DiceRoll, RollRequest, Character)):
+        before = _explain_all(queries, options['repeat'])
+    after = _explain_all(queries, options['repeat'])
+    return {
+        'scenario': 'query-plans',
+        'vendor': connection.vendor,
+        'rows_per_table': per_campaign * campaigns,
+        'campaigns': campaigns,
+        'queries': {
+            name: {'before': before[name], 'after': after[name]}
+            for name in queries
+        },
+    }
+
+
+def run_party(options):
+    """party/npcs de campanhas com 50 NPCs: serialização sem e com prefetch"""
+    from .serializers import CharacterMasterSerializer
+    from .views import character_queryset
+
+    rng = random.Random(options['seed'])
+    report = {}
+    for campaign_type in ('generic', 'jojo', 'bleach', 'jjk'):
+        fixture = build_table(
+            name=f'Mesa {campaign_type}', campaign_type=campaign_type,
+            players=6, npcs=50, rng=rng,
+        )
+        campaign = fixture.campaign
+        client = APIClient()
+        client.force_authenticate(fixture.master)
+        variants = {
+            'npcs_without_prefetch': lambda: CharacterMasterSerializer(
+                Character.objects.filter(campaign=campaign, is_npc=True).order_by('name'), many=True,
+            ).data,
+            'npcs_with_prefetch': lambda: CharacterMasterSerializer(
+                character_queryset().filter(campaign=campaign, is_npc=True).order_by('name'), many=True,
+            ).data,
+            'GET party': lambda: client.get(f'/api/campaigns/{campaign.id}/party/'),
+            'GET npcs': lambda: client.get(f'/api/campaigns/{campaign.id}/npcs/'),
+        }
+        report[campaign_type] = {
+            name: {'queries': count_queries(func), 'timing': time_call(func, options['repeat'])}
+            for name, func in variants.items()
+        }
+    return {
+        'scenario': 'party',
+        'vendor': connection.vendor,
+        'players': 6,
+        'npcs': 50,
+        'campaign_types': report,
+    }
+
+
+def _session_requests(fixture, count):
+    """Solicitações abertas suficientes para cada chamada de complete_roll"""
+    character = fixture.characters[0]
+    return iter(RollRequest.objects.bulk_create(
+        RollRequest(
+            campaign=fixture.campaign, character=character,
+            requested_by=fixture.master, description='Benchmark',
+        )
+        for _ in range(count)
+    ))
+
+
+def run_table_session(options):
+    """Uma sessão de mesa pelos endpoints reais: leituras do poll e ações dos jogadores"""
+    rng = random.Random(options['seed'])
+    repeat = options['repeat']
+    fixture = build_table(
+        name='Sessão', players=max(2, options['players']), npcs=options['npcs'],
+        items_per_character=options['items'], rolls=options['rows'],
+        notifications=options['rows'], roll_requests=max(1, options['rows'] // 10), rng=rng,
+    )
+    campaign = fixture.campaign
+    player, other = fixture.characters[0], fixture.characters[1]
+
+    master_client = APIClient()
+    master_client.force_authenticate(fixture.master)
+    player_client = APIClient()
+    player_client.force_authenticate(fixture.players[0])
+
+    # Cada ação consome uma solicitação/unidade: uma para contar queries e as do timing
+    open_requests = _session_requests(fixture, repeat + 1)
+    item = Item.objects.create(name='Poção', owner_character=player, quantity=repeat + 1)
+    poll_url = f'/api/campaigns/{campaign.id}/poll/'
+    poll_etag = player_client.get(poll_url)['ETag']
+
+    endpoints = {
+        'GET poll': lambda: player_client.get(poll_url),
+        'GET poll (304)': lambda: player_client.get(poll_url, HTTP_IF_NONE_MATCH=poll_etag),
+        'GET party (jogador)': lambda: player_client.get(f'/api/campaigns/{campaign.id}/party/'),
+        'GET party (mestre)': lambda: master_client.get(f'/api/campaigns/{campaign.id}/party/'),
+        'GET characters': lambda: master_client.get(f'/api/characters/?campaign={campaign.id}'),
+        'POST complete_roll': lambda: player_client.post(
+            f'/api/campaigns/{campaign.id}/complete_roll/',
+            {'request_id': next(open_requests).id}, format='json',
+        ),
+        'POST item transfer': lambda: player_client.post(
+            f'/api/items/{item.id}/transfer/',
+            {'to_character_id': other.id, 'quantity': 1}, format='json',
+        ),
+        'GET notifications': lambda: player_client.get(f'/api/notifications/?campaign={campaign.id}'),
+    }
+
+    report = {}
+    for name, func in endpoints.items():
+        with CaptureQueriesContext(connection) as captured:
+            response = func()
+        report[name] = {
+            'status': response.status_code,
+            'queries': len(captured),
+            'timing': time_call(func, repeat),
+        }
+    return {
+        'scenario': 'table-session',
+        'vendor': connection.vendor,
+        'players': len(fixture.players),
+        'npcs': len(fixture.npcs),
+        'items_per_character': options['items'],
+        'rolls': options['rows'],
+        'notifications': options['rows'],
+        'endpoints': report,
+    }
+
+
+def build_map_data(target_kb, rng):
+    """map_data no formato do CampaignMap com ~``target_kb`` KB: grupos, névoa e desenhos"""
+    def stroke(points, color, width):
+        return {
+            'points': [{'x': round(rng.random(), 4), 'y': round(rng.random(), 4)} for _ in range(points)],
+            'color': color, 'width': width,
+        }
+
+    map_data = {
+        'groups': [
+            {
+                'id': f'group-{i}', 'name': f'Grupo {i}', 'members': [i],
+                'x': round(rng.random(), 4), 'y': round(rng.random(), 4), 'color': '#3b82f6',
+            }
+            for i in range(300)
+        ],
+        'fog': [],
+        'strokes': [],
+    }
+    size = len(json.dumps(map_data))
+    while size < target_kb * 1024:
+        fog = stroke(40, 'rgba(15, 15, 15, 0.7)', 18)
+        annotation = stroke(40, '#ef4444', 2)
+        map_data['fog'].append(fog)
+        map_data['strokes'].append(annotation)
+        size += len(json.dumps(fog)) + len(json.dumps(annotation)) + 4
+    return map_data
+
+
+def run_map_patch(options):
+    """
+    Mestre movendo grupos num mapa grande: update_map (documento inteiro) contra
+    patch_map (JSON Patch). As requisições rodam em sequência; os totais por
+    minuto projetam o ritmo de ``--moves`` movimentos por minuto.
+    """
+    from .events import EVENT_MAP, EVENT_MAP_PATCH, CampaignEvent
+
+    rng = random.Random(options['seed'])
+    moves = options['moves']
+    fixture = build_table(name='Mapa', players=6, npcs=0, rng=rng)
+    campaign = fixture.campaign
+    map_data = build_map_data(options['map_kb'], rng)
+    Campaign.objects.filter(id=campaign.id).update(map_data=map_data)
+
+    master_client = APIClient()
+    master_client.force_authenticate(fixture.master)
+    player_client = APIClient()
+    player_client.force_authenticate(fixture.players[0])
+    url = f'/api/campaigns/{campaign.id}/'
+    queries = {}
+
+    def post(path, body):
+        # Queries contadas só no aquecimento: capturar 1 MB de SQL distorce o tempo
+        captured = CaptureQueriesContext(connection) if path not in queries else contextlib.nullcontext()
+        with captured:
+            start = time.perf_counter()
+            response = master_client.post(path, body, format='json')
+            elapsed = time.perf_counter() - start
+        if path not in queries:
+            queries[path] = len(captured)
+        return response, elapsed
+
+    def event_bytes(event_type, data):
+        data = json.loads(json.dumps(data, cls=JSONEncoder))
+        return len(CampaignEvent(campaign.id, event_type, data).encode())
+
+    def move_full():
+        group = rng.choice(map_data['groups'])
+        group.update(x=round(rng.random(), 4), y=round(rng.random(), 4))
+        body = {'map_data': map_data}
+        response, elapsed = post(f'{url}update_map/', body)
+        # Quem recebe o evento de mapa busca o documento inteiro de novo
+        refetch = player_client.get(f'{url}map/')
+        listener = event_bytes(EVENT_MAP, {'image': None, 'updated_at': response.data['map_updated_at']})
+        return response, elapsed, len(json.dumps(body)), listener + len(refetch.content)
+
+    def move_patch():
+        index = rng.randrange(len(map_data['groups']))
+        body = {
+            'version': Campaign.objects.values_list('map_version', flat=True).get(id=campaign.id),
+            'operations': [
+                {'op': 'test', 'path': f'/groups/{index}/id', 'value': f'group-{index}'},
+                {'op': 'replace', 'path': f'/groups/{index}/x', 'value': round(rng.random(), 4)},
+                {'op': 'replace', 'path': f'/groups/{index}/y', 'value': round(rng.random(), 4)},
+            ],
+        }
+        response, elapsed = post(f'{url}patch_map/', body)
+        listener = event_bytes(EVENT_MAP_PATCH, {
+            'version': response.data['map_version'], 'operations': body['operations'],
+            'updated_at': response.data['map_updated_at'],
+        })
+        return response, elapsed, len(json.dumps(body)), listener
+
+    report = {}
+    for name, path, move in (
+        ('update_map (inteiro)', f'{url}update_map/', move_full),
+        ('patch_map (JSON Patch)', f'{url}patch_map/', move_patch),
+    ):
+        move()
+        samples, statuses = [], set()
+        sent = received = listener_total = 0
+        for _ in range(moves):
+            response, elapsed, request_bytes, listener_bytes = move()
+            samples.append(elapsed)
+            statuses.add(response.status_code)
+            sent += request_bytes
+            received += len(response.content)
+            listener_total += listener_bytes
+        timing = summarize(samples)
+        report[name] = {
+            'status': sorted(statuses),
+            'queries': queries[path],
+            'timing': timing,
+            'request_bytes': sent // moves,
+            'response_bytes': received // moves,
+            'bytes_per_listener': listener_total // moves,
+            'per_minute': {
+                'upload_kb': round(sent / 1024, 1),
+                'kb_per_listener': round(listener_total / 1024, 1),
+                'server_ms': round(sum(samples) * 1000, 1),
+            },
+        }
+    return {
+        'scenario': 'map-patch',
+        'vendor': connection.vendor,
+        'map_kb': round(len(json.dumps(map_data)) / 1024, 1),
+        'groups': len(map_data['groups']),
+        'moves_per_minute': moves,
+        'strategies': report,
+    }
+
+
+SCENARIOS = {
+    'query-plans': run_query_plans,
+    'party': run_party,
+    'table-session': run_table_session,
+    'map-patch': run_map_patch,
+}
@@ -0,0 +1,93 @@
+"""
+Cache das listagens de catálogo (skills, abilities, vantagens, traços e kidou).
+
+Cada catálogo tem um token de versão global e um por campanha. A chave da
+listagem inclui os dois, então salvar ou apagar um registro só precisa trocar
+o token (ver signals): as entradas antigas deixam de ser lidas e expiram sozinhas.
+Registros sem campanha (globais) trocam o token global e derrubam o catálogo
+inteiro; os de uma campanha trocam o dela e o da listagem sem filtro.
+"""
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import urlencode
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.response import Response
+
+from .permissions import get_authorization_context
+
+CACHE_TIMEOUT = 60 * 60
+GLOBAL_SCOPE = 'global'
+ALL_SCOPE = 'all'
+
+
+def _version_key(catalog, scope):
+    return f'catalog-version:{catalog}:{scope}'
+
+
+def _catalog_versions(catalog, scope):
+    keys = [_version_key(catalog, GLOBAL_SCOPE), _version_key(catalog, scope)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def invalidate_catalog(catalog, campaign_ids):
+    """Troca os tokens das campanhas afetadas (None = registro global)"""
+    campaign_ids = set(campaign_ids)
+    if None in campaign_ids:
+        scopes = {GLOBAL_SCOPE}
+    else:
+        scopes = {ALL_SCOPE, *campaign_ids}
+    keys = [_version_key(catalog, scope) for scope in scopes]
+
+    def bump():
+        cache.set_many({key: uuid.uuid4().hex for key in keys}, None)
+
+    bump()
+    # De novo no commit: listas montadas antes dele ficam na versão descartada
+    transaction.on_commit(bump)
+
+
+def catalog_key(catalog, scope, variant):
+    versions = ':'.join(_catalog_versions(catalog, scope))
+    return f'catalog:{catalog}:{scope}:{variant}:{versions}'
+
+
+class CachedCatalogMixin:
+    """
+    Serve o ``list`` do cache. A chave leva a campanha (``?campaign=``), o
+    serializer usado (mestre e jogador veem campos diferentes) e os filtros
+    listados em ``catalog_filter_params``.
+    """
+    catalog_name = None
+    catalog_filter_params = ()
+
+    def get_catalog_variant(self):
+        params = self.request.query_params
+        filters = sorted((name, params[name]) for name in self.catalog_filter_params if params.get(name))
+        variant = self.get_serializer_class().__name__
+        return f'{variant}?{urlencode(filters)}' if filters else variant
+
+    def list(self, request, *args, **kwargs):
+        scope = ALL_SCOPE
+        campaign_id = request.query_params.get('campaign')
+        if campaign_id:
+            try:
+                scope = int(campaign_id)
+            except (TypeError, ValueError):
+                return super().list(request, *args, **kwargs)
+            context = get_authorization_context(request.user)
+            if not context.is_game_master and context.is_banned_from(scope):
+                raise PermissionDenied('Você foi banido desta campanha.')
+
+        key = catalog_key(self.catalog_name, scope, self.get_catalog_variant())
+        data = cache.get(key)
+        if data is None:
+            data = list(super().list(request, *args, **kwargs).data)
+            cache.set(key, data, CACHE_TIMEOUT)
+        return Response(data)
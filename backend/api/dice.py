@@ -0,0 +1,130 @@
+"""
+Motor de dados FATE (4dF).
+
+Gera os dados de várias rolagens numa chamada só e grava todas com um único
+INSERT. Recebe opcionalmente um ``random.Random`` com semente para que os
+resultados sejam reproduzíveis.
+"""
+import itertools
+import random
+from collections import Counter
+from dataclasses import dataclass
+from fractions import Fraction
+
+from django.db import transaction
+from django.db.models import F
+from rest_framework.exceptions import ValidationError
+
+from .events import publish_rolls
+from .models import Character, DiceRoll, Skill
+from .modifiers import hidden_bonus, modifier_tables
+
+FATE_FACES = (-1, 0, 1)
+DICE_PER_ROLL = 4
+
+
+@dataclass
+class RollSpec:
+    """Uma rolagem pedida: personagem, skill opcional e uso de fate point"""
+    character: object
+    skill_id: int = None
+    description: str = ''
+    use_fate_point: bool = False
+
+
+def roll_fate(count=1, rng=None):
+    """``count`` rolagens 4dF de uma vez, como tuplas de 4 dados"""
+    rng = rng or random
+    faces = rng.choices(FATE_FACES, k=count * DICE_PER_ROLL)
+    return [tuple(faces[i:i + DICE_PER_ROLL]) for i in range(0, len(faces), DICE_PER_ROLL)]
+
+
+def fate_distribution(dice=DICE_PER_ROLL):
+    """Probabilidade exata de cada total de NdF: {total: Fraction}"""
+    counts = Counter(sum(faces) for faces in itertools.product(FATE_FACES, repeat=dice))
+    outcomes = len(FATE_FACES) ** dice
+    return {total: Fraction(count, outcomes) for total, count in sorted(counts.items())}
+
+
+def _resolve_skills(specs):
+    skills = Skill.objects.in_bulk({spec.skill_id for spec in specs if spec.skill_id})
+    resolved = []
+    for spec in specs:
+        skill = None
+        if spec.skill_id:
+            skill = skills.get(spec.skill_id)
+            if skill is None:
+                raise ValidationError('Skill não encontrada.')
+            if skill.campaign_id and skill.campaign_id != spec.character.campaign_id:
+                raise ValidationError('Skill inválida para esta campanha.')
+        resolved.append(skill)
+    return resolved
+
+
+def change_fate_points(character, delta):
+    """
+    Soma ``delta`` aos fate points num UPDATE condicional só dessa coluna.
+
+    Nunca deixa o saldo negativo: retorna False (sem alterar nada) se não
+    houver pontos suficientes para gastar.
+    """
+    queryset = Character.objects.filter(pk=character.pk)
+    if delta < 0:
+        queryset = queryset.filter(fate_points__gte=-delta)
+    if not queryset.update(fate_points=F('fate_points') + delta):
+        return False
+    character.refresh_from_db(fields=['fate_points'])
+    return True
+
+
+def _spend_fate_points(specs):
+    spent = Counter(spec.character.id for spec in specs if spec.use_fate_point)
+    characters = {spec.character.id: spec.character for spec in specs}
+    for character_id, amount in spent.items():
+        if not change_fate_points(characters[character_id], -amount):
+            raise ValidationError('Sem fate points disponíveis.')
+
+
+def create_dice_rolls(specs, rng=None):
+    """Rola e grava todas as rolagens pedidas (um INSERT para o lote)"""
+    from .roll_stats import invalidate_roll_stats  # roll_stats importa este módulo
+
+    specs = list(specs)
+    if not specs:
+        return []
+    skills = _resolve_skills(specs)
+    tables = modifier_tables(spec.character for spec in specs)
+    results = roll_fate(len(specs), rng)
+
+    rolls = []
+    for spec, skill, dice in zip(specs, skills, results):
+        dice_total = sum(dice)
+        if spec.use_fate_point:
+            dice = (1, 1, 1, 1)
+            final_total = 4
+        else:
+            final_total = dice_total
+        bonus = hidden_bonus(tables[spec.character.id], skill)
+        rolls.append(DiceRoll(
+            character=spec.character,
+            campaign=spec.character.campaign,
+            dice_1=dice[0],
+            dice_2=dice[1],
+            dice_3=dice[2],
+            dice_4=dice[3],
+            dice_total=dice_total,
+            used_fate_point=spec.use_fate_point,
+            final_total=final_total,
+            skill_used=skill,
+            description=spec.description or '',
+            hidden_bonus=bonus,
+            hidden_total=final_total + bonus,
+        ))
+
+    with transaction.atomic():
+        _spend_fate_points(specs)
+        created = DiceRoll.objects.bulk_create(rolls)
+        # bulk_create não dispara post_save: publica e invalida aqui
+        publish_rolls(created)
+        invalidate_roll_stats(roll.campaign_id for roll in created)
+    return created
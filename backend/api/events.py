@@ -0,0 +1,203 @@
+"""
+Canal de eventos da campanha (push via Server-Sent Events).
+
+As views síncronas publicam eventos no broker; cada conexão SSE aberta em
+``campaigns/<id>/events/`` recebe apenas os eventos que o usuário pode ver.
+O broker padrão é em memória (um processo); para vários workers, aponte
+``CAMPAIGN_EVENTS_BROKER`` para outra implementação com a mesma interface.
+"""
+import asyncio
+import json
+import threading
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.functional import SimpleLazyObject
+from django.utils.module_loading import import_string
+from rest_framework.utils.encoders import JSONEncoder
+
+from .serializers import DiceRollMasterSerializer, NotificationSerializer, RollRequestSerializer
+
+EVENT_PROJECTION = 'projection'
+EVENT_MAP = 'map'
+EVENT_MAP_PATCH = 'map_patch'
+EVENT_NOTIFICATION = 'notification'
+EVENT_ROLL = 'roll'
+EVENT_ROLL_REQUEST = 'roll_request'
+EVENT_RESYNC = 'resync'
+
+
+@dataclass
+class CampaignEvent:
+    campaign_id: int
+    event_type: str
+    data: dict
+    # None = todos os participantes; senão apenas estes user ids
+    recipients: frozenset = None
+    masters_only: bool = False
+
+    def visible_to(self, subscriber):
+        if self.masters_only and not subscriber.is_master:
+            return False
+        if self.recipients is not None and subscriber.user_id not in self.recipients:
+            return False
+        return True
+
+    def encode(self):
+        payload = json.dumps(self.data, cls=JSONEncoder)
+        return f'event: {self.event_type}\ndata: {payload}\n\n'
+
+
+@dataclass(eq=False)
+class Subscriber:
+    campaign_id: int
+    user_id: int
+    is_master: bool
+    loop: asyncio.AbstractEventLoop
+    queue: asyncio.Queue = field(default=None)
+    overflowed: bool = False
+
+    def deliver(self, event):
+        """Chamado no loop do assinante (via call_soon_threadsafe)."""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Cliente lento: descarta a fila e pede para ele ressincronizar
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(CampaignEvent(self.campaign_id, EVENT_RESYNC, {}))
+
+
+class InProcessBroker:
+    """Broker em memória, seguro para publicar a partir de threads síncronas."""
+
+    def __init__(self, queue_size=None):
+        self.queue_size = queue_size or getattr(settings, 'CAMPAIGN_EVENTS_QUEUE_SIZE', 100)
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, campaign_id, user_id, is_master, loop=None):
+        subscriber = Subscriber(
+            campaign_id=campaign_id,
+            user_id=user_id,
+            is_master=is_master,
+            loop=loop or asyncio.get_running_loop(),
+            queue=asyncio.Queue(maxsize=self.queue_size),
+        )
+        with self._lock:
+            self._subscribers.setdefault(campaign_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.campaign_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[subscriber.campaign_id]
+
+    def has_subscribers(self, campaign_id):
+        return bool(self._subscribers.get(campaign_id))
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(event.campaign_id, ()))
+        for subscriber in subscribers:
+            if not event.visible_to(subscriber):
+                continue
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.deliver, event)
+            except RuntimeError:
+                # Loop já encerrado; a conexão será limpa no finally da view
+                pass
+
+
+broker = SimpleLazyObject(
+    lambda: import_string(
+        getattr(settings, 'CAMPAIGN_EVENTS_BROKER', 'api.events.InProcessBroker')
+    )()
+)
+
+
+def publish(campaign_id, event_type, build_data, recipients=None, masters_only=False):
+    """
+    Agenda um evento para depois do commit.
+
+    ``build_data`` é um callable: o payload só é serializado se houver
+    alguém conectado à campanha.
+    """
+    if recipients is not None:
+        recipients = frozenset(recipients)
+
+    def _send():
+        if not broker.has_subscribers(campaign_id):
+            return
+        broker.publish(CampaignEvent(
+            campaign_id=campaign_id,
+            event_type=event_type,
+            data=build_data(),
+            recipients=recipients,
+            masters_only=masters_only,
+        ))
+
+    transaction.on_commit(_send)
+
+
+def publish_projection(campaign):
+    publish(campaign.id, EVENT_PROJECTION, lambda: {
+        'image': campaign.projection_image.url if campaign.projection_image else None,
+        'title': campaign.projection_title,
+        'updated_at': campaign.projection_updated_at,
+    })
+
+
+def publish_map(campaign):
+    publish(campaign.id, EVENT_MAP, lambda: {
+        'image': campaign.map_image.url if campaign.map_image else None,
+        'updated_at': campaign.map_updated_at,
+        'version': campaign.map_version,
+    })
+
+
+def publish_map_patch(campaign_id, version, operations, updated_at):
+    """Só as operações: quem está na versão ``version - 1`` aplica e segue"""
+    publish(campaign_id, EVENT_MAP_PATCH, lambda: {
+        'version': version,
+        'operations': operations,
+        'updated_at': updated_at,
+    })
+
+
+def publish_notifications(notifications):
+    for notification in notifications:
+        publish(
+            notification.campaign_id,
+            EVENT_NOTIFICATION,
+            lambda n=notification: NotificationSerializer(n).data,
+            recipients=[notification.recipient_id],
+        )
+
+
+def publish_rolls(rolls):
+    for roll in rolls:
+        publish(
+            roll.campaign_id,
+            EVENT_ROLL,
+            lambda r=roll: DiceRollMasterSerializer(r).data,
+            masters_only=True,
+        )
+
+
+def publish_roll_requests(roll_requests):
+    for roll_request in roll_requests:
+        publish(
+            roll_request.campaign_id,
+            EVENT_ROLL_REQUEST,
+            lambda rr=roll_request: RollRequestSerializer(rr).data,
+            recipients=[roll_request.character.owner_id],
+        )
@@ -0,0 +1,180 @@
+"""
+Derivadas das imagens enviadas: miniaturas em WebP e no formato original.
+
+Depois que um upload é gravado (ver signals), a imagem é processada fora da
+requisição num pool de threads. Cada largura de VARIANT_WIDTHS vira um WebP e
+um JPEG (PNG se houver transparência), nunca maior que o original. Os nomes
+levam o hash do conteúdo, então a mesma imagem enviada duas vezes reaproveita
+os arquivos e uma URL de derivada nunca muda de conteúdo.
+"""
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import Campaign, Character, CursedTechnique, ImageDerivative, Item, Session, Stand, Zanpakuto
+from .storage import stored_file_hash
+
+logger = logging.getLogger(__name__)
+
+VARIANT_WIDTHS = (96, 320, 768)
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+CACHE_TIMEOUT = 60 * 60 * 24
+PENDING_TIMEOUT = 60
+
+IMAGE_FIELDS = {
+    Campaign: ('image', 'projection_image', 'map_image'),
+    Character: ('image',),
+    Item: ('image',),
+    Stand: ('stand_image',),
+    CursedTechnique: ('image',),
+    Zanpakuto: ('image',),
+    Session: ('map_image',),
+}
+
+_executor = None
+
+
+def _cache_key(name):
+    return f'image-variants:{hashlib.sha1(name.encode()).hexdigest()}'
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_DERIVATIVE_WORKERS, thread_name_prefix='image-derivatives',
+        )
+    return _executor
+
+
+def _fallback_format(image):
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    return 'png' if has_alpha else 'jpeg'
+
+
+def _encode(image, image_format):
+    buffer = io.BytesIO()
+    if image_format == 'webp':
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    elif image_format == 'jpeg':
+        image.convert('RGB').save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    else:
+        image.save(buffer, 'PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def generate_variants(name, force=False):
+    """Gera (ou reaproveita) as derivadas de uma imagem já gravada no storage"""
+    if not force and ImageDerivative.objects.filter(source_name=name).exists():
+        return variants_for(name)
+    try:
+        source_hash = stored_file_hash(name)
+        with default_storage.open(name, 'rb') as fh:
+            image = Image.open(fh)
+            image.load()
+    except (FileNotFoundError, UnidentifiedImageError, OSError):
+        logger.warning('Imagem %s não pôde ser processada.', name)
+        return {}
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if _fallback_format(image) == 'png' else 'RGB')
+    formats = ('webp', _fallback_format(image))
+
+    if force:
+        ImageDerivative.objects.filter(source_name=name).delete()
+    # Só codifica e grava o que ainda falta (um processamento anterior pode ter parado no meio)
+    existing = set(ImageDerivative.objects.filter(source_name=name).values_list('image_format', 'width'))
+    for width in sorted({min(width, image.width) for width in VARIANT_WIDTHS}):
+        missing = [image_format for image_format in formats if (image_format, width) not in existing]
+        if not missing:
+            continue
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        for image_format in missing:
+            content = _encode(resized, image_format)
+            extension = 'jpg' if image_format == 'jpeg' else image_format
+            # get_or_create (e não bulk_create) para os signals contarem a referência
+            ImageDerivative.objects.get_or_create(
+                source_name=name, image_format=image_format, width=width,
+                defaults={
+                    'source_hash': source_hash,
+                    'height': height,
+                    'file': default_storage.save(
+                        f'derivatives/{source_hash[:2]}/{source_hash}-{width}.{extension}', ContentFile(content),
+                    ),
+                    'size': len(content),
+                },
+            )
+    cache.delete(_cache_key(name))
+    return variants_for(name)
+
+
+def _run_task(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Falha no processamento de mídia em segundo plano (%s)', func.__name__)
+    finally:
+        close_old_connections()
+
+
+def run_in_background(func, *args):
+    """Roda ``func(*args)`` depois do commit: no pool de threads, ou inline com 0 workers"""
+    if settings.IMAGE_DERIVATIVE_WORKERS:
+        transaction.on_commit(lambda: _get_executor().submit(_run_task, func, *args))
+    else:
+        transaction.on_commit(lambda: func(*args))
+
+
+def schedule_variants(names):
+    for name in {name for name in names if name}:
+        run_in_background(generate_variants, name)
+
+
+def stored_image_names():
+    """Todos os nomes de imagem referenciados pelos modelos (sem repetir)"""
+    names = set()
+    for model, fields in IMAGE_FIELDS.items():
+        for field in fields:
+            names.update(
+                model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+                .values_list(field, flat=True).distinct()
+            )
+    return names
+
+
+def variants_for_many(names):
+    """{nome: {formato: {largura: nome do arquivo}}} com um get_many e no máximo uma query"""
+    keys = {_cache_key(name): name for name in set(names) if name}
+    found = cache.get_many(keys)
+    result = {keys[key]: variants for key, variants in found.items()}
+    missing = [name for key, name in keys.items() if key not in found]
+    if missing:
+        built = {name: {} for name in missing}
+        rows = ImageDerivative.objects.filter(source_name__in=missing).values_list(
+            'source_name', 'image_format', 'width', 'file',
+        )
+        for name, image_format, width, path in rows:
+            built[name].setdefault(image_format, {})[width] = path
+        # Ainda processando: consulta de novo em breve
+        cache.set_many({_cache_key(name): variants for name, variants in built.items() if variants}, CACHE_TIMEOUT)
+        cache.set_many({_cache_key(name): variants for name, variants in built.items() if not variants}, PENDING_TIMEOUT)
+        result.update(built)
+    return result
+
+
+def variants_for(name):
+    """{formato: {largura: nome do arquivo}}; vazio enquanto não processada"""
+    if not name:
+        return {}
+    return variants_for_many([name])[name]
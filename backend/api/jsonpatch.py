@@ -0,0 +1,190 @@
+"""
+JSON Patch (RFC 6902) para o ``map_data`` das campanhas.
+
+Mover um grupo ou apagar uma névoa vira uma lista curta de operações em vez
+do documento inteiro. ``apply_patch`` altera o documento recebido no lugar
+(o chamador descarta o objeto se alguma operação falhar) e levanta
+ValidationError com o índice da operação problemática.
+
+Os patches aplicados ficam um tempo no cache por versão: quem perdeu alguns
+eventos pede ``map/?since_version=`` e recebe só as operações que faltam.
+"""
+import copy
+
+from django.core.cache import cache
+from rest_framework.exceptions import ValidationError
+
+OPERATIONS = ('add', 'remove', 'replace', 'move', 'copy', 'test')
+MAX_OPERATIONS = 500
+HISTORY_LENGTH = 200
+HISTORY_TIMEOUT = 60 * 60
+
+
+class _PatchError(Exception):
+    pass
+
+
+def parse_pointer(pointer):
+    """JSON Pointer (RFC 6901) -> lista de chaves já sem os escapes ~0 e ~1"""
+    if not isinstance(pointer, str):
+        raise _PatchError('Ponteiro inválido.')
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise _PatchError(f'Ponteiro inválido: {pointer}')
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+
+def _array_index(container, token, *, allow_end=False):
+    if allow_end and token == '-':
+        return len(container)
+    # Sem sinal nem zeros à esquerda (RFC 6901, seção 4)
+    if not token.isdigit() or (len(token) > 1 and token[0] == '0'):
+        raise _PatchError(f'Índice inválido: {token}')
+    index = int(token)
+    limit = len(container) if allow_end else len(container) - 1
+    if index > limit:
+        raise _PatchError(f'Índice fora da lista: {token}')
+    return index
+
+
+def _resolve(document, tokens):
+    """Valor apontado por ``tokens``"""
+    value = document
+    for token in tokens:
+        if isinstance(value, dict):
+            if token not in value:
+                raise _PatchError(f'Caminho inexistente: /{"/".join(tokens)}')
+            value = value[token]
+        elif isinstance(value, list):
+            value = value[_array_index(value, token)]
+        else:
+            raise _PatchError(f'Caminho inexistente: /{"/".join(tokens)}')
+    return value
+
+
+def _parent(document, tokens):
+    """(contêiner, última chave) de um caminho que não é a raiz"""
+    container = _resolve(document, tokens[:-1])
+    if not isinstance(container, (dict, list)):
+        raise _PatchError(f'Caminho inexistente: /{"/".join(tokens)}')
+    return container, tokens[-1]
+
+
+def _json_equal(left, right):
+    # 1 == True em Python, mas não em JSON
+    if isinstance(left, bool) or isinstance(right, bool):
+        return type(left) is type(right) and left == right
+    if isinstance(left, (int, float)) and isinstance(right, (int, float)):
+        return left == right
+    if type(left) is not type(right):
+        return False
+    if isinstance(left, dict):
+        return left.keys() == right.keys() and all(_json_equal(left[key], right[key]) for key in left)
+    if isinstance(left, list):
+        return len(left) == len(right) and all(map(_json_equal, left, right))
+    return left == right
+
+
+def _add(document, tokens, value):
+    if not tokens:
+        return value
+    container, key = _parent(document, tokens)
+    if isinstance(container, list):
+        container.insert(_array_index(container, key, allow_end=True), value)
+    else:
+        container[key] = value
+    return document
+
+
+def _remove(document, tokens):
+    if not tokens:
+        raise _PatchError('Não é possível remover a raiz do mapa.')
+    container, key = _parent(document, tokens)
+    if isinstance(container, list):
+        return container.pop(_array_index(container, key))
+    if key not in container:
+        raise _PatchError(f'Caminho inexistente: /{"/".join(tokens)}')
+    return container.pop(key)
+
+
+def _apply_operation(document, operation):
+    if not isinstance(operation, dict):
+        raise _PatchError('Cada operação deve ser um objeto.')
+    op = operation.get('op')
+    if op not in OPERATIONS:
+        raise _PatchError(f'Operação desconhecida: {op}')
+    tokens = parse_pointer(operation.get('path'))
+    if op in ('add', 'replace', 'test') and 'value' not in operation:
+        raise _PatchError(f'A operação {op} exige value.')
+
+    if op == 'add':
+        return _add(document, tokens, copy.deepcopy(operation['value']))
+    if op == 'remove':
+        _remove(document, tokens)
+        return document
+    if op == 'replace':
+        if not tokens:
+            return copy.deepcopy(operation['value'])
+        container, key = _parent(document, tokens)
+        if isinstance(container, list):
+            container[_array_index(container, key)] = copy.deepcopy(operation['value'])
+        elif key not in container:
+            raise _PatchError(f'Caminho inexistente: {operation["path"]}')
+        else:
+            container[key] = copy.deepcopy(operation['value'])
+        return document
+    if op == 'test':
+        if not _json_equal(_resolve(document, tokens), operation['value']):
+            raise _PatchError(f'Teste falhou em {operation["path"]}')
+        return document
+
+    source = parse_pointer(operation.get('from'))
+    if op == 'move':
+        if tokens[:len(source)] == source and tokens != source:
+            raise _PatchError('Não é possível mover um valor para dentro dele mesmo.')
+        if tokens == source:
+            _resolve(document, source)
+            return document
+        return _add(document, tokens, _remove(document, source))
+    return _add(document, tokens, copy.deepcopy(_resolve(document, source)))
+
+
+def apply_patch(document, operations):
+    """Aplica as operações em ordem; retorna o documento resultante"""
+    if not isinstance(operations, list) or not operations:
+        raise ValidationError({'operations': 'Informe uma lista de operações.'})
+    if len(operations) > MAX_OPERATIONS:
+        raise ValidationError({'operations': f'No máximo {MAX_OPERATIONS} operações por patch.'})
+    for index, operation in enumerate(operations):
+        try:
+            document = _apply_operation(document, operation)
+        except _PatchError as exc:
+            raise ValidationError({'operations': f'Operação {index}: {exc}'})
+    return document
+
+
+# ============== HISTÓRICO ==============
+
+def _history_key(campaign_id, version):
+    return f'map-patch:{campaign_id}:{version}'
+
+
+def remember_map_patch(campaign_id, version, operations):
+    """Guarda as operações que levaram o mapa à ``version``"""
+    cache.set(_history_key(campaign_id, version), operations, HISTORY_TIMEOUT)
+
+
+def map_patches_since(campaign_id, since, current):
+    """
+    [{'version', 'operations'}] de ``since`` até ``current``, ou None se
+    alguma versão no meio não veio de um patch (ou já saiu do cache).
+    """
+    if since > current or current - since > HISTORY_LENGTH:
+        return None
+    versions = range(since + 1, current + 1)
+    keys = [_history_key(campaign_id, version) for version in versions]
+    found = cache.get_many(keys)
+    if len(found) != len(keys):
+        return None
+    return [{'version': version, 'operations': found[key]} for version, key in zip(versions, keys)]
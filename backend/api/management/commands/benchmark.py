@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from api.benchmarks import SCENARIOS, isolated_database
+
+
+class Command(BaseCommand):
+    help = 'Roda um cenário de benchmark num banco descartável e imprime o relatório em JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(SCENARIOS))
+        parser.add_argument('--rows', type=int, default=100_000, help='Linhas por tabela quente')
+        parser.add_argument('--campaigns', type=int, default=20, help='Campanhas no banco')
+        parser.add_argument('--players', type=int, default=6, help='Jogadores na mesa (table-session)')
+        parser.add_argument('--npcs', type=int, default=20, help='NPCs na mesa (table-session)')
+        parser.add_argument('--items', type=int, default=5, help='Itens por personagem (table-session)')
+        parser.add_argument('--map-kb', type=int, default=1024, help='Tamanho do map_data em KB (map-patch)')
+        parser.add_argument('--moves', type=int, default=50, help='Movimentos por minuto (map-patch)')
+        parser.add_argument('--repeat', type=int, default=20, help='Repetições por medição')
+        parser.add_argument('--seed', type=int, default=0, help='Semente das fixtures')
+        parser.add_argument('--output', help='Grava o JSON neste arquivo em vez do stdout')
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            report = SCENARIOS[options['scenario']](options)
+
+        payload = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as fh:
+                fh.write(payload + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Relatório salvo em {options['output']}"))
+        else:
+            self.stdout.write(payload)
@@ -0,0 +1,37 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.media import collect_garbage, rebuild_media_references
+
+
+class Command(BaseCommand):
+    help = 'Remove de MEDIA_ROOT os arquivos que nenhum registro referencia'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours', type=int, default=24,
+            help='Não apaga arquivos mais novos que isso (uploads em andamento)',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Só lista quanto seria removido')
+        parser.add_argument('--recount', action='store_true', help='Confere antes as contagens de referências com os modelos')
+
+    def handle(self, *args, **options):
+        if options['grace_hours'] < 0:
+            raise CommandError('--grace-hours deve ser >= 0.')
+
+        start = time.perf_counter()
+        if options['recount']:
+            repaired = rebuild_media_references()
+            self.stdout.write(f'{repaired} contagens de referências corrigidas')
+        report = collect_garbage(older_than=timedelta(hours=options['grace_hours']), dry_run=options['dry_run'])
+        elapsed = time.perf_counter() - start
+
+        verb = 'seriam removidos' if options['dry_run'] else 'removidos'
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['deleted']} de {report['scanned']} arquivos {verb} "
+            f"({report['freed_bytes'] / (1024 * 1024):.1f} MB; {report['derivatives']} derivadas e "
+            f"{report['tilesets']} mapas fatiados sem imagem) "
+            f"em {elapsed:.2f}s"
+        ))
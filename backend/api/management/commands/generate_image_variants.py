@@ -0,0 +1,38 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from api.images import generate_variants, stored_image_names
+
+
+class Command(BaseCommand):
+    help = 'Gera as miniaturas/WebP das imagens já enviadas que ainda não têm derivadas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=max(1, settings.IMAGE_DERIVATIVE_WORKERS),
+            help='Imagens processadas em paralelo',
+        )
+        parser.add_argument('--force', action='store_true', help='Refaz também as que já têm derivadas')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers deve ser >= 1.')
+
+        def process(name):
+            try:
+                return bool(generate_variants(name, force=options['force']))
+            finally:
+                close_old_connections()
+
+        names = sorted(stored_image_names())
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            processed = sum(executor.map(process, names))
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'{processed} de {len(names)} imagens com derivadas em {elapsed:.2f}s'
+        ))
@@ -0,0 +1,46 @@
+import contextlib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.notifications import prune_notifications
+
+
+class Command(BaseCommand):
+    help = 'Apaga notificações lidas antigas em lotes, resumindo as de rolagem'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 30),
+            help='Idade mínima (em dias) das notificações lidas removidas',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Linhas apagadas por DELETE')
+        parser.add_argument('--archive', help='Anexa as linhas removidas (JSON por linha) neste arquivo')
+        parser.add_argument('--no-digest', action='store_true', help='Não resume as notificações de rolagem')
+
+    def handle(self, *args, **options):
+        if options['days'] < 0 or options['batch_size'] < 1:
+            raise CommandError('--days deve ser >= 0 e --batch-size >= 1.')
+
+        before = timezone.now() - timedelta(days=options['days'])
+        start = time.perf_counter()
+        with contextlib.ExitStack() as stack:
+            archive = None
+            if options['archive']:
+                archive = stack.enter_context(open(options['archive'], 'a', encoding='utf-8'))
+            report = prune_notifications(
+                before=before,
+                batch_size=options['batch_size'],
+                digest=not options['no_digest'],
+                archive=archive,
+            )
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['deleted']} notificações removidas "
+            f"({report['digested']} de rolagem em {report['digests_created']} resumos) "
+            f"em {elapsed:.2f}s"
+        ))
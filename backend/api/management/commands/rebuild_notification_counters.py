@@ -0,0 +1,15 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.notifications import rebuild_unread_counters
+
+
+class Command(BaseCommand):
+    help = 'Recalcula do zero os contadores de notificações não lidas'
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        total = rebuild_unread_counters()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f'{total} contadores recalculados em {elapsed:.2f}s'))
@@ -0,0 +1,183 @@
+"""
+Referências aos arquivos de mídia.
+
+Com o storage endereçado por conteúdo (api/storage.py) um mesmo arquivo pode
+ser usado por vários registros: o item dividido numa transferência, o mapa
+salvo na sessão e carregado de volta, a mesma arte enviada de novo. MediaBlob
+conta quantos registros apontam para cada nome e os signals mantêm a conta.
+Quando ela chega a zero o arquivo é apagado depois do commit;
+``collect_garbage`` recolhe o que ficou para trás e ``rebuild_media_references``
+confere as contagens com os modelos.
+"""
+import os
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .images import IMAGE_FIELDS
+from .models import ImageDerivative, MapTileSet, MediaBlob
+from .tiles import TILES_PREFIX
+
+MEDIA_FIELDS = {
+    **IMAGE_FIELDS,
+    ImageDerivative: ('file',),
+}
+# Arquivo reaproveitado há pouco (o storage renova o mtime) pode estar num
+# upload que ainda não salvou o registro: fica para o collect_garbage
+RELEASE_GRACE = timedelta(minutes=10)
+
+
+def _grouped_by_amount(names):
+    grouped = defaultdict(list)
+    for name, amount in Counter(name for name in names if name).items():
+        grouped[amount].append(name)
+    return grouped
+
+
+def add_references(names):
+    """Soma uma referência para cada nome (repetidos contam várias vezes)"""
+    grouped = _grouped_by_amount(names)
+    if not grouped:
+        return
+    MediaBlob.objects.bulk_create(
+        [MediaBlob(name=name) for batch in grouped.values() for name in batch],
+        ignore_conflicts=True,
+    )
+    for amount, batch in grouped.items():
+        MediaBlob.objects.filter(name__in=batch).update(ref_count=models.F('ref_count') + amount)
+
+
+def remove_references(names):
+    """Desconta as referências; o que chegar a zero é apagado depois do commit"""
+    grouped = _grouped_by_amount(names)
+    for amount, batch in grouped.items():
+        MediaBlob.objects.filter(name__in=batch).update(ref_count=Greatest(models.F('ref_count') - amount, 0))
+    released = [name for batch in grouped.values() for name in batch]
+    if released:
+        transaction.on_commit(lambda: release_blobs(released))
+
+
+def release_blobs(names, *, cutoff=None, dry_run=False):
+    """
+    Apaga os arquivos de ``names`` que estão com zero referências e não
+    foram modificados depois de ``cutoff``. Retorna ``(nomes, bytes)``.
+    """
+    cutoff = cutoff or timezone.now() - RELEASE_GRACE
+    released, freed = [], 0
+    for name in MediaBlob.objects.filter(name__in=list(names), ref_count=0).values_list('name', flat=True):
+        exists = default_storage.exists(name)
+        if exists and default_storage.get_modified_time(name) >= cutoff:
+            continue
+        size = default_storage.size(name) if exists else 0
+        if not dry_run:
+            # Só apaga o arquivo se ninguém voltou a referenciá-lo nesse meio-tempo
+            if not MediaBlob.objects.filter(name=name, ref_count=0).delete()[0]:
+                continue
+            if exists:
+                default_storage.delete(name)
+        released.append(name)
+        freed += size
+    return released, freed
+
+
+def referenced_names(media_fields=MEDIA_FIELDS):
+    """{nome: referências} lido direto dos modelos (a fonte da verdade)"""
+    references = Counter()
+    for model, fields in media_fields.items():
+        for field in fields:
+            references.update(name for name in model.objects.values_list(field, flat=True) if name)
+    return references
+
+
+def rebuild_media_references():
+    """Confere as contagens com os modelos e corrige as erradas; retorna quantas mudaram"""
+    references = referenced_names()
+    with transaction.atomic():
+        stored = dict(MediaBlob.objects.values_list('name', 'ref_count'))
+        wrong = {name: count for name, count in references.items() if stored.get(name) != count}
+        wrong.update({name: 0 for name, count in stored.items() if count and name not in references})
+        MediaBlob.objects.bulk_create([MediaBlob(name=name) for name in wrong if name not in stored])
+        by_count = defaultdict(list)
+        for name, count in wrong.items():
+            by_count[count].append(name)
+        for count, batch in by_count.items():
+            MediaBlob.objects.filter(name__in=batch).update(ref_count=count)
+    return len(wrong)
+
+
+def _stored_files(path=''):
+    directories, files = default_storage.listdir(path)
+    for filename in files:
+        yield f'{path}/{filename}' if path else filename
+    for directory in directories:
+        yield from _stored_files(f'{path}/{directory}' if path else directory)
+
+
+def collect_garbage(*, older_than, dry_run=False):
+    """
+    Remove de MEDIA_ROOT o que ficou sem referência: os MediaBlob com contagem
+    zero e arquivos que nem têm MediaBlob (anteriores à contagem, temporários
+    de uma gravação interrompida).
+
+    ``older_than`` protege uploads recentes cuja transação ainda não terminou.
+    Retorna ``{'scanned', 'deleted', 'freed_bytes', 'derivatives', 'tilesets'}``.
+    """
+    cutoff = timezone.now() - older_than
+    report = {'scanned': 0, 'deleted': 0, 'freed_bytes': 0, 'derivatives': 0, 'tilesets': 0}
+    live_sources = MediaBlob.objects.filter(ref_count__gt=0).values('name')
+
+    # Derivadas e pirâmides de tiles de imagens que nenhum registro usa mais saem junto
+    # (apagar a derivada desconta a referência ao arquivo dela)
+    stale = ImageDerivative.objects.exclude(source_name__in=live_sources).filter(created_at__lt=cutoff)
+    report['derivatives'] = stale.count()
+    stale_tilesets = MapTileSet.objects.exclude(source_name__in=live_sources).filter(created_at__lt=cutoff)
+    report['tilesets'] = stale_tilesets.count()
+    live_tiles = {
+        f'{TILES_PREFIX}/{source_hash}'
+        for source_hash in MapTileSet.objects.exclude(pk__in=list(stale_tilesets.values_list('pk', flat=True)))
+        .values_list('source_hash', flat=True)
+    }
+    if not dry_run:
+        with transaction.atomic():
+            stale.delete()
+            stale_tilesets.delete()
+
+    released, freed = release_blobs(
+        MediaBlob.objects.filter(ref_count=0).values_list('name', flat=True), cutoff=cutoff, dry_run=dry_run,
+    )
+    report['deleted'] += len(released)
+    report['freed_bytes'] += freed
+
+    if not os.path.isdir(default_storage.location):
+        return report
+    tracked = set(MediaBlob.objects.values_list('name', flat=True))
+    orphans = []
+    for name in _stored_files():
+        report['scanned'] += 1
+        if name in tracked or name.rsplit('/', 3)[0] in live_tiles:
+            continue
+        if default_storage.get_modified_time(name) >= cutoff:
+            continue
+        report['deleted'] += 1
+        report['freed_bytes'] += default_storage.size(name)
+        orphans.append(name)
+
+    if not dry_run:
+        for name in orphans:
+            default_storage.delete(name)
+        _remove_empty_directories(default_storage.location)
+    return report
+
+
+def _remove_empty_directories(root):
+    for directory, _, _ in os.walk(root, topdown=False):
+        if directory != root and not os.listdir(directory):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+
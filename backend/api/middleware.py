@@ -0,0 +1,29 @@
+from asgiref.sync import iscoroutinefunction
+from django.utils.decorators import sync_and_async_middleware
+
+from .permissions import begin_authorization_scope, end_authorization_scope
+
+
+@sync_and_async_middleware
+def authorization_context_middleware(get_response):
+    """
+    Abre um escopo de autorização por requisição.
+
+    Mestre/banimentos consultados durante a requisição ficam memorizados até
+    a resposta ser montada e nunca passam para a próxima requisição.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = begin_authorization_scope()
+            try:
+                return await get_response(request)
+            finally:
+                end_authorization_scope(token)
+    else:
+        def middleware(request):
+            token = begin_authorization_scope()
+            try:
+                return get_response(request)
+            finally:
+                end_authorization_scope(token)
+    return middleware
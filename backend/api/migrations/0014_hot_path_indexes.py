@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_bleach_kidou'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='character',
+            index=models.Index(fields=['campaign', 'owner', 'is_npc'], name='character_roster_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='diceroll',
+            index=models.Index(fields=['campaign', 'created_at'], name='diceroll_campaign_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='diceroll',
+            index=models.Index(condition=models.Q(('seen_by_master', False)), fields=['campaign'], name='diceroll_unseen_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'campaign', 'created_at'], name='notification_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['recipient', 'campaign', 'created_at'], name='notification_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rollrequest',
+            index=models.Index(condition=models.Q(('is_open', True)), fields=['campaign', 'character'], name='rollrequest_open_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rollrequest',
+            name='group_id',
+            field=models.UUIDField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_rollrequest_group_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['campaign', 'created_at'], name='message_campaign_created_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_message_history_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='notification_type',
+            field=models.CharField(choices=[('trade', 'Troca de Item'), ('roll', 'Rolagem de Dados'), ('fate', 'Uso de Fate Point'), ('system', 'Sistema'), ('message', 'Mensagem'), ('digest', 'Resumo')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def count_unread_notifications(apps, schema_editor):
+    Notification = apps.get_model('api', 'Notification')
+    NotificationCounter = apps.get_model('api', 'NotificationCounter')
+    NotificationCounter.objects.bulk_create(
+        (
+            NotificationCounter(user_id=row['recipient_id'], campaign_id=row['campaign_id'], unread=row['total'])
+            for row in Notification.objects.filter(is_read=False).order_by()
+            .values('recipient_id', 'campaign_id').annotate(total=models.Count('id'))
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_notification_digest_type'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread', models.PositiveIntegerField(default=0)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_counters', to='api.campaign')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'campaign')},
+            },
+        ),
+        migrations.RunPython(count_unread_notifications, migrations.RunPython.noop),
+    ]
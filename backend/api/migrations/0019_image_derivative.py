@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_notification_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageDerivative',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_name', models.CharField(db_index=True, max_length=255)),
+                ('source_hash', models.CharField(db_index=True, max_length=64)),
+                ('image_format', models.CharField(choices=[('webp', 'WebP'), ('jpeg', 'JPEG'), ('png', 'PNG')], max_length=10)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('file', models.FileField(max_length=255, upload_to='derivatives/')),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('source_name', 'image_format', 'width')},
+            },
+        ),
+    ]
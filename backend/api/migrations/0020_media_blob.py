@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:27
+
+from collections import Counter
+
+from django.db import migrations, models
+
+MEDIA_FIELDS = {
+    'Campaign': ('image', 'projection_image', 'map_image'),
+    'Character': ('image',),
+    'Item': ('image',),
+    'Stand': ('stand_image',),
+    'CursedTechnique': ('image',),
+    'Zanpakuto': ('image',),
+    'Session': ('map_image',),
+    'ImageDerivative': ('file',),
+}
+
+
+def count_existing_references(apps, schema_editor):
+    MediaBlob = apps.get_model('api', 'MediaBlob')
+    references = Counter()
+    for model_name, fields in MEDIA_FIELDS.items():
+        model = apps.get_model('api', model_name)
+        for field in fields:
+            references.update(name for name in model.objects.values_list(field, flat=True) if name)
+    MediaBlob.objects.bulk_create(
+        (MediaBlob(name=name, ref_count=count) for name, count in references.items()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_image_derivative'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(count_existing_references, migrations.RunPython.noop),
+    ]
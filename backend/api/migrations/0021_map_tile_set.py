@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_media_blob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MapTileSet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_name', models.CharField(max_length=255, unique=True)),
+                ('source_hash', models.CharField(db_index=True, max_length=64)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('tile_size', models.PositiveIntegerField(default=256)),
+                ('max_zoom', models.PositiveSmallIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
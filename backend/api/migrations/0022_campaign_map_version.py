@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_map_tile_set'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='map_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
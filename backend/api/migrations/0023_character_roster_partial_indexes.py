@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_campaign_map_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='character',
+            name='character_roster_idx',
+        ),
+        migrations.AddIndex(
+            model_name='character',
+            index=models.Index(condition=models.Q(('is_npc', False)), fields=['campaign', 'name'], name='character_party_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='character',
+            index=models.Index(condition=models.Q(('is_npc', True)), fields=['campaign', 'name'], name='character_npcs_idx'),
+        ),
+    ]
@@ -39,6 +39,8 @@ class Campaign(models.Model):
     map_image = models.ImageField(upload_to='campaign_maps/', blank=True, null=True)
     map_data = models.JSONField(default=dict, blank=True)
     map_updated_at = models.DateTimeField(auto_now=True)
+    # Sobe a cada alteração do map_data; o patch incremental exige a versão atual
+    map_version = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.name
@@ -198,6 +200,14 @@ class Character(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='characters')
     campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='characters')
 
+    class Meta:
+        indexes = [
+            # Parciais: no SQLite is_npc=False vira ``NOT is_npc``, que não serve de prefixo
+            # de índice; assim party e npcs saem na ordem do nome, sem ordenar na hora
+            models.Index(fields=['campaign', 'name'], condition=models.Q(is_npc=False), name='character_party_idx'),
+            models.Index(fields=['campaign', 'name'], condition=models.Q(is_npc=True), name='character_npcs_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({'NPC' if self.is_npc else 'Jogador'})"
 
@@ -475,6 +485,16 @@ class DiceRoll(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     seen_by_master = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['campaign', 'created_at'], name='diceroll_campaign_created_idx'),
+            models.Index(
+                fields=['campaign'],
+                condition=models.Q(seen_by_master=False),
+                name='diceroll_unseen_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"Rolagem de {self.character.name}: {self.final_total}"
 
@@ -503,6 +523,17 @@ class RollRequest(models.Model):
         blank=True,
         related_name='roll_request',
     )
+    # Solicitações enviadas juntas (request_roll_group) compartilham o grupo
+    group_id = models.UUIDField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['campaign', 'character'],
+                condition=models.Q(is_open=True),
+                name='rollrequest_open_idx',
+            ),
+        ]
 
     def __str__(self):
         status = 'aberta' if self.is_open else 'concluída'
@@ -517,6 +548,7 @@ class Notification(models.Model):
         ('fate', 'Uso de Fate Point'),
         ('system', 'Sistema'),
         ('message', 'Mensagem'),
+        ('digest', 'Resumo'),
     ]
 
     campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='notifications')
@@ -534,11 +566,34 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['recipient', 'campaign', 'created_at'], name='notification_feed_idx'),
+            # Parcial: o SQLite compila is_read=False como NOT is_read, que não
+            # casa com uma coluna booleana no meio de um índice comum
+            models.Index(
+                fields=['recipient', 'campaign', 'created_at'],
+                condition=models.Q(is_read=False),
+                name='notification_unread_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.title} para {self.recipient.username}"
 
 
+class NotificationCounter(models.Model):
+    """Não lidas por usuário e campanha, mantido pelo fan-out (api/notifications.py)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notification_counters')
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='notification_counters')
+    unread = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'campaign')
+
+    def __str__(self):
+        return f"{self.user.username} em {self.campaign.name}: {self.unread}"
+
+
 class Message(models.Model):
     """Mensagens secretas entre mestre e jogadores"""
     campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='messages')
@@ -549,6 +604,9 @@ class Message(models.Model):
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['campaign', 'created_at'], name='message_campaign_created_idx'),
+        ]
 
     def __str__(self):
         return f"Mensagem de {self.sender.username} para {self.recipient.username}"
@@ -577,3 +635,51 @@ class Session(models.Model):
 
     def __str__(self):
         return f"Sessão de {self.campaign.name} em {self.date}"
+
+
+class ImageDerivative(models.Model):
+    """Miniatura/WebP gerada a partir de uma imagem enviada (ver api/images.py)"""
+    FORMATS = [
+        ('webp', 'WebP'),
+        ('jpeg', 'JPEG'),
+        ('png', 'PNG'),
+    ]
+
+    source_name = models.CharField(max_length=255, db_index=True)
+    source_hash = models.CharField(max_length=64, db_index=True)
+    image_format = models.CharField(max_length=10, choices=FORMATS)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    file = models.FileField(upload_to='derivatives/', max_length=255)
+    size = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('source_name', 'image_format', 'width')
+
+    def __str__(self):
+        return f"{self.source_name} ({self.image_format} {self.width}px)"
+
+
+class MediaBlob(models.Model):
+    """Arquivo em MEDIA_ROOT e quantos registros apontam para ele (ver api/media.py)"""
+    name = models.CharField(max_length=255, unique=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count})"
+
+
+class MapTileSet(models.Model):
+    """Pirâmide de tiles de uma imagem de mapa (ver api/tiles.py)"""
+    source_name = models.CharField(max_length=255, unique=True)
+    source_hash = models.CharField(max_length=64, db_index=True)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    tile_size = models.PositiveIntegerField(default=256)
+    max_zoom = models.PositiveSmallIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.source_name} ({self.width}x{self.height}, zoom 0-{self.max_zoom})"
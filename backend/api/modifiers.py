@@ -0,0 +1,87 @@
+"""
+Tabela de modificadores por personagem.
+
+Para cada atributo: valor do atributo + traços de personalidade que usam o
+atributo + itens equipados com bônus nele. Para cada skill do personagem:
+o bônus da skill + o total do atributo que ela usa. A tabela fica no cache
+e é invalidada pelos signals quando algo que entra na conta muda.
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Character, Item
+
+STAT_FIELDS = ('forca', 'destreza', 'vigor', 'inteligencia', 'sabedoria', 'carisma')
+CACHE_TIMEOUT = 60 * 60
+
+
+def _cache_key(character_id):
+    return f'character-modifiers:{character_id}'
+
+
+def _build_tables(characters):
+    ids = [character.id for character in characters]
+    stats = {
+        character.id: {stat: getattr(character, stat) for stat in STAT_FIELDS}
+        for character in characters
+    }
+
+    traits = Character.personality_traits.through.objects.filter(character_id__in=ids).values_list(
+        'character_id', 'personalitytrait__use_status', 'personalitytrait__bonus',
+    )
+    items = Item.objects.filter(owner_character_id__in=ids, is_equipped=True).values_list(
+        'owner_character_id', 'bonus_status', 'bonus_value',
+    )
+    for character_id, use_status, bonus in [*traits, *items]:
+        use_status = (use_status or '').lower()
+        if use_status in STAT_FIELDS:
+            stats[character_id][use_status] += bonus or 0
+
+    tables = {character_id: {'stats': totals, 'skills': {}} for character_id, totals in stats.items()}
+    skills = Character.skills.through.objects.filter(character_id__in=ids).values_list(
+        'character_id', 'skill_id', 'skill__use_status', 'skill__bonus',
+    )
+    for character_id, skill_id, use_status, bonus in skills:
+        table = tables[character_id]
+        table['skills'][skill_id] = bonus + table['stats'].get(use_status.lower(), 0)
+    return tables
+
+
+def modifier_tables(characters):
+    """Tabelas de vários personagens: uma leitura do cache e, se faltar, 3 queries"""
+    characters = {character.id: character for character in characters}
+    cached = cache.get_many([_cache_key(character_id) for character_id in characters])
+    tables = {
+        character_id: cached[_cache_key(character_id)]
+        for character_id in characters
+        if _cache_key(character_id) in cached
+    }
+    missing = [character for character_id, character in characters.items() if character_id not in tables]
+    if missing:
+        built = _build_tables(missing)
+        cache.set_many({_cache_key(character_id): table for character_id, table in built.items()}, CACHE_TIMEOUT)
+        tables.update(built)
+    return tables
+
+
+def modifier_table(character):
+    return modifier_tables([character])[character.id]
+
+
+def hidden_bonus(table, skill):
+    """Bônus oculto de uma rolagem com a skill (0 sem skill)"""
+    if skill is None:
+        return 0
+    bonus = table['skills'].get(skill.id)
+    if bonus is None:
+        # Skill que o personagem não tem na ficha
+        bonus = skill.bonus + table['stats'].get(skill.use_status.lower(), 0)
+    return bonus
+
+
+def invalidate_modifiers(character_ids):
+    keys = [_cache_key(character_id) for character_id in character_ids if character_id]
+    if keys:
+        cache.delete_many(keys)
+        # De novo no commit: quem leu antes disso pode ter recolocado a tabela antiga
+        transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,207 @@
+"""
+Fan-out de notificações.
+
+Todas as views criam notificações por aqui: as linhas de todos os
+destinatários são montadas em memória e gravadas com um único INSERT.
+Os contadores de não lidas (NotificationCounter) são mantidos aqui, e aqui
+também fica a retenção (``prune_notifications``), que apaga as lidas
+antigas e resume as rolagens.
+"""
+import json
+from collections import Counter, defaultdict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models.functions import Greatest, TruncDate
+
+from .events import publish_notifications
+from .models import Notification, NotificationCounter, Session
+
+
+def build_notification(campaign, recipient, notification_type, title, message, **related):
+    """Monta (sem salvar) uma notificação; recipient pode ser User ou id"""
+    return Notification(
+        campaign=campaign,
+        recipient_id=getattr(recipient, 'pk', recipient),
+        notification_type=notification_type,
+        title=title,
+        message=message,
+        **related,
+    )
+
+
+def send_notifications(notifications):
+    """Grava as notificações em lote e publica no canal de eventos"""
+    notifications = list(notifications)
+    if not notifications:
+        return []
+    with transaction.atomic():
+        created = Notification.objects.bulk_create(notifications)
+        add_unread(Counter(
+            (notification.recipient_id, notification.campaign_id)
+            for notification in created
+            if not notification.is_read
+        ))
+        publish_notifications(created)
+    return created
+
+
+def notify(campaign, recipients, notification_type, title, message, **related):
+    """Mesma notificação para vários destinatários"""
+    return send_notifications(
+        build_notification(campaign, recipient, notification_type, title, message, **related)
+        for recipient in recipients
+    )
+
+
+# ============== CONTADORES ==============
+
+def add_unread(amounts):
+    """Soma nos contadores; ``amounts`` = {(user_id, campaign_id): n}"""
+    if not amounts:
+        return
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(user_id=user_id, campaign_id=campaign_id) for user_id, campaign_id in amounts],
+        ignore_conflicts=True,
+    )
+    # No fan-out todos recebem o mesmo tanto: um UPDATE por (campanha, n)
+    grouped = defaultdict(list)
+    for (user_id, campaign_id), amount in amounts.items():
+        grouped[campaign_id, amount].append(user_id)
+    for (campaign_id, amount), user_ids in grouped.items():
+        NotificationCounter.objects.filter(campaign_id=campaign_id, user_id__in=user_ids).update(
+            unread=models.F('unread') + amount,
+        )
+
+
+def remove_unread(user_id, campaign_id, amount):
+    if amount:
+        NotificationCounter.objects.filter(user_id=user_id, campaign_id=campaign_id).update(
+            unread=Greatest(models.F('unread') - amount, 0),
+        )
+
+
+def mark_notifications_read(queryset):
+    """Marca como lidas e desconta dos contadores; retorna quantas mudaram"""
+    queryset = queryset.filter(is_read=False)
+    marked = 0
+    with transaction.atomic():
+        pairs = queryset.order_by().values_list('recipient_id', 'campaign_id').distinct()
+        for user_id, campaign_id in list(pairs):
+            amount = queryset.filter(recipient_id=user_id, campaign_id=campaign_id).update(is_read=True)
+            remove_unread(user_id, campaign_id, amount)
+            marked += amount
+    return marked
+
+
+def get_unread_count(user, campaign_id=None):
+    counters = NotificationCounter.objects.filter(user=user)
+    if campaign_id is not None:
+        return counters.filter(campaign_id=campaign_id).values_list('unread', flat=True).first() or 0
+    return counters.aggregate(total=models.Sum('unread'))['total'] or 0
+
+
+def rebuild_unread_counters():
+    """Recalcula todos os contadores a partir das notificações; retorna quantos ficaram"""
+    with transaction.atomic():
+        NotificationCounter.objects.all().delete()
+        counters = NotificationCounter.objects.bulk_create(
+            (
+                NotificationCounter(user_id=row['recipient_id'], campaign_id=row['campaign_id'], unread=row['total'])
+                for row in Notification.objects.filter(is_read=False).order_by()
+                .values('recipient_id', 'campaign_id').annotate(total=models.Count('id'))
+            ),
+            batch_size=1000,
+        )
+    return len(counters)
+
+
+# ============== RETENÇÃO ==============
+
+ARCHIVE_FIELDS = (
+    'id', 'campaign_id', 'recipient_id', 'notification_type', 'title', 'message',
+    'is_read', 'created_at', 'related_character_id', 'related_item_id', 'related_roll_id',
+)
+
+
+def _delete_in_batches(queryset, batch_size, archive=None):
+    """Apaga em lotes de ``batch_size`` (gravando cada linha no arquivo, se houver)"""
+    deleted = 0
+    while True:
+        rows = list(queryset.order_by('pk').values(*ARCHIVE_FIELDS)[:batch_size])
+        if not rows:
+            return deleted
+        if archive is not None:
+            for row in rows:
+                archive.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n')
+        Notification.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+        deleted += len(rows)
+
+
+def _digest_rolls(rolls, batch_size, archive):
+    """Troca as notificações de rolagem por um resumo por destinatário/campanha/dia de sessão"""
+    groups = list(
+        rolls.annotate(day=TruncDate('created_at'))
+        .values('recipient_id', 'campaign_id', 'day')
+        .annotate(count=models.Count('id'), last_at=models.Max('created_at'))
+        .order_by('campaign_id', 'day', 'recipient_id')
+    )
+    sessions = {
+        (session.campaign_id, session.date): session
+        for session in Session.objects.filter(
+            campaign_id__in={group['campaign_id'] for group in groups},
+            date__in={group['day'] for group in groups},
+        )
+    }
+
+    digests = digested = 0
+    for group in groups:
+        day = group['day'].strftime('%d/%m/%Y')
+        title = f'Sessão de {day}' if (group['campaign_id'], group['day']) in sessions else f'Rolagens de {day}'
+        with transaction.atomic():
+            digest = Notification.objects.create(
+                campaign_id=group['campaign_id'],
+                recipient_id=group['recipient_id'],
+                notification_type='digest',
+                title=title,
+                message=(
+                    '1 notificação de rolagem resumida.' if group['count'] == 1
+                    else f'{group["count"]} notificações de rolagem resumidas.'
+                ),
+                is_read=True,
+            )
+            # auto_now_add ignora o valor passado: mantém o resumo na posição original
+            Notification.objects.filter(pk=digest.pk).update(created_at=group['last_at'])
+            digested += _delete_in_batches(
+                rolls.filter(
+                    recipient_id=group['recipient_id'],
+                    campaign_id=group['campaign_id'],
+                    created_at__date=group['day'],
+                ),
+                batch_size,
+                archive,
+            )
+        digests += 1
+    return digests, digested
+
+
+def prune_notifications(*, before, batch_size=1000, digest=True, archive=None):
+    """
+    Remove as notificações lidas criadas antes de ``before``.
+
+    Com ``digest``, as de rolagem viram antes um resumo (que não é apagado
+    depois). ``archive`` é um arquivo aberto que recebe cada linha removida
+    em JSON. Retorna as contagens.
+    """
+    old_read = Notification.objects.filter(is_read=True, created_at__lt=before).exclude(
+        notification_type='digest',
+    )
+    digests = digested = 0
+    if digest:
+        digests, digested = _digest_rolls(old_read.filter(notification_type='roll'), batch_size, archive)
+    deleted = _delete_in_batches(old_read, batch_size, archive)
+    return {
+        'digests_created': digests,
+        'digested': digested,
+        'deleted': digested + deleted,
+    }
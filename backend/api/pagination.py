@@ -0,0 +1,116 @@
+"""
+Paginação por cursor (keyset) dos históricos.
+
+A página seguinte é buscada por ``(created_at, id) < último visto`` em vez de
+OFFSET, então o custo de cada página não cresce com a idade da campanha.
+"""
+import base64
+import json
+
+from django.db import models
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Do mais novo para o mais antigo, ordenado por ``(created_at, id)``.
+
+    É opt-in: só pagina quando a requisição traz ``cursor`` ou ``page_size``;
+    sem eles a listagem continua como antes (ver HistoryPaginationMixin).
+    """
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Cursor inválido.'
+
+    def is_requested(self, request):
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw_created_at, pk = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            created_at = parse_datetime(raw_created_at)
+            pk = int(pk)
+        except (TypeError, ValueError):
+            raise ValidationError(self.invalid_cursor_message)
+        if created_at is None:
+            raise ValidationError(self.invalid_cursor_message)
+        return created_at, pk
+
+    def encode_cursor(self, instance):
+        raw = json.dumps([instance.created_at.isoformat(), instance.pk])
+        return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by('-created_at', '-pk')
+        position = self.decode_cursor(request)
+        if position is not None:
+            created_at, pk = position
+            queryset = queryset.filter(
+                models.Q(created_at__lt=created_at) | models.Q(created_at=created_at, pk__lt=pk)
+            )
+
+        rows = list(queryset[:page_size + 1])
+        page = rows[:page_size]
+        self.next_cursor = self.encode_cursor(page[-1]) if len(rows) > page_size else None
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'cursor': self.next_cursor,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'cursor': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class HistoryPaginationMixin:
+    """
+    Para ViewSets de histórico: paginação por cursor sob demanda e, sem ela,
+    no máximo ``history_limit`` itens na listagem (como a API sempre fez).
+    """
+    pagination_class = KeysetPagination
+    history_limit = None
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'list' and self.history_limit and not self.paginator.is_requested(self.request):
+            queryset = queryset[:self.history_limit]
+        return queryset
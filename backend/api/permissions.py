@@ -1,6 +1,70 @@
+from contextvars import ContextVar
+
+from django.utils.functional import cached_property
 from rest_framework.permissions import BasePermission
 
-from .models import Campaign, Profile
+from .models import Campaign, CampaignBan, Profile
+
+# Contextos por usuário da requisição atual (ver api.middleware)
+_request_contexts = ContextVar('authorization_contexts', default=None)
+
+
+class AuthorizationContext:
+    """
+    Flag de mestre e banimentos ativos de um usuário, resolvidos uma vez.
+
+    Dentro de uma requisição o contexto é compartilhado por todos os helpers
+    de permissão; fora dela (shell, commands) cada chamada cria um novo.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def is_game_master(self):
+        user = self.user
+        if not user or not user.is_authenticated:
+            return False
+        if user.is_staff or user.is_superuser:
+            return True
+        try:
+            profile = user.profile
+        except Profile.DoesNotExist:
+            return False
+        return bool(profile.is_game_master)
+
+    @cached_property
+    def banned_campaign_ids(self):
+        if not self.user or not self.user.is_authenticated:
+            return frozenset()
+        return frozenset(
+            CampaignBan.objects.filter(user=self.user, is_active=True).values_list('campaign_id', flat=True)
+        )
+
+    def is_campaign_master(self, campaign):
+        return campaign.owner_id == self.user.id or self.is_game_master
+
+    def is_banned_from(self, campaign):
+        return getattr(campaign, 'pk', campaign) in self.banned_campaign_ids
+
+
+def get_authorization_context(user):
+    contexts = _request_contexts.get()
+    if contexts is None:
+        return AuthorizationContext(user)
+    key = getattr(user, 'pk', None)
+    context = contexts.get(key)
+    if context is None:
+        context = contexts[key] = AuthorizationContext(user)
+    return context
+
+
+def begin_authorization_scope():
+    return _request_contexts.set({})
+
+
+def end_authorization_scope(token):
+    _request_contexts.reset(token)
 
 
 def _get_campaign(obj):
@@ -28,15 +92,7 @@ def _get_owner_id(obj):
 
 
 def _user_is_game_master(user):
-    if not user or not user.is_authenticated:
-        return False
-    if user.is_staff or user.is_superuser:
-        return True
-    try:
-        profile = user.profile
-    except Profile.DoesNotExist:
-        return False
-    return bool(profile.is_game_master)
+    return get_authorization_context(user).is_game_master
 
 
 class IsGameMaster(BasePermission):
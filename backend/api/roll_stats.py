@@ -0,0 +1,165 @@
+"""
+Estatísticas de rolagens da campanha.
+
+Médias, distribuição e uso de skills/fate points saem de agregações no banco
+(GROUP BY); só as sequências (streaks) percorrem os totais em ordem. O
+resultado fica no cache até a próxima rolagem gravada na campanha.
+"""
+import uuid
+
+from django.core.cache import cache
+from django.db import models, transaction
+
+from .dice import DICE_PER_ROLL, FATE_FACES, fate_distribution
+from .models import DiceRoll
+
+CACHE_TIMEOUT = 60 * 60
+
+
+def _version_key(campaign_id):
+    return f'roll-stats-version:{campaign_id}'
+
+
+def _stats_version(campaign_id):
+    version = cache.get(_version_key(campaign_id))
+    if version is None:
+        cache.add(_version_key(campaign_id), uuid.uuid4().hex, None)
+        version = cache.get(_version_key(campaign_id))
+    return version
+
+
+def invalidate_roll_stats(campaign_ids):
+    """Chamado a cada rolagem gravada ou apagada"""
+    keys = {_version_key(campaign_id) for campaign_id in campaign_ids}
+    if not keys:
+        return
+
+    def bump():
+        cache.set_many({key: uuid.uuid4().hex for key in keys}, None)
+
+    bump()
+    # De novo no commit: estatísticas lidas antes dele ficam na versão descartada
+    transaction.on_commit(bump)
+
+
+def _mean(value):
+    return None if value is None else round(value, 2)
+
+
+def probability_table():
+    """Tabela exata de 4dF: chance de cada total e de tirar pelo menos ele"""
+    distribution = fate_distribution()
+    outcomes = len(FATE_FACES) ** DICE_PER_ROLL
+    table = []
+    remaining = 1
+    for total, probability in distribution.items():
+        table.append({
+            'total': total,
+            'ways': int(probability * outcomes),
+            'probability': round(float(probability), 4),
+            'at_least': round(float(remaining), 4),
+        })
+        remaining -= probability
+    return table
+
+
+def _streaks(rolls):
+    """Maior sequência de totais positivos/negativos e a sequência atual"""
+    streaks = {}
+    for character_id, final_total in rolls.order_by('character_id', 'created_at', 'id').values_list(
+        'character_id', 'final_total',
+    ).iterator():
+        entry = streaks.setdefault(character_id, {'longest_hot': 0, 'longest_cold': 0, 'current': 0})
+        sign = (final_total > 0) - (final_total < 0)
+        current = entry['current']
+        if sign == 0:
+            current = 0
+        elif current * sign > 0:
+            current += sign
+        else:
+            current = sign
+        entry['current'] = current
+        entry['longest_hot'] = max(entry['longest_hot'], current)
+        entry['longest_cold'] = max(entry['longest_cold'], -current)
+    return streaks
+
+
+def compute_roll_stats(campaign, character_id=None):
+    rolls = DiceRoll.objects.filter(campaign=campaign)
+    if character_id is not None:
+        rolls = rolls.filter(character_id=character_id)
+
+    fate_filter = models.Q(used_fate_point=True)
+    summary = rolls.aggregate(
+        total=models.Count('id'),
+        mean_dice_total=models.Avg('dice_total'),
+        mean_final_total=models.Avg('final_total'),
+        mean_hidden_total=models.Avg('hidden_total'),
+        fate_points_used=models.Count('id', filter=fate_filter),
+    )
+    total = summary['total']
+    observed = dict(
+        rolls.values('dice_total').annotate(count=models.Count('id')).values_list('dice_total', 'count')
+    )
+    distribution = [
+        {**row, 'count': observed.get(row['total'], 0),
+         'observed': round(observed.get(row['total'], 0) / total, 4) if total else 0}
+        for row in probability_table()
+    ]
+
+    streaks = _streaks(rolls)
+    characters = [
+        {
+            'character': row['character_id'],
+            'character_name': row['character__name'],
+            'rolls': row['rolls'],
+            'mean_final_total': _mean(row['mean_final_total']),
+            'fate_point_rate': round(row['fate_points_used'] / row['rolls'], 4),
+            'best': row['best'],
+            'worst': row['worst'],
+            **streaks.get(row['character_id'], {}),
+        }
+        for row in rolls.values('character_id', 'character__name').annotate(
+            rolls=models.Count('id'),
+            mean_final_total=models.Avg('final_total'),
+            fate_points_used=models.Count('id', filter=fate_filter),
+            best=models.Max('final_total'),
+            worst=models.Min('final_total'),
+        ).order_by('character__name')
+    ]
+    skills = [
+        {
+            'skill': row['skill_used_id'],
+            'skill_name': row['skill_used__name'],
+            'rolls': row['rolls'],
+            'usage_rate': round(row['rolls'] / total, 4),
+            'mean_final_total': _mean(row['mean_final_total']),
+        }
+        for row in rolls.values('skill_used_id', 'skill_used__name').annotate(
+            rolls=models.Count('id'),
+            mean_final_total=models.Avg('final_total'),
+        ).order_by('-rolls', 'skill_used__name')
+    ]
+
+    return {
+        'campaign': campaign.id,
+        'character': character_id,
+        'total_rolls': total,
+        'mean_dice_total': _mean(summary['mean_dice_total']),
+        'mean_final_total': _mean(summary['mean_final_total']),
+        'mean_hidden_total': _mean(summary['mean_hidden_total']),
+        'fate_point_rate': round(summary['fate_points_used'] / total, 4) if total else 0,
+        'distribution': distribution,
+        'characters': characters,
+        'skills': skills,
+    }
+
+
+def roll_stats(campaign, character_id=None):
+    """compute_roll_stats com cache por campanha"""
+    key = f'roll-stats:{campaign.id}:{character_id or "all"}:{_stats_version(campaign.id)}'
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_roll_stats(campaign, character_id)
+        cache.set(key, stats, CACHE_TIMEOUT)
+    return stats
@@ -1,5 +1,7 @@
 from django.contrib.auth.models import User
+from django.db import models
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 
 from .models import (
     Profile, Campaign, Character, CharacterNote, Item, RollRequest,
@@ -8,6 +10,116 @@ from .models import (
     Stand, CursedTechnique, Zanpakuto, PowerIdea, SkillIdea,
     DiceRoll, Notification, ItemTrade, Session, Message
 )
+from .images import variants_for, variants_for_many
+
+
+# ============== SPARSE FIELDSETS ==============
+
+def _csv_param(request, name):
+    raw = request.query_params.get(name)
+    if raw is None:
+        return None
+    return [part.strip() for part in raw.split(',') if part.strip()]
+
+
+def _fieldset_params(request):
+    """(fields, expand) da query string; só vale para leitura"""
+    if request is None or request.method not in SAFE_METHODS:
+        return None, None
+    return _csv_param(request, 'fields'), _csv_param(request, 'expand')
+
+
+def _sparse_selection(fields, expand, available, expandable):
+    if fields is None and expand is None:
+        return None
+    selected = set(available) - expandable if fields is None else set(fields)
+    return selected | (set(expand or ()) & expandable)
+
+
+class SparseFieldsetMixin:
+    """
+    ``?fields=a,b`` limita os campos da resposta e ``?expand=x,y`` escolhe
+    quais relações aninhadas (``Meta.expandable_fields``) entram. Só com
+    ``expand`` vêm todos os campos simples mais as relações pedidas; sem
+    nenhum dos dois a representação é a completa.
+
+    Só o serializer raiz (o que recebe ``context['request']``) olha a query
+    string; também aceita ``fields=``/``expand=`` como kwargs.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', None)
+        super().__init__(*args, **kwargs)
+        if fields is None and expand is None:
+            fields, expand = _fieldset_params(self._context.get('request'))
+        selected = _sparse_selection(fields, expand, self.fields, self.get_expandable_fields())
+        if selected is not None:
+            for name in list(self.fields):
+                if name not in selected:
+                    self.fields.pop(name)
+
+    @classmethod
+    def get_expandable_fields(cls):
+        return set(getattr(cls.Meta, 'expandable_fields', ()))
+
+    @classmethod
+    def requested_relations(cls, request):
+        """Relações aninhadas que a resposta vai serializar (para montar o prefetch)"""
+        expandable = cls.get_expandable_fields()
+        fields, expand = _fieldset_params(request)
+        selected = _sparse_selection(fields, expand, cls.Meta.fields, expandable)
+        if selected is None:
+            return expandable
+        return selected & expandable
+
+
+# ============== IMAGENS ==============
+
+class ImageVariantsField(serializers.Field):
+    """
+    Derivadas de um ImageField como ``{formato: {largura: url}}`` (ex.: para
+    montar um srcset). Vazio enquanto a imagem não foi processada.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return {}
+        request = self.context.get('request')
+        storage = value.storage
+        found = getattr(self.root, '_image_variants', {}).get(value.name)
+        if found is None:
+            found = variants_for(value.name)
+        variants = {}
+        for image_format, widths in found.items():
+            urls = {}
+            for width, path in sorted(widths.items()):
+                url = storage.url(path)
+                urls[str(width)] = request.build_absolute_uri(url) if request is not None else url
+            variants[image_format] = urls
+        return variants
+
+
+class ImageVariantsListSerializer(serializers.ListSerializer):
+    """
+    Listas de serializers com ImageVariantsField: as derivadas de todas as
+    imagens da lista vêm de um get_many só (e uma query para o que faltar no
+    cache) em vez de uma consulta por objeto.
+    """
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        fields = [field for field in self.child.fields.values() if isinstance(field, ImageVariantsField)]
+        root = self.root
+        if not hasattr(root, '_image_variants'):
+            root._image_variants = {}
+        names = {getattr(field.get_attribute(item), 'name', None) for item in items for field in fields}
+        root._image_variants.update(variants_for_many(names - root._image_variants.keys()))
+        return super().to_representation(items)
 
 
 # ============== AUTH ==============
@@ -43,54 +155,73 @@ class UserSerializer(serializers.ModelSerializer):
 
 # ============== CAMPAIGN ==============
 
-class CampaignSerializer(serializers.ModelSerializer):
+def _player_count(campaign):
+    # CampaignViewSet anota player_count; fora dele conta na hora
+    count = getattr(campaign, 'player_count', None)
+    if count is None:
+        count = campaign.characters.filter(is_npc=False).count()
+    return count
+
+
+class CampaignSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    image_variants = ImageVariantsField(source='image')
+    projection_image_variants = ImageVariantsField(source='projection_image')
     owner_username = serializers.CharField(source='owner.username', read_only=True)
     player_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Campaign
+        list_serializer_class = ImageVariantsListSerializer
         fields = (
             'id', 'name', 'description', 'campaign_type', 'created_at',
-            'owner', 'owner_username', 'image', 'era_campaign', 'location_campaign',
-            'projection_image', 'projection_title', 'projection_updated_at',
+            'owner', 'owner_username', 'image', 'image_variants', 'era_campaign', 'location_campaign',
+            'projection_image', 'projection_image_variants', 'projection_title', 'projection_updated_at',
             'player_count',
         )
         read_only_fields = ('id', 'created_at', 'owner', 'owner_username', 'projection_updated_at')
 
     def get_player_count(self, obj):
-        return obj.characters.filter(is_npc=False).count()
+        return _player_count(obj)
 
 
-class CampaignListSerializer(serializers.ModelSerializer):
+class CampaignListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Versão simplificada para listagem"""
+    image_variants = ImageVariantsField(source='image')
     owner_username = serializers.CharField(source='owner.username', read_only=True)
     player_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Campaign
+        list_serializer_class = ImageVariantsListSerializer
         fields = (
-            'id', 'name', 'description', 'campaign_type', 'image',
+            'id', 'name', 'description', 'campaign_type', 'image', 'image_variants',
             'owner', 'owner_username', 'player_count', 'created_at',
         )
 
     def get_player_count(self, obj):
-        return obj.characters.filter(is_npc=False).count()
+        return _player_count(obj)
 
 
 class ProjectionSerializer(serializers.ModelSerializer):
     """Para atualizar a projeção do mestre"""
+    projection_image_variants = ImageVariantsField(source='projection_image')
+
     class Meta:
         model = Campaign
-        fields = ('projection_image', 'projection_title', 'projection_updated_at')
+        list_serializer_class = ImageVariantsListSerializer
+        fields = ('projection_image', 'projection_image_variants', 'projection_title', 'projection_updated_at')
         read_only_fields = ('projection_updated_at',)
 
 
 class CampaignMapSerializer(serializers.ModelSerializer):
     """Para atualizar o mapa da campanha"""
+    map_image_variants = ImageVariantsField(source='map_image')
+
     class Meta:
         model = Campaign
-        fields = ('map_image', 'map_data', 'map_updated_at')
-        read_only_fields = ('map_updated_at',)
+        list_serializer_class = ImageVariantsListSerializer
+        fields = ('map_image', 'map_image_variants', 'map_data', 'map_updated_at', 'map_version')
+        read_only_fields = ('map_updated_at', 'map_version')
 
 
 # ============== SKILLS & ABILITIES ==============
@@ -197,15 +328,17 @@ class SkillIdeaSerializer(serializers.ModelSerializer):
 
 # ============== ITEMS ==============
 
-class ItemSerializer(serializers.ModelSerializer):
+class ItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    image_variants = ImageVariantsField(source='image')
     owner_character_name = serializers.CharField(source='owner_character.name', read_only=True)
     campaign_id = serializers.IntegerField(source='owner_character.campaign_id', read_only=True)
 
     class Meta:
         model = Item
+        list_serializer_class = ImageVariantsListSerializer
         fields = (
             'id', 'name', 'description', 'item_type', 'durability',
-            'is_equipped', 'quantity', 'image', 'rarity', 'tags', 'bonus_status', 'bonus_value',
+            'is_equipped', 'quantity', 'image', 'image_variants', 'rarity', 'tags', 'bonus_status', 'bonus_value',
             'owner_character', 'owner_character_name', 'campaign_id',
         )
         read_only_fields = ('id', 'owner_character_name', 'campaign_id')
@@ -235,6 +368,7 @@ class MessageSerializer(serializers.ModelSerializer):
 # ============== SPECIAL POWERS ==============
 
 class StandSerializer(serializers.ModelSerializer):
+    stand_image_variants = ImageVariantsField(source='stand_image')
     abilities = AbilitySerializer(many=True, read_only=True)
     ability_ids = serializers.PrimaryKeyRelatedField(
         queryset=Ability.objects.all(), many=True, write_only=True, source='abilities', required=False
@@ -242,8 +376,9 @@ class StandSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Stand
+        list_serializer_class = ImageVariantsListSerializer
         fields = (
-            'id', 'name', 'description', 'stand_type', 'stand_image',
+            'id', 'name', 'description', 'stand_type', 'stand_image', 'stand_image_variants',
             'destructive_power', 'speed', 'range_stat', 'stamina',
             'precision', 'development_potential', 'abilities', 'ability_ids',
             'notes', 'owner_character',
@@ -252,12 +387,14 @@ class StandSerializer(serializers.ModelSerializer):
 
 
 class CursedTechniqueSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField(source='image')
     abilities = AbilitySerializer(many=True, read_only=True)
 
     class Meta:
         model = CursedTechnique
+        list_serializer_class = ImageVariantsListSerializer
         fields = (
-            'id', 'name', 'description', 'technique_type', 'image',
+            'id', 'name', 'description', 'technique_type', 'image', 'image_variants',
             'cursed_energy_cost', 'damage_base', 'abilities', 'notes',
             'owner_character',
         )
@@ -272,13 +409,15 @@ class CursedTechniquePublicSerializer(serializers.ModelSerializer):
 
 
 class ZanpakutoSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField(source='image')
     shikai_abilities = AbilitySerializer(many=True, read_only=True)
     bankai_abilities = AbilitySerializer(many=True, read_only=True)
 
     class Meta:
         model = Zanpakuto
+        list_serializer_class = ImageVariantsListSerializer
         fields = (
-            'id', 'name', 'sealed_form', 'spirit_name', 'image',
+            'id', 'name', 'sealed_form', 'spirit_name', 'image', 'image_variants',
             'shikai_command', 'shikai_description', 'shikai_abilities',
             'bankai_name', 'bankai_description', 'bankai_abilities',
             'notes', 'owner_character',
@@ -330,8 +469,9 @@ class CharacterNoteSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'created_at', 'updated_at', 'author', 'author_username', 'is_master_note')
 
 
-class CharacterPublicSerializer(serializers.ModelSerializer):
+class CharacterPublicSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Versão para JOGADORES - sem stats ocultos"""
+    image_variants = ImageVariantsField(source='image')
     skills = SkillPublicSerializer(many=True, read_only=True)
     abilities = AbilitySerializer(many=True, read_only=True)
     advantages = AdvantageSerializer(many=True, read_only=True)
@@ -349,8 +489,9 @@ class CharacterPublicSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Character
+        list_serializer_class = ImageVariantsListSerializer
         fields = (
-            'id', 'name', 'description', 'image', 'created_at',
+            'id', 'name', 'description', 'image', 'image_variants', 'created_at',
             'fate_points', 'hierarchy', 'role', 'is_npc',
             'stand_unlocked', 'extra_stand_slots',
             'cursed_energy_unlocked', 'extra_cursed_technique_slots',
@@ -363,14 +504,22 @@ class CharacterPublicSerializer(serializers.ModelSerializer):
             'owner', 'owner_username', 'campaign',
         )
         read_only_fields = fields  # Jogador não edita direto
+        expandable_fields = (
+            'skills', 'abilities', 'advantages', 'personality_traits', 'items', 'notes',
+            'bleach_spells', 'bleach_spell_offers', 'stands', 'cursed_techniques', 'zanpakutos',
+        )
 
     def get_bleach_spell_offers(self, obj):
-        offers = obj.bleach_spell_offers.filter(is_open=True).prefetch_related('options')
+        # Pré-carregado pelo CharacterViewSet (Prefetch com to_attr)
+        offers = getattr(obj, 'open_bleach_spell_offers', None)
+        if offers is None:
+            offers = obj.bleach_spell_offers.filter(is_open=True).prefetch_related('options')
         return BleachSpellOfferSerializer(offers, many=True).data
 
 
-class CharacterMasterSerializer(serializers.ModelSerializer):
+class CharacterMasterSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Versão para MESTRE - com stats ocultos"""
+    image_variants = ImageVariantsField(source='image')
     skills = SkillSerializer(many=True, read_only=True)
     abilities = AbilitySerializer(many=True, read_only=True)
     advantages = AdvantageSerializer(many=True, read_only=True)
@@ -402,8 +551,9 @@ class CharacterMasterSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Character
+        list_serializer_class = ImageVariantsListSerializer
         fields = (
-            'id', 'name', 'description', 'image', 'created_at',
+            'id', 'name', 'description', 'image', 'image_variants', 'created_at',
             'fate_points', 'hierarchy', 'role', 'status', 'is_npc',
             'stand_unlocked', 'extra_stand_slots',
             'cursed_energy_unlocked', 'cursed_energy', 'extra_cursed_technique_slots',
@@ -420,6 +570,10 @@ class CharacterMasterSerializer(serializers.ModelSerializer):
             'owner', 'owner_username', 'campaign',
         )
         read_only_fields = ('id', 'created_at', 'owner_username', 'bleach_kidou_tier')
+        expandable_fields = (
+            'skills', 'abilities', 'advantages', 'personality_traits', 'items', 'notes',
+            'bleach_spells', 'bleach_spell_offers', 'stands', 'cursed_techniques', 'zanpakutos',
+        )
 
     def validate(self, attrs):
         traits = attrs.get('personality_traits')
@@ -436,6 +590,28 @@ class CharacterMasterSerializer(serializers.ModelSerializer):
         return attrs
 
 
+class CharacterSummarySerializer(serializers.ModelSerializer):
+    """Resumo da ficha para a visão da mesa (sem relações)"""
+    image_variants = ImageVariantsField(source='image')
+    owner_username = serializers.CharField(source='owner.username', read_only=True)
+
+    class Meta:
+        model = Character
+        list_serializer_class = ImageVariantsListSerializer
+        fields = (
+            'id', 'name', 'image', 'image_variants', 'fate_points', 'hierarchy', 'role', 'is_npc',
+            'owner', 'owner_username', 'campaign',
+        )
+        read_only_fields = fields
+
+
+class CharacterMasterSummarySerializer(CharacterSummarySerializer):
+    """Resumo para o MESTRE - inclui o status"""
+    class Meta(CharacterSummarySerializer.Meta):
+        fields = CharacterSummarySerializer.Meta.fields + ('status',)
+        read_only_fields = fields
+
+
 class CharacterCreateSerializer(serializers.ModelSerializer):
     """Para jogador criar seu personagem"""
     personality_trait_ids = serializers.PrimaryKeyRelatedField(
@@ -520,6 +696,42 @@ class DiceRollCreateSerializer(serializers.Serializer):
     use_fate_point = serializers.BooleanField(default=False)
 
 
+class DiceRollBatchEntrySerializer(DiceRollCreateSerializer):
+    character_id = serializers.IntegerField()
+
+
+class DiceRollBatchSerializer(serializers.Serializer):
+    """
+    Rolagens em lote: ``rolls`` (uma por personagem) ou ``character_id`` +
+    ``count`` (o mesmo personagem várias vezes).
+    """
+    MAX_ROLLS = 100
+
+    rolls = DiceRollBatchEntrySerializer(many=True, required=False)
+    character_id = serializers.IntegerField(required=False)
+    count = serializers.IntegerField(min_value=1, max_value=MAX_ROLLS, required=False)
+    skill_id = serializers.IntegerField(required=False, allow_null=True)
+    description = serializers.CharField(max_length=200, required=False, default='')
+
+    def validate(self, attrs):
+        rolls = attrs.get('rolls')
+        if rolls is None:
+            if attrs.get('character_id') is None:
+                raise serializers.ValidationError('Informe rolls ou character_id.')
+            entry = {
+                'character_id': attrs['character_id'],
+                'skill_id': attrs.get('skill_id'),
+                'description': attrs.get('description', ''),
+                'use_fate_point': False,
+            }
+            rolls = [dict(entry) for _ in range(attrs.get('count', 1))]
+        if not rolls:
+            raise serializers.ValidationError('Nenhuma rolagem informada.')
+        if len(rolls) > self.MAX_ROLLS:
+            raise serializers.ValidationError(f'Máximo de {self.MAX_ROLLS} rolagens por lote.')
+        return {'rolls': rolls}
+
+
 class RollRequestSerializer(serializers.ModelSerializer):
     character_name = serializers.CharField(source='character.name', read_only=True)
     owner_id = serializers.IntegerField(source='character.owner_id', read_only=True)
@@ -530,11 +742,21 @@ class RollRequestSerializer(serializers.ModelSerializer):
         fields = (
             'id', 'campaign', 'character', 'character_name', 'owner_id',
             'skill', 'skill_name', 'description',
-            'is_open', 'created_at',
+            'is_open', 'created_at', 'group_id',
         )
         read_only_fields = fields
 
 
+class RollGroupRequestSerializer(RollRequestSerializer):
+    """Solicitação dentro do status de um grupo (visão do mestre)"""
+    final_total = serializers.IntegerField(source='roll.final_total', read_only=True, default=None)
+    hidden_total = serializers.IntegerField(source='roll.hidden_total', read_only=True, default=None)
+
+    class Meta(RollRequestSerializer.Meta):
+        fields = RollRequestSerializer.Meta.fields + ('fulfilled_at', 'roll', 'final_total', 'hidden_total')
+        read_only_fields = fields
+
+
 # ============== NOTIFICATIONS ==============
 
 class NotificationSerializer(serializers.ModelSerializer):
@@ -566,7 +788,10 @@ class ItemTradeSerializer(serializers.ModelSerializer):
 # ============== SESSION ==============
 
 class SessionSerializer(serializers.ModelSerializer):
+    map_image_variants = ImageVariantsField(source='map_image')
+
     class Meta:
         model = Session
-        fields = ('id', 'campaign', 'date', 'location', 'summary', 'map_data', 'map_image')
+        list_serializer_class = ImageVariantsListSerializer
+        fields = ('id', 'campaign', 'date', 'location', 'summary', 'map_data', 'map_image', 'map_image_variants')
         read_only_fields = ('id',)
@@ -1,8 +1,17 @@
 from django.contrib.auth import get_user_model
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
 from django.dispatch import receiver
 
-from .models import Profile
+from .catalogs import invalidate_catalog
+from .events import publish_roll_requests, publish_rolls
+from .images import IMAGE_FIELDS, schedule_variants
+from .media import MEDIA_FIELDS, add_references, remove_references
+from .models import (
+    Ability, Advantage, BleachSpell, Character, DiceRoll, Item, PersonalityTrait, Profile, RollRequest, Skill,
+)
+from .modifiers import invalidate_modifiers
+from .roll_stats import invalidate_roll_stats
+from .tiles import TILED_FIELDS, schedule_tiles
 
 User = get_user_model()
 
@@ -12,3 +21,142 @@ def create_profile_for_user(sender, instance, created, **kwargs):
     """Cria um Profile automaticamente quando um User é criado"""
     if created:
         Profile.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=DiceRoll)
+def push_roll(sender, instance, created, **kwargs):
+    """Envia a rolagem nova para o mestre pelo canal de eventos"""
+    if created:
+        publish_rolls([instance])
+        invalidate_roll_stats([instance.campaign_id])
+
+
+@receiver(post_delete, sender=DiceRoll)
+def forget_roll(sender, instance, **kwargs):
+    invalidate_roll_stats([instance.campaign_id])
+
+
+@receiver(post_save, sender=RollRequest)
+def push_roll_request(sender, instance, **kwargs):
+    """Avisa o jogador quando uma solicitação é aberta ou concluída"""
+    publish_roll_requests([instance])
+
+
+# ============== MODIFICADORES ==============
+
+@receiver(post_save, sender=Character)
+def invalidate_character_modifiers(sender, instance, **kwargs):
+    invalidate_modifiers([instance.id])
+
+
+@receiver(m2m_changed, sender=Character.personality_traits.through)
+@receiver(m2m_changed, sender=Character.skills.through)
+def invalidate_modifiers_on_links(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            invalidate_modifiers([instance.id])
+    elif action in ('post_add', 'post_remove'):
+        invalidate_modifiers(pk_set)
+    elif action == 'pre_clear':
+        invalidate_modifiers(instance.character_set.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=PersonalityTrait)
+@receiver(post_save, sender=Skill)
+@receiver(pre_delete, sender=PersonalityTrait)
+@receiver(pre_delete, sender=Skill)
+def invalidate_modifiers_on_catalog(sender, instance, **kwargs):
+    invalidate_modifiers(instance.character_set.values_list('id', flat=True))
+
+
+@receiver(post_init, sender=Item)
+def remember_item_owner(sender, instance, **kwargs):
+    # Dono original, para invalidar os dois lados numa transferência
+    instance._loaded_owner_character_id = instance.__dict__.get('owner_character_id')
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def invalidate_modifiers_on_item(sender, instance, **kwargs):
+    invalidate_modifiers({instance.owner_character_id, instance._loaded_owner_character_id})
+    instance._loaded_owner_character_id = instance.owner_character_id
+
+
+# ============== CATÁLOGOS ==============
+
+@receiver(post_init, sender=Skill)
+@receiver(post_init, sender=Ability)
+@receiver(post_init, sender=Advantage)
+@receiver(post_init, sender=PersonalityTrait)
+def remember_catalog_campaign(sender, instance, **kwargs):
+    # Campanha original, para invalidar as duas se o registro mudar de campanha
+    instance._loaded_campaign_id = instance.__dict__.get('campaign_id')
+
+
+@receiver(post_save, sender=Skill)
+@receiver(post_save, sender=Ability)
+@receiver(post_save, sender=Advantage)
+@receiver(post_save, sender=PersonalityTrait)
+@receiver(post_save, sender=BleachSpell)
+@receiver(post_delete, sender=Skill)
+@receiver(post_delete, sender=Ability)
+@receiver(post_delete, sender=Advantage)
+@receiver(post_delete, sender=PersonalityTrait)
+@receiver(post_delete, sender=BleachSpell)
+def invalidate_catalog_entry(sender, instance, **kwargs):
+    # BleachSpell não tem campanha: entra sempre como global (None)
+    campaign_id = getattr(instance, 'campaign_id', None)
+    invalidate_catalog(sender._meta.model_name, {campaign_id, getattr(instance, '_loaded_campaign_id', campaign_id)})
+    instance._loaded_campaign_id = campaign_id
+
+
+# ============== MÍDIA ==============
+
+def remember_media_names(sender, instance, **kwargs):
+    # Nomes carregados do banco, para saber o que mudou no save
+    instance._loaded_media_names = {
+        field: getattr(instance.__dict__.get(field), 'name', instance.__dict__.get(field))
+        for field in MEDIA_FIELDS[sender]
+        if field in instance.__dict__
+    }
+
+
+def track_media_files(sender, instance, created=False, update_fields=None, **kwargs):
+    """Conta as referências aos arquivos e agenda derivadas/tiles de uploads novos"""
+    loaded = getattr(instance, '_loaded_media_names', {})
+    added, removed, uploaded, maps = [], [], [], []
+    for field in MEDIA_FIELDS[sender]:
+        if field not in instance.__dict__ or (update_fields is not None and field not in update_fields):
+            continue
+        name = getattr(instance, field).name or None
+        previous = loaded.get(field) or None
+        if created:
+            # Registro novo: até uma cópia de outro (transferência) é uma referência a mais
+            added.append(name)
+        elif name != previous:
+            added.append(name)
+            removed.append(previous)
+        if name != previous and field in IMAGE_FIELDS.get(sender, ()):
+            uploaded.append(name)
+        if name != previous and field in TILED_FIELDS.get(sender, ()):
+            maps.append(name)
+        loaded[field] = name
+    instance._loaded_media_names = loaded
+    add_references(added)
+    remove_references(removed)
+    schedule_variants(uploaded)
+    schedule_tiles(maps)
+
+
+def forget_media_files(sender, instance, **kwargs):
+    remove_references(
+        getattr(instance, field).name
+        for field in MEDIA_FIELDS[sender]
+        if field in instance.__dict__
+    )
+
+
+for model in MEDIA_FIELDS:
+    post_init.connect(remember_media_names, sender=model, dispatch_uid=f'media-names-{model.__name__}')
+    post_save.connect(track_media_files, sender=model, dispatch_uid=f'media-save-{model.__name__}')
+    post_delete.connect(forget_media_files, sender=model, dispatch_uid=f'media-delete-{model.__name__}')
@@ -0,0 +1,83 @@
+"""
+Storage de mídia endereçado por conteúdo.
+
+Cada upload é gravado como ``blobs/ab/<sha256>.<ext>``: o mesmo arquivo
+enviado de novo (o mapa reaproveitado entre sessões, a imagem copiada numa
+transferência de item) resolve para o mesmo nome e não é gravado outra vez.
+Quantos registros apontam para cada arquivo fica em MediaBlob (ver
+api/media.py); o arquivo é apagado quando a contagem chega a zero, e
+``manage.py collect_media_garbage`` recolhe o que sobrar.
+"""
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.utils.deconstruct import deconstructible
+
+BLOB_PREFIX = 'blobs'
+_BLOB_NAME = re.compile(rf'^{BLOB_PREFIX}/[0-9a-f]{{2}}/(?P<digest>[0-9a-f]{{64}})(\.[a-z0-9]+)?$')
+_EXTENSION = re.compile(r'^[a-z0-9]{1,8}$')
+# Tiles de mapa ficam sob o hash do mapa de origem (api/tiles.py)
+_TILE_NAME = re.compile(r'^tiles/[0-9a-f]{64}/\d+/\d+/\d+\.webp$')
+
+
+def content_hash(name):
+    """SHA-256 embutido num nome de blob (None para arquivos antigos)"""
+    match = _BLOB_NAME.match(name or '')
+    return match.group('digest') if match else None
+
+
+def stored_file_hash(name, storage=None):
+    """SHA-256 de um arquivo do storage (tirado do nome, se for um blob)"""
+    digest = content_hash(name)
+    if digest:
+        return digest
+    storage = storage or default_storage
+    digest = hashlib.sha256()
+    with storage.open(name, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_immutable(name):
+    """O conteúdo de um nome com hash nunca muda: pode ficar em cache para sempre"""
+    return bool(_BLOB_NAME.match(name) or _TILE_NAME.match(name))
+
+
+def blob_name(digest, original_name):
+    extension = os.path.splitext(original_name)[1].lstrip('.').lower()
+    suffix = f'.{extension}' if _EXTENSION.match(extension) else ''
+    return f'{BLOB_PREFIX}/{digest[:2]}/{digest}{suffix}'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage que nomeia os arquivos pelo hash do conteúdo"""
+
+    def get_available_name(self, name, max_length=None):
+        # O nome final sai do conteúdo em _save; colisão de nome = mesmo arquivo
+        return name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+
+        name = blob_name(digest.hexdigest(), name)
+        if self.exists(name):
+            # Renova o mtime: quem está liberando o blob sem referências não o apaga agora
+            os.utime(self.path(name))
+            return name
+        # Grava num nome temporário e renomeia: quem ler o blob nunca o vê pela
+        # metade, e duas gravações simultâneas do mesmo conteúdo dão no mesmo
+        temporary = super()._save(f'{BLOB_PREFIX}/tmp/{uuid.uuid4().hex}', content)
+        os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+        os.replace(self.path(temporary), self.path(name))
+        return name
@@ -1,3 +1,1365 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, close_old_connections, connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from .benchmarks import build_table
+from .catalogs import GLOBAL_SCOPE, catalog_key
+from .dice import FATE_FACES, RollSpec, change_fate_points, create_dice_rolls, roll_fate
+from .events import EVENT_MAP, EVENT_ROLL, CampaignEvent, InProcessBroker, broker, publish
+from .jsonpatch import apply_patch, parse_pointer
+from .media import collect_garbage, rebuild_media_references
+from .models import (
+    Campaign, CampaignBan, Character, DiceRoll, ImageDerivative, Item, ItemTrade, MapTileSet, MediaBlob, Message,
+    Notification, NotificationCounter, RollRequest, Session, Skill,
+)
+from .modifiers import _cache_key as modifiers_key
+from .notifications import (
+    ARCHIVE_FIELDS, build_notification, get_unread_count, prune_notifications, send_notifications,
+)
+from .roll_stats import _stats_version, invalidate_roll_stats
+from .tiles import generate_tiles, level_size, max_zoom_for, viewport_tiles
+from .views import POLL_DELTA_LIMIT, _authenticate_event_stream, _event_stream, make_event_stream_token
+
+
+# ============== EVENTOS ==============
+
+class InProcessBrokerTests(TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.broker = InProcessBroker(queue_size=5)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def drain(self, subscriber):
+        # As entregas chegam por call_soon_threadsafe: roda o loop uma volta
+        self.loop.run_until_complete(asyncio.sleep(0))
+        events = []
+        while not subscriber.queue.empty():
+            events.append(subscriber.queue.get_nowait())
+        return events
+
+    def test_subscribe_registers_per_campaign(self):
+        subscriber = self.broker.subscribe(1, user_id=10, is_master=False, loop=self.loop)
+        self.assertTrue(self.broker.has_subscribers(1))
+        self.assertFalse(self.broker.has_subscribers(2))
+        self.assertEqual(subscriber.campaign_id, 1)
+
+    def test_publish_fans_out_only_to_the_campaign(self):
+        first = self.broker.subscribe(1, user_id=10, is_master=False, loop=self.loop)
+        second = self.broker.subscribe(1, user_id=11, is_master=True, loop=self.loop)
+        other = self.broker.subscribe(2, user_id=12, is_master=False, loop=self.loop)
+
+        self.broker.publish(CampaignEvent(1, EVENT_MAP, {'image': None}))
+
+        self.assertEqual([event.event_type for event in self.drain(first)], [EVENT_MAP])
+        self.assertEqual([event.event_type for event in self.drain(second)], [EVENT_MAP])
+        self.assertEqual(self.drain(other), [])
+
+    def test_publish_respects_recipients_and_masters_only(self):
+        player = self.broker.subscribe(1, user_id=10, is_master=False, loop=self.loop)
+        master = self.broker.subscribe(1, user_id=11, is_master=True, loop=self.loop)
+
+        self.broker.publish(CampaignEvent(1, EVENT_ROLL, {}, masters_only=True))
+        self.broker.publish(CampaignEvent(1, EVENT_MAP, {}, recipients=frozenset({10})))
+
+        self.assertEqual([event.event_type for event in self.drain(player)], [EVENT_MAP])
+        self.assertEqual([event.event_type for event in self.drain(master)], [EVENT_ROLL])
+
+    def test_unsubscribe_removes_empty_campaign(self):
+        subscriber = self.broker.subscribe(1, user_id=10, is_master=False, loop=self.loop)
+        self.broker.unsubscribe(subscriber)
+        self.assertFalse(self.broker.has_subscribers(1))
+        # Segunda vez (finally da view depois de um erro) não quebra
+        self.broker.unsubscribe(subscriber)
+
+    def test_stream_disconnect_unsubscribes(self):
+        subscriber = broker.subscribe(99, user_id=10, is_master=False, loop=self.loop)
+        stream = _event_stream(subscriber)
+        self.assertEqual(self.loop.run_until_complete(stream.__anext__()), 'retry: 3000\n\n')
+        self.assertTrue(broker.has_subscribers(99))
+
+        # Cliente desconectou: o servidor fecha o gerador
+        self.loop.run_until_complete(stream.aclose())
+        self.assertFalse(broker.has_subscribers(99))
+
+
+class PublishOnCommitTests(TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.subscriber = broker.subscribe(42, user_id=1, is_master=True, loop=self.loop)
+
+    def tearDown(self):
+        broker.unsubscribe(self.subscriber)
+        self.loop.close()
+
+    def test_event_is_sent_only_after_commit(self):
+        built = []
+
+        def build_data():
+            built.append(True)
+            return {'image': None}
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            publish(42, EVENT_MAP, build_data)
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertTrue(self.subscriber.queue.empty())
+        self.assertEqual(built, [])
+
+        for callback in callbacks:
+            callback()
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(self.subscriber.queue.get_nowait().event_type, EVENT_MAP)
+
+    def test_payload_is_not_built_without_subscribers(self):
+        built = []
+        with self.captureOnCommitCallbacks(execute=True):
+            publish(43, EVENT_MAP, lambda: built.append(True) or {})
+        self.assertEqual(built, [])
+
+
+class EventStreamTokenTests(TestCase):
+    def setUp(self):
+        self.fixture = build_table(players=2, npcs=0)
+        self.campaign = self.fixture.campaign
+        self.player = self.fixture.players[0]
+
+    def authenticate(self, query, campaign_id=None):
+        request = RequestFactory().get('/events/', query)
+        return async_to_sync(_authenticate_event_stream)(request, campaign_id or self.campaign.id)
+
+    def test_event_token_endpoint_opens_the_stream(self):
+        client = APIClient()
+        client.force_authenticate(self.player)
+        response = client.post(f'/api/campaigns/{self.campaign.id}/event_token/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.authenticate({'stream_token': response.data['token']}), self.player)
+
+    def test_token_is_bound_to_the_campaign(self):
+        token = make_event_stream_token(self.player, self.campaign.id)
+        self.assertIsNone(self.authenticate({'stream_token': token}, campaign_id=self.campaign.id + 1))
+
+    def test_tampered_or_expired_token_is_rejected(self):
+        token = make_event_stream_token(self.player, self.campaign.id)
+        self.assertIsNone(self.authenticate({'stream_token': token + 'x'}))
+        with self.settings(CAMPAIGN_EVENTS_TOKEN_MAX_AGE=-1):
+            self.assertIsNone(self.authenticate({'stream_token': token}))
+
+    def test_inactive_user_is_rejected(self):
+        token = make_event_stream_token(self.player, self.campaign.id)
+        self.player.is_active = False
+        self.player.save()
+        self.assertIsNone(self.authenticate({'stream_token': token}))
+
+
+# ============== QUERIES POR AÇÃO ==============
+
+def token_client(user):
+    """Cliente autenticado por token: o usuário é recarregado a cada requisição, como em produção"""
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+    return client
+
+
+class QueryCountTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def assertQueries(self, expected, func):
+        """Total exato de queries, e mestre/banimentos consultados no máximo uma vez"""
+        with CaptureQueriesContext(connection) as captured:
+            response = func()
+        sqls = [query['sql'] for query in captured.captured_queries]
+        self.assertEqual(len(sqls), expected, '\n'.join(sqls))
+        # Consultas próprias do contexto de autorização (subqueries de filtros não contam)
+        self.assertLessEqual(sum(sql.startswith('SELECT "api_profile"') for sql in sqls), 1)
+        self.assertLessEqual(sum(sql.startswith('SELECT "api_campaignban"') for sql in sqls), 1)
+        return response
+
+
+class CharacterViewSetQueryTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.fixture = build_table(players=3, npcs=2)
+        self.character = self.fixture.characters[0]
+        self.player = token_client(self.fixture.players[0])
+        self.master = token_client(self.fixture.master)
+
+    def test_retrieve(self):
+        url = f'/api/characters/{self.character.id}/'
+        self.assertEqual(self.assertQueries(16, lambda: self.player.get(url)).status_code, 200)
+        self.assertEqual(self.assertQueries(16, lambda: self.master.get(url)).status_code, 200)
+
+    def test_update(self):
+        response = self.assertQueries(30, lambda: self.player.patch(
+            f'/api/characters/{self.character.id}/', {'name': 'Novo nome'}, format='json',
+        ))
+        self.assertEqual(response.status_code, 200)
+
+    def test_update_with_campaign_filter_checks_ban_once(self):
+        # get_queryset e perform_update checam o banimento; o contexto da requisição memoriza
+        response = self.assertQueries(31, lambda: self.player.patch(
+            f'/api/characters/{self.character.id}/?campaign={self.character.campaign_id}',
+            {'name': 'Novo nome'}, format='json',
+        ))
+        self.assertEqual(response.status_code, 200)
+
+    def test_update_of_someone_elses_character(self):
+        other = self.fixture.characters[1]
+        response = self.assertQueries(3, lambda: self.player.patch(
+            f'/api/characters/{other.id}/', {'name': 'X'}, format='json',
+        ))
+        self.assertEqual(response.status_code, 404)
+
+    def test_destroy(self):
+        npc = self.fixture.npcs[0]
+        response = self.assertQueries(37, lambda: self.master.delete(f'/api/characters/{npc.id}/'))
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Character.objects.filter(id=npc.id).exists())
+
+
+class CampaignActionQueryTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.fixture = build_table(players=3, npcs=2)
+        self.campaign = self.fixture.campaign
+        self.url = f'/api/campaigns/{self.campaign.id}/'
+        self.player = token_client(self.fixture.players[0])
+        self.master = token_client(self.fixture.master)
+        CampaignBan.objects.create(campaign=self.campaign, user=self.fixture.players[2])
+        self.banned = token_client(self.fixture.players[2])
+
+    def test_map_goes_through_ensure_not_banned(self):
+        self.assertEqual(self.assertQueries(5, lambda: self.player.get(f'{self.url}map/')).status_code, 200)
+        self.assertEqual(self.assertQueries(3, lambda: self.banned.get(f'{self.url}map/')).status_code, 404)
+
+    def test_update_map_goes_through_is_campaign_master(self):
+        body = {'map_data': {'groups': []}}
+        response = self.assertQueries(3, lambda: self.player.post(f'{self.url}update_map/', body, format='json'))
+        self.assertEqual(response.status_code, 403)
+        response = self.assertQueries(5, lambda: self.master.post(f'{self.url}update_map/', body, format='json'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_party(self):
+        self.assertEqual(self.assertQueries(17, lambda: self.player.get(f'{self.url}party/')).status_code, 200)
+        self.assertEqual(self.assertQueries(17, lambda: self.master.get(f'{self.url}party/')).status_code, 200)
+
+    def test_catalog_list_checks_ban_once(self):
+        url = f'/api/skills/?campaign={self.campaign.id}'
+        self.assertEqual(self.assertQueries(5, lambda: self.player.get(url)).status_code, 200)
+        self.assertEqual(self.assertQueries(3, lambda: self.banned.get(url)).status_code, 403)
+
+
+class ListQueryTests(QueryCountTestCase):
+    """Listagens com histórico: o total de queries não depende de quantas linhas voltam"""
+
+    def setUp(self):
+        super().setUp()
+        self.fixture = build_table(players=3, npcs=2, rolls=12, notifications=12, roll_requests=6)
+        self.campaign = self.fixture.campaign
+        player = self.fixture.players[0]
+        for _ in range(6):
+            Message.objects.create(campaign=self.campaign, sender=self.fixture.master, recipient=player, content='Oi')
+        items = list(Item.objects.filter(owner_character=self.fixture.characters[0]))
+        for item in items[:4]:
+            ItemTrade.objects.create(item=item, from_character=self.fixture.characters[0], to_character=self.fixture.characters[1])
+        self.player = token_client(player)
+        self.master = token_client(self.fixture.master)
+
+    def get(self, expected, client, url):
+        cache.clear()
+        response = self.assertQueries(expected, lambda: client.get(url))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_campaign_list_and_retrieve(self):
+        url = f'/api/campaigns/{self.campaign.id}/'
+        for client in (self.player, self.master):
+            self.get(3, client, '/api/campaigns/')
+            self.get(3, client, url)
+
+    def test_campaign_summary(self):
+        self.get(4, self.player, f'/api/campaigns/{self.campaign.id}/summary/')
+        self.get(4, self.master, f'/api/campaigns/{self.campaign.id}/summary/')
+
+    def test_campaign_npcs(self):
+        response = self.get(17, self.master, f'/api/campaigns/{self.campaign.id}/npcs/')
+        self.assertEqual(len(response.data), 2)
+
+    def test_character_list(self):
+        self.get(16, self.player, '/api/characters/')
+        self.get(18, self.player, f'/api/characters/?campaign={self.campaign.id}')
+        self.get(17, self.master, f'/api/characters/?campaign={self.campaign.id}')
+
+    def test_dice_roll_list(self):
+        response = self.get(4, self.master, f'/api/rolls/?campaign={self.campaign.id}')
+        self.assertEqual(len(response.data), 12)
+        self.get(5, self.player, f'/api/rolls/?campaign={self.campaign.id}')
+
+    def test_notification_list(self):
+        self.get(5, self.player, f'/api/notifications/?campaign={self.campaign.id}')
+        self.get(4, self.master, f'/api/notifications/?campaign={self.campaign.id}')
+
+    def test_message_list(self):
+        response = self.get(6, self.player, f'/api/messages/?campaign={self.campaign.id}')
+        self.assertEqual(len(response.data), 6)
+        self.get(4, self.master, f'/api/messages/?campaign={self.campaign.id}')
+
+    def test_item_trade_list(self):
+        response = self.get(4, self.master, f'/api/item-trades/?campaign={self.campaign.id}')
+        self.assertEqual(len(response.data), 4)
+        self.get(5, self.player, f'/api/item-trades/?campaign={self.campaign.id}')
+
+    def test_poll(self):
+        url = f'/api/campaigns/{self.campaign.id}/poll/'
+        response = self.get(4, self.master, url)
+        self.assertEqual(len(response.data['recent_rolls']), 10)
+        self.get(5, self.player, url)
+
+
+class CampaignListQueryTests(QueryCountTestCase):
+    def list_queries(self, client):
+        cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get('/api/campaigns/')
+        self.assertEqual(response.status_code, 200)
+        return len(response.data), len(captured)
+
+    def test_query_count_does_not_grow_with_campaigns(self):
+        fixture = build_table(name='Mesa 0', players=2, npcs=1)
+        player = token_client(fixture.players[0])
+        master = token_client(fixture.master)
+        before = [self.list_queries(player), self.list_queries(master)]
+
+        for index in range(1, 8):
+            build_table(name=f'Mesa {index}', players=2, npcs=1)
+        CampaignBan.objects.create(campaign=fixture.campaign, user=fixture.players[1])
+        after = [self.list_queries(player), self.list_queries(master)]
+
+        self.assertEqual([total for total, _ in before], [1, 1])
+        self.assertEqual([total for total, _ in after], [8, 8])
+        self.assertEqual([queries for _, queries in before], [queries for _, queries in after])
+
+
+# ============== ROLAGENS ==============
+
+class RequestRollGroupTests(TestCase):
+    def setUp(self):
+        self.fixture = build_table(players=3, npcs=0)
+        self.campaign = self.fixture.campaign
+        self.master = APIClient()
+        self.master.force_authenticate(self.fixture.master)
+
+    def test_only_active_bans_in_this_campaign_exclude_players(self):
+        revoked, banned, _ = self.fixture.players
+        other = build_table(name='Outra mesa', players=0, npcs=0).campaign
+        # Banimento revogado aqui + banimento ativo em outra campanha: continua na mesa
+        CampaignBan.objects.create(campaign=self.campaign, user=revoked, is_active=False)
+        CampaignBan.objects.create(campaign=other, user=revoked)
+        CampaignBan.objects.create(campaign=self.campaign, user=banned)
+
+        response = self.master.post(
+            f'/api/campaigns/{self.campaign.id}/request_roll_group/', {'character_ids': 'all'}, format='json',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        expected = {character.id for character in self.fixture.characters if character.owner_id != banned.id}
+        self.assertEqual(set(RollRequest.objects.values_list('character_id', flat=True)), expected)
+
+
+class FatePointsConcurrencyTests(TransactionTestCase):
+    """Gastos simultâneos, cada um na sua conexão: o UPDATE condicional não perde nem deixa negativo"""
+    spenders = 12
+
+    def test_concurrent_spends_never_go_negative(self):
+        character = build_table(players=1, npcs=0).characters[0]
+        start = 5
+        Character.objects.filter(pk=character.pk).update(fate_points=start)
+
+        def spend(_):
+            try:
+                while True:
+                    try:
+                        return change_fate_points(Character.objects.get(pk=character.pk), -1)
+                    except OperationalError as exc:
+                        # O banco de teste em memória (shared cache) não espera o lock como
+                        # um arquivo com busy timeout: a instrução não rodou, tenta de novo
+                        if 'locked' not in str(exc):
+                            raise
+                        time.sleep(0.001)
+            finally:
+                close_old_connections()
+
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            results = list(executor.map(spend, range(self.spenders)))
+
+        character.refresh_from_db(fields=['fate_points'])
+        self.assertEqual(results.count(True), start)
+        self.assertEqual(character.fate_points, start - results.count(True))
+        self.assertGreaterEqual(character.fate_points, 0)
+
+
+# ============== ITENS ==============
+
+class ItemTradeFilterTests(TestCase):
+    def test_invalid_character_filter_returns_empty(self):
+        fixture = build_table(players=1, npcs=0)
+        client = APIClient()
+        client.force_authenticate(fixture.players[0])
+        for query in ('?character=abc', f'?campaign={fixture.campaign.id}&character=abc'):
+            response = client.get(f'/api/item-trades/{query}')
+            self.assertEqual(response.status_code, 200, query)
+            self.assertEqual(response.data, [])
+
+
+# ============== INVALIDAÇÃO DE CACHE ==============
+
+class InvalidateOnCommitTests(TestCase):
+    """Um leitor concorrente que recoloca no cache os valores de antes do commit é descartado no commit"""
+
+    def setUp(self):
+        cache.clear()
+        self.fixture = build_table(players=1, npcs=0)
+        self.character = self.fixture.characters[0]
+
+    def test_modifiers(self):
+        key = modifiers_key(self.character.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.character.forca += 1
+            self.character.save()
+            cache.set(key, 'tabela antiga')
+        self.assertIsNone(cache.get(key))
+
+    def test_roll_stats(self):
+        campaign_id = self.fixture.campaign.id
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_roll_stats([campaign_id])
+            during = _stats_version(campaign_id)
+        self.assertNotEqual(_stats_version(campaign_id), during)
+
+    def test_catalog(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Skill.objects.create(name='Nova skill')
+            during = catalog_key('skill', GLOBAL_SCOPE, 'list')
+        self.assertNotEqual(catalog_key('skill', GLOBAL_SCOPE, 'list'), during)
+
+
+# ============== IMAGENS ==============
+
+class ImageVariantsQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.fixture = build_table(players=1, npcs=0)
+        self.character = self.fixture.characters[0]
+        self.client = APIClient()
+        self.client.force_authenticate(self.fixture.players[0])
+
+    def add_items(self, count):
+        self.items = count
+        for index in range(count):
+            item = Item.objects.create(name=f'Item {index}', owner_character=self.character)
+            # update: sem signals, nada é agendado para processar
+            Item.objects.filter(pk=item.pk).update(image=f'blobs/00/{index:064x}.png')
+            ImageDerivative.objects.create(
+                source_name=f'blobs/00/{index:064x}.png', source_hash=f'{index:064x}',
+                image_format='webp', width=96, height=96, file=f'blobs/01/{index:064x}.webp', size=1,
+            )
+
+    def derivative_queries(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(f'/api/items/?character={self.character.id}')
+        self.assertEqual(response.status_code, 200)
+        with_image = [item for item in response.data if item['image']]
+        self.assertEqual(len(with_image), self.items)
+        self.assertTrue(all(item['image_variants']['webp'] for item in with_image))
+        return sum('"api_imagederivative"' in query['sql'] for query in captured.captured_queries)
+
+    def test_list_looks_up_variants_once(self):
+        self.add_items(6)
+        self.assertEqual(self.derivative_queries(), 1)
+        # Segunda vez tudo vem do cache
+        self.assertEqual(self.derivative_queries(), 0)
+
+
+# ============== MÍDIA ==============
+
+class MediaReferenceTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(self.settings(MEDIA_ROOT=media_root.name, IMAGE_DERIVATIVE_WORKERS=0))
+        self.character = build_table(players=1, npcs=0).characters[0]
+
+    def add_item(self, content=b'arte'):
+        item = Item(name='Espada', owner_character=self.character)
+        # Sem executar os on_commit: não gera derivadas de um arquivo que nem é imagem
+        with self.captureOnCommitCallbacks():
+            item.image.save('espada.png', ContentFile(content))
+        return item
+
+    def age(self, name):
+        old = (timezone.now() - timedelta(days=2)).timestamp()
+        os.utime(default_storage.path(name), (old, old))
+
+    def test_shared_blob_is_deleted_with_the_last_reference(self):
+        first, second = self.add_item(), self.add_item()
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        self.assertEqual(MediaBlob.objects.get(name=name).ref_count, 2)
+        self.age(name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(MediaBlob.objects.get(name=name).ref_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+
+    def test_recently_reused_blob_is_left_for_the_collector(self):
+        item = self.add_item()
+        name = item.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(MediaBlob.objects.get(name=name).ref_count, 0)
+
+        self.age(name)
+        report = collect_garbage(older_than=timedelta(hours=1))
+        self.assertEqual(report['deleted'], 1)
+        self.assertFalse(default_storage.exists(name))
+
+    def test_collector_removes_untracked_files_and_recount_repairs(self):
+        item = self.add_item()
+        untracked = default_storage.save('antigo.png', ContentFile(b'sem registro'))
+        MediaBlob.objects.filter(name=untracked).delete()
+        MediaBlob.objects.filter(name=item.image.name).update(ref_count=0)
+        self.age(untracked)
+        self.age(item.image.name)
+
+        self.assertEqual(rebuild_media_references(), 1)
+        report = collect_garbage(older_than=timedelta(hours=1))
+        self.assertEqual(report['deleted'], 1)
+        self.assertFalse(default_storage.exists(untracked))
+        self.assertTrue(default_storage.exists(item.image.name))
+
+
+# ============== MAPA (JSON PATCH) ==============
+
+class JsonPatchTests(SimpleTestCase):
+    def document(self):
+        return {'groups': [{'id': 'a', 'x': 1}, {'id': 'b', 'x': 2}], 'fog': {'a/b': 1, 'c~d': 2}}
+
+    def test_pointer_escapes(self):
+        self.assertEqual(parse_pointer(''), [])
+        self.assertEqual(parse_pointer('/fog/a~1b'), ['fog', 'a/b'])
+        self.assertEqual(parse_pointer('/fog/c~0d'), ['fog', 'c~d'])
+        # ~01 é "~1" literal, não "/"
+        self.assertEqual(parse_pointer('/~01'), ['~1'])
+
+    def test_add(self):
+        document = apply_patch(self.document(), [
+            {'op': 'add', 'path': '/groups/-', 'value': {'id': 'c'}},
+            {'op': 'add', 'path': '/groups/0', 'value': {'id': 'z'}},
+            {'op': 'add', 'path': '/title', 'value': 'Vila'},
+        ])
+        self.assertEqual([group['id'] for group in document['groups']], ['z', 'a', 'b', 'c'])
+        self.assertEqual(document['title'], 'Vila')
+
+    def test_remove_and_replace(self):
+        document = apply_patch(self.document(), [
+            {'op': 'remove', 'path': '/fog/a~1b'},
+            {'op': 'replace', 'path': '/groups/1/x', 'value': 9},
+        ])
+        self.assertEqual(document['fog'], {'c~d': 2})
+        self.assertEqual(document['groups'][1], {'id': 'b', 'x': 9})
+
+    def test_move_and_copy(self):
+        document = apply_patch(self.document(), [
+            {'op': 'copy', 'from': '/groups/0', 'path': '/groups/-'},
+            {'op': 'move', 'from': '/groups/0', 'path': '/first'},
+        ])
+        self.assertEqual(document['first'], {'id': 'a', 'x': 1})
+        self.assertEqual([group['id'] for group in document['groups']], ['b', 'a'])
+
+    def test_copy_does_not_alias(self):
+        document = apply_patch(self.document(), [
+            {'op': 'copy', 'from': '/groups/0', 'path': '/copied'},
+            {'op': 'replace', 'path': '/copied/x', 'value': 5},
+        ])
+        self.assertEqual(document['groups'][0]['x'], 1)
+
+    def test_test_operation(self):
+        apply_patch(self.document(), [{'op': 'test', 'path': '/groups/0/x', 'value': 1}])
+        # Em JSON true não é 1
+        with self.assertRaises(ValidationError):
+            apply_patch(self.document(), [{'op': 'test', 'path': '/groups/0/x', 'value': True}])
+
+    def test_invalid_pointers_and_indexes(self):
+        for operation in (
+            {'op': 'replace', 'path': 'groups/0', 'value': 1},
+            {'op': 'replace', 'path': '/groups/01', 'value': 1},
+            {'op': 'replace', 'path': '/groups/2', 'value': 1},
+            {'op': 'remove', 'path': '/groups/-'},
+            {'op': 'remove', 'path': '/missing'},
+            {'op': 'move', 'from': '/groups', 'path': '/groups/0'},
+            {'op': 'explode', 'path': '/groups'},
+            {'op': 'add', 'path': '/groups/-'},
+        ):
+            with self.subTest(operation=operation), self.assertRaises(ValidationError):
+                apply_patch(self.document(), [operation])
+
+
+class PatchMapViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.fixture = build_table(players=1, npcs=0)
+        self.campaign = self.fixture.campaign
+        Campaign.objects.filter(pk=self.campaign.pk).update(map_data={'groups': [{'id': 'a', 'x': 1}]})
+        self.url = f'/api/campaigns/{self.campaign.id}/'
+        self.master = APIClient()
+        self.master.force_authenticate(self.fixture.master)
+
+    def patch(self, version, operations):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.master.post(
+                f'{self.url}patch_map/', {'version': version, 'operations': operations}, format='json',
+            )
+
+    def current(self):
+        return Campaign.objects.values_list('map_data', 'map_version').get(pk=self.campaign.pk)
+
+    def test_patch_bumps_version_and_is_replayable(self):
+        response = self.patch(0, [{'op': 'replace', 'path': '/groups/0/x', 'value': 5}])
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['map_version'], 1)
+        self.assertEqual(self.current(), ({'groups': [{'id': 'a', 'x': 5}]}, 1))
+        self.patch(1, [{'op': 'add', 'path': '/groups/-', 'value': {'id': 'b'}}])
+
+        response = self.master.get(f'{self.url}map/?since_version=0')
+        self.assertEqual([patch['version'] for patch in response.data['patches']], [1, 2])
+        # Versão que não veio de um patch: volta o mapa inteiro
+        cache.clear()
+        self.assertIn('map_data', self.master.get(f'{self.url}map/?since_version=0').data)
+
+    def test_failing_test_operation_leaves_the_map_unchanged(self):
+        before = self.current()
+        response = self.patch(0, [
+            {'op': 'replace', 'path': '/groups/0/x', 'value': 7},
+            {'op': 'test', 'path': '/groups/0/id', 'value': 'z'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Operação 1', str(response.data['operations']))
+        self.assertEqual(self.current(), before)
+
+    def test_invalid_pointer_returns_400(self):
+        for path in ('groups/0', '/groups/9', '/groups/-1'):
+            response = self.patch(0, [{'op': 'replace', 'path': path, 'value': 1}])
+            self.assertEqual(response.status_code, 400, path)
+        self.assertEqual(self.current()[1], 0)
+
+    def test_stale_version_returns_409(self):
+        self.patch(0, [{'op': 'add', 'path': '/title', 'value': 'A'}])
+        response = self.patch(0, [{'op': 'add', 'path': '/title', 'value': 'B'}])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['map_version'], 1)
+        self.assertEqual(self.current()[0]['title'], 'A')
+
+    def test_load_map_rejects_in_flight_patches(self):
+        session = Session.objects.create(campaign=self.campaign, date='2026-10-17', map_data={'groups': []})
+        response = self.master.post(f'/api/sessions/{session.id}/load_map/')
+        self.assertEqual(response.data['map_version'], 1)
+
+        response = self.patch(0, [{'op': 'remove', 'path': '/groups/0'}])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.current(), ({'groups': []}, 1))
+
+
+# ============== POLLING ==============
+
+class PollTestCase(TestCase):
+    def setUp(self):
+        self.fixture = build_table(players=2, npcs=0)
+        self.campaign = self.fixture.campaign
+        self.character = self.fixture.characters[0]
+        self.url = f'/api/campaigns/{self.campaign.id}/poll/'
+        self.player = APIClient()
+        self.player.force_authenticate(self.fixture.players[0])
+        self.master = APIClient()
+        self.master.force_authenticate(self.fixture.master)
+
+    def add_roll(self):
+        return DiceRoll.objects.create(
+            character=self.character, campaign=self.campaign,
+            dice_1=1, dice_2=0, dice_3=-1, dice_4=1, dice_total=1, final_total=1,
+        )
+
+    def add_notification(self, recipient=None):
+        return send_notifications([build_notification(
+            campaign=self.campaign, recipient=recipient or self.fixture.players[0],
+            notification_type='system', title='Aviso', message='Algo mudou',
+        )])[0]
+
+    def add_roll_request(self):
+        return RollRequest.objects.create(
+            campaign=self.campaign, character=self.character, requested_by=self.fixture.master,
+        )
+
+
+class PollETagTests(PollTestCase):
+    def assertChangesETag(self, client, change):
+        etag = client.get(self.url)['ETag']
+        change()
+        response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_unchanged_state_returns_304_with_the_same_etag(self):
+        for client in (self.player, self.master):
+            first = client.get(self.url)
+            self.assertEqual(first.status_code, 200)
+            response = client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], first['ETag'])
+            self.assertEqual(response.content, b'')
+            # Lista de ETags também vale
+            response = client.get(self.url, HTTP_IF_NONE_MATCH=f'"outro", {first["ETag"]}')
+            self.assertEqual(response.status_code, 304)
+
+    def test_new_roll_changes_the_master_etag(self):
+        self.assertChangesETag(self.master, self.add_roll)
+
+    def test_new_notification_changes_the_etag(self):
+        self.assertChangesETag(self.player, self.add_notification)
+        self.assertChangesETag(self.master, lambda: self.add_notification(self.fixture.master))
+
+    def test_new_roll_request_changes_the_player_etag(self):
+        self.assertChangesETag(self.player, self.add_roll_request)
+
+    def test_other_players_changes_keep_the_etag(self):
+        etag = self.player.get(self.url)['ETag']
+        self.add_notification(self.fixture.players[1])
+        self.assertEqual(self.player.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class PollCursorTests(PollTestCase):
+    def add_notifications(self, count):
+        return send_notifications(
+            build_notification(
+                campaign=self.campaign, recipient=self.fixture.players[0],
+                notification_type='system', title=f'Aviso {index}', message='',
+            )
+            for index in range(count)
+        )
+
+    def test_cursor_round_trip(self):
+        old = self.add_notification()
+        cursor = self.player.get(self.url).data['cursor']
+        self.assertEqual(cursor, f'{old.id}.0.0')
+
+        response = self.player.get(self.url, {'cursor': cursor})
+        self.assertEqual((response.data['notifications'], response.data['roll_requests']), ([], []))
+        self.assertEqual(response.data['cursor'], cursor)
+
+        new = self.add_notification()
+        request = self.add_roll_request()
+        response = self.player.get(self.url, {'cursor': cursor})
+        self.assertEqual([item['id'] for item in response.data['notifications']], [new.id])
+        self.assertEqual([item['id'] for item in response.data['roll_requests']], [request.id])
+        self.assertEqual(response.data['cursor'], f'{new.id}.0.{request.id}')
+
+    def test_master_cursor_tracks_rolls(self):
+        cursor = self.master.get(self.url).data['cursor']
+        roll = self.add_roll()
+        response = self.master.get(self.url, {'cursor': cursor})
+        self.assertEqual([item['id'] for item in response.data['recent_rolls']], [roll.id])
+        self.assertEqual(response.data['cursor'].split('.')[1], str(roll.id))
+
+    def test_has_more_pages_without_gaps(self):
+        cursor = self.player.get(self.url).data['cursor']
+        created = self.add_notifications(POLL_DELTA_LIMIT + 5)
+
+        seen = []
+        pages = []
+        while True:
+            response = self.player.get(self.url, {'cursor': cursor})
+            # Cada página vem do mais novo para o mais antigo
+            ids = [item['id'] for item in response.data['notifications']]
+            self.assertEqual(ids, sorted(ids, reverse=True))
+            seen += ids
+            pages.append((len(ids), response.data['has_more']))
+            cursor = response.data['cursor']
+            if not response.data['has_more']:
+                break
+        self.assertEqual(pages, [(POLL_DELTA_LIMIT, True), (5, False)])
+        self.assertEqual(sorted(seen), sorted(notification.id for notification in created))
+
+    def test_malformed_cursor_returns_400(self):
+        for cursor in ('abc', '1.2', '1.2.3.4', '1.-2.3', '1..3'):
+            self.assertEqual(self.player.get(self.url, {'cursor': cursor}).status_code, 400, cursor)
+
+    def test_since_accepts_what_the_filter_always_accepted(self):
+        for since in ('2026-10-17T20:00:00Z', '2026-10-17 20:00', '2026-10-17'):
+            response = self.player.get(self.url, {'since': since})
+            self.assertEqual(response.status_code, 200, since)
+        self.assertEqual(self.player.get(self.url, {'since': 'ontem'}).status_code, 400)
+        # O cursor tem precedência: since inválido é ignorado
+        self.assertEqual(self.player.get(self.url, {'since': 'ontem', 'cursor': '0.0.0'}).status_code, 200)
+
+    def test_since_filters_older_notifications(self):
+        old = self.add_notification()
+        Notification.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=2))
+        new = self.add_notification()
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+        response = self.player.get(self.url, {'since': since})
+        self.assertEqual([item['id'] for item in response.data['notifications']], [new.id])
+
+
+# ============== ROLAGENS EM LOTE ==============
+
+class RollFateTests(SimpleTestCase):
+    def test_seeded_rng_is_reproducible(self):
+        first = roll_fate(20, random.Random(7))
+        self.assertEqual(first, roll_fate(20, random.Random(7)))
+        self.assertEqual(len(first), 20)
+        self.assertTrue(all(len(dice) == 4 and set(dice) <= set(FATE_FACES) for dice in first))
+
+
+class DiceRollBatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.fixture = build_table(players=3, npcs=1)
+        self.campaign = self.fixture.campaign
+        self.characters = self.fixture.characters
+        self.master = APIClient()
+        self.master.force_authenticate(self.fixture.master)
+        self.loop = asyncio.new_event_loop()
+        self.subscriber = broker.subscribe(self.campaign.id, user_id=self.fixture.master.id, is_master=True, loop=self.loop)
+
+    def tearDown(self):
+        broker.unsubscribe(self.subscriber)
+        self.loop.close()
+
+    def batch(self, body):
+        return self.master.post('/api/rolls/batch/', body, format='json')
+
+    def published_rolls(self):
+        self.loop.run_until_complete(asyncio.sleep(0))
+        events = []
+        while not self.subscriber.queue.empty():
+            events.append(self.subscriber.queue.get_nowait())
+        return [event for event in events if event.event_type == EVENT_ROLL]
+
+    def test_seeded_create_dice_rolls_repeats_the_dice(self):
+        specs = [RollSpec(character=character) for character in self.characters]
+        dice = [
+            [(roll.dice_1, roll.dice_2, roll.dice_3, roll.dice_4) for roll in create_dice_rolls(specs, random.Random(3))]
+            for _ in range(2)
+        ]
+        self.assertEqual(dice[0], dice[1])
+        self.assertEqual(DiceRoll.objects.filter(campaign=self.campaign).count(), 2 * len(specs))
+
+    def test_one_insert_and_one_event_per_roll_after_commit(self):
+        body = {'rolls': [{'character_id': character.id} for character in self.characters]}
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with CaptureQueriesContext(connection) as captured:
+                response = self.batch(body)
+            # Nada sai pelo broker antes do commit
+            self.assertEqual(self.published_rolls(), [])
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertTrue(callbacks)
+
+        inserts = [query['sql'] for query in captured.captured_queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(sum(sql.startswith('INSERT INTO "api_diceroll"') for sql in inserts), 1)
+        self.assertEqual(sum(sql.startswith('INSERT INTO "api_notification"') for sql in inserts), 1)
+        published = self.published_rolls()
+        self.assertEqual(
+            sorted(event.data['id'] for event in published), sorted(roll['id'] for roll in response.data),
+        )
+
+    def test_count_rolls_the_same_character(self):
+        response = self.batch({'character_id': self.characters[0].id, 'count': 5})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual({roll['character'] for roll in response.data}, {self.characters[0].id})
+        self.assertEqual(len(response.data), 5)
+
+    def test_batch_size_limit(self):
+        character_id = self.characters[0].id
+        self.assertEqual(self.batch({'character_id': character_id, 'count': 101}).status_code, 400)
+        self.assertEqual(self.batch({'rolls': [{'character_id': character_id}] * 101}).status_code, 400)
+        self.assertEqual(self.batch({'rolls': []}).status_code, 400)
+        self.assertFalse(DiceRoll.objects.exists())
+        self.assertEqual(self.batch({'rolls': [{'character_id': character_id}] * 100}).status_code, 201)
+
+    def test_only_the_master_rolls_in_batch(self):
+        player = APIClient()
+        player.force_authenticate(self.fixture.players[0])
+        response = player.post('/api/rolls/batch/', {'character_id': self.characters[0].id}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_fate_point_shortage_rolls_back_the_batch(self):
+        character = self.characters[0]
+        Character.objects.filter(pk=character.pk).update(fate_points=1)
+        response = self.batch({'rolls': [{'character_id': character.id, 'use_fate_point': True}] * 2})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(DiceRoll.objects.exists())
+        character.refresh_from_db(fields=['fate_points'])
+        self.assertEqual(character.fate_points, 1)
+
+
+# ============== SERVIR MÍDIA ==============
+
+class ServeMediaTests(SimpleTestCase):
+    content = b'0123456789abcdef'
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.media_root = os.path.join(root.name, 'media')
+        os.makedirs(os.path.join(self.media_root, 'notas'))
+        with open(os.path.join(self.media_root, 'notas', 'mapa.txt'), 'wb') as fh:
+            fh.write(self.content)
+        with open(os.path.join(root.name, 'segredo.txt'), 'wb') as fh:
+            fh.write(b'fora do MEDIA_ROOT')
+        self.enterContext(self.settings(MEDIA_ROOT=self.media_root))
+        self.url = '/media/notas/mapa.txt'
+
+    def get(self, url=None, **headers):
+        response = self.client.get(url or self.url, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        if hasattr(response, 'close'):
+            response.close()
+        return response, body
+
+    def test_full_file(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'], 'public, no-cache')
+
+    def test_range(self):
+        response, body = self.get(Range='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/16')
+        self.assertEqual(response['Content-Length'], '4')
+
+    def test_suffix_range(self):
+        response, body = self.get(Range='bytes=-3')
+        self.assertEqual((response.status_code, body), (206, b'def'))
+        self.assertEqual(response['Content-Range'], 'bytes 13-15/16')
+        # Sufixo maior que o arquivo: o arquivo inteiro
+        response, body = self.get(Range='bytes=-100')
+        self.assertEqual((body, response['Content-Range']), (self.content, 'bytes 0-15/16'))
+
+    def test_open_ended_range(self):
+        response, body = self.get(Range='bytes=10-')
+        self.assertEqual((response.status_code, body), (206, b'abcdef'))
+        self.assertEqual(response['Content-Range'], 'bytes 10-15/16')
+        # Fim além do arquivo é cortado
+        response, body = self.get(Range='bytes=14-99')
+        self.assertEqual((body, response['Content-Range']), (b'ef', 'bytes 14-15/16'))
+
+    def test_unsatisfiable_range(self):
+        for header in ('bytes=16-', 'bytes=5-2', 'bytes=-0'):
+            response, _ = self.get(Range=header)
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response['Content-Range'], 'bytes */16')
+
+    def test_unsupported_range_sends_the_whole_file(self):
+        for header in ('bytes=0-1,4-5', 'linhas=1-2', 'bytes=-'):
+            response, body = self.get(Range=header)
+            self.assertEqual((response.status_code, body), (200, self.content), header)
+
+    def test_stale_if_range_sends_the_whole_file(self):
+        response, body = self.get(Range='bytes=0-1', **{'If-Range': '"outro"'})
+        self.assertEqual((response.status_code, body), (200, self.content))
+
+    def test_if_none_match(self):
+        etag = self.get()[0]['ETag']
+        response, body = self.get(**{'If-None-Match': etag})
+        self.assertEqual((response.status_code, body), (304, b''))
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.get(**{'If-None-Match': '"outro"'})[0].status_code, 200)
+
+    def test_hashed_names_are_immutable(self):
+        name = f'blobs/ab/{"ab" * 32}.txt'
+        os.makedirs(os.path.join(self.media_root, 'blobs', 'ab'))
+        with open(os.path.join(self.media_root, name), 'wb') as fh:
+            fh.write(self.content)
+        response, _ = self.get(f'/media/{name}')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['ETag'], f'"{"ab" * 32}"')
+
+    def test_path_traversal_is_rejected(self):
+        for url in ('/media/../segredo.txt', '/media/notas/../../segredo.txt', '/media/%2e%2e/segredo.txt'):
+            response, body = self.get(url)
+            self.assertEqual(response.status_code, 404, url)
+            self.assertNotIn(b'fora do MEDIA_ROOT', body)
+        self.assertEqual(self.get('/media/notas')[0].status_code, 404)
+
+
+# ============== PAGINAÇÃO POR CURSOR ==============
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.fixture = build_table(players=2, npcs=0)
+        self.campaign = self.fixture.campaign
+        self.url = f'/api/rolls/?campaign={self.campaign.id}'
+        self.master = APIClient()
+        self.master.force_authenticate(self.fixture.master)
+
+        rolls = [
+            DiceRoll.objects.create(
+                character=self.fixture.characters[index % 2], campaign=self.campaign,
+                dice_1=0, dice_2=0, dice_3=0, dice_4=0, dice_total=0, final_total=0,
+            )
+            for index in range(11)
+        ]
+        # Vários com o mesmo created_at: o id desempata
+        now = timezone.now()
+        timestamps = [now] * 5 + [now - timedelta(minutes=1)] * 4 + [now - timedelta(minutes=2)] * 2
+        for roll, created_at in zip(rolls, timestamps):
+            DiceRoll.objects.filter(pk=roll.pk).update(created_at=created_at)
+        self.expected = list(
+            DiceRoll.objects.filter(campaign=self.campaign).order_by('-created_at', '-pk').values_list('pk', flat=True)
+        )
+
+    def test_pages_have_no_gaps_or_duplicates(self):
+        for page_size in (1, 3, 4, 5):
+            seen = []
+            response = self.master.get(f'{self.url}&page_size={page_size}')
+            while True:
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(len(response.data['results']), page_size)
+                seen += [roll['id'] for roll in response.data['results']]
+                if response.data['cursor'] is None:
+                    self.assertIsNone(response.data['next'])
+                    break
+                response = self.master.get(f'{self.url}&page_size={page_size}&cursor={response.data["cursor"]}')
+            self.assertEqual(seen, self.expected, page_size)
+
+    def test_without_cursor_or_page_size_lists_as_before(self):
+        response = self.master.get(self.url)
+        self.assertEqual([roll['id'] for roll in response.data], self.expected)
+
+    def test_tampered_cursor_returns_400(self):
+        for cursor in ('nada', 'bm9wZQ==', 'WzEsIDJd', 'WyJvbnRlbSIsIDFd', 'WyIyMDI2LTEwLTE3IiwgIngiXQ=='):
+            response = self.master.get(f'{self.url}&cursor={cursor}')
+            self.assertEqual(response.status_code, 400, cursor)
+
+
+# ============== CONTADORES DE NOTIFICAÇÃO ==============
+
+class NotificationCounterTests(TestCase):
+    def setUp(self):
+        self.fixture = build_table(players=2, npcs=0)
+        self.other = build_table(name='Outra', players=1, npcs=0)
+        self.campaigns = [self.fixture.campaign, self.other.campaign]
+        self.users = [*self.fixture.players, self.fixture.master]
+        self.player = self.fixture.players[0]
+        self.client = APIClient()
+        self.client.force_authenticate(self.player)
+
+    def send(self, campaign, recipients, times=1):
+        return send_notifications([
+            build_notification(
+                campaign=campaign, recipient=recipient,
+                notification_type='system', title='Aviso', message='Algo mudou',
+            )
+            for recipient in recipients
+            for _ in range(times)
+        ])
+
+    def assertCountersMatch(self, step):
+        for user in self.users:
+            for campaign in self.campaigns:
+                live = Notification.objects.filter(recipient=user, campaign=campaign, is_read=False).count()
+                counter = NotificationCounter.objects.filter(user=user, campaign=campaign).first()
+                self.assertEqual(counter.unread if counter else 0, live, (step, user.username, campaign.id))
+                self.assertEqual(get_unread_count(user, campaign.id), live, (step, user.username, campaign.id))
+            live = Notification.objects.filter(recipient=user, is_read=False).count()
+            self.assertEqual(get_unread_count(user), live, (step, user.username))
+
+    def test_counters_follow_the_notification_lifecycle(self):
+        first = self.send(self.fixture.campaign, self.users, times=3)[0]
+        self.send(self.other.campaign, [self.player], times=2)
+        self.assertCountersMatch('send')
+
+        response = self.client.post(f'/api/notifications/{first.id}/mark_read/')
+        self.assertEqual(response.status_code, 200)
+        self.assertCountersMatch('mark_read')
+        # Marcar de novo não desconta duas vezes
+        self.client.post(f'/api/notifications/{first.id}/mark_read/')
+        self.assertCountersMatch('mark_read again')
+
+        response = self.client.patch(f'/api/notifications/{first.id}/', {'is_read': False}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertCountersMatch('unread via patch')
+
+        response = self.client.post(
+            '/api/notifications/mark_all_read/', {'campaign_id': self.fixture.campaign.id}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertCountersMatch('mark_all_read campaign')
+
+        self.client.post('/api/notifications/mark_all_read/')
+        self.assertCountersMatch('mark_all_read')
+
+        self.send(self.fixture.campaign, [self.player])
+        for notification in Notification.objects.filter(recipient=self.player):
+            response = self.client.delete(f'/api/notifications/{notification.id}/')
+            self.assertEqual(response.status_code, 204)
+            self.assertCountersMatch(f'delete {notification.id}')
+
+    def test_unread_count_endpoint_uses_counters(self):
+        self.send(self.fixture.campaign, [self.player], times=2)
+        self.send(self.other.campaign, [self.player])
+        response = self.client.get(f'/api/notifications/unread_count/?campaign={self.fixture.campaign.id}')
+        self.assertEqual(response.data, {'count': 2})
+        response = self.client.get('/api/notifications/unread_count/')
+        self.assertEqual(response.data, {'count': 3})
+
+
+# ============== RETENÇÃO DE NOTIFICAÇÕES ==============
+
+class PruneNotificationsTests(TestCase):
+    def setUp(self):
+        self.fixture = build_table(players=2, npcs=0)
+        self.campaign = self.fixture.campaign
+        self.alice, self.bob = self.fixture.players
+        # Meio-dia no fuso local: TruncDate agrupa pelo dia da sessão
+        noon = timezone.localtime().replace(hour=12, minute=0, second=0, microsecond=0)
+        self.day_one = noon - timedelta(days=40)
+        self.day_two = noon - timedelta(days=39)
+        self.before = noon - timedelta(days=30)
+        Session.objects.create(campaign=self.campaign, date=self.day_one.date())
+
+    def add(self, recipient, created_at, notification_type='roll', is_read=True):
+        notification = Notification.objects.create(
+            campaign=self.campaign, recipient=recipient, notification_type=notification_type,
+            title='Rolagem', message='Rolou os dados', is_read=is_read,
+        )
+        Notification.objects.filter(pk=notification.pk).update(created_at=created_at)
+        return notification.pk
+
+    def add_history(self):
+        """Retorna os ids que devem sumir e os que devem ficar"""
+        pruned = [
+            self.add(self.alice, self.day_one + timedelta(minutes=minute)) for minute in range(3)
+        ] + [
+            self.add(self.alice, self.day_two),
+            self.add(self.bob, self.day_one),
+            self.add(self.bob, self.day_one + timedelta(minutes=5)),
+            self.add(self.alice, self.day_one, notification_type='system'),
+        ]
+        kept = [
+            self.add(self.alice, self.day_one, is_read=False),
+            self.add(self.alice, self.day_one, notification_type='system', is_read=False),
+            self.add(self.alice, timezone.now() - timedelta(days=1)),
+            self.add(self.bob, self.day_one, notification_type='digest'),
+        ]
+        return pruned, kept
+
+    def test_read_rolls_become_one_digest_per_recipient_campaign_and_day(self):
+        pruned, kept = self.add_history()
+
+        report = prune_notifications(before=self.before, batch_size=2)
+
+        self.assertEqual(report, {'digests_created': 3, 'digested': 6, 'deleted': 7})
+        self.assertFalse(Notification.objects.filter(pk__in=pruned).exists())
+        self.assertEqual(Notification.objects.filter(pk__in=kept).count(), len(kept))
+
+        digests = Notification.objects.filter(notification_type='digest').exclude(pk__in=kept)
+        by_key = {(digest.recipient_id, timezone.localtime(digest.created_at).date()): digest for digest in digests}
+        self.assertEqual(len(by_key), digests.count())
+        alice_one = by_key[self.alice.id, self.day_one.date()]
+        self.assertEqual(alice_one.title, f'Sessão de {self.day_one:%d/%m/%Y}')
+        self.assertEqual(alice_one.message, '3 notificações de rolagem resumidas.')
+        self.assertEqual(alice_one.created_at, self.day_one + timedelta(minutes=2))
+        self.assertTrue(alice_one.is_read)
+        alice_two = by_key[self.alice.id, self.day_two.date()]
+        self.assertEqual(alice_two.title, f'Rolagens de {self.day_two:%d/%m/%Y}')
+        self.assertEqual(alice_two.message, '1 notificação de rolagem resumida.')
+        bob_one = by_key[self.bob.id, self.day_one.date()]
+        self.assertEqual(bob_one.message, '2 notificações de rolagem resumidas.')
+        self.assertEqual(bob_one.created_at, self.day_one + timedelta(minutes=5))
+
+        # Os resumos não são apagados nem resumidos de novo
+        self.assertEqual(
+            prune_notifications(before=self.before), {'digests_created': 0, 'digested': 0, 'deleted': 0},
+        )
+
+    def test_without_digest_deletes_rolls_too(self):
+        pruned, kept = self.add_history()
+
+        report = prune_notifications(before=self.before, digest=False)
+
+        self.assertEqual(report, {'digests_created': 0, 'digested': 0, 'deleted': 7})
+        self.assertEqual(set(Notification.objects.values_list('pk', flat=True)), set(kept))
+
+    def test_command_archives_removed_rows_as_jsonl(self):
+        pruned, kept = self.add_history()
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'notificacoes.jsonl')
+
+        out = io.StringIO()
+        call_command('prune_notifications', '--archive', path, '--batch-size', '2', stdout=out)
+
+        self.assertIn('7 notificações removidas (6 de rolagem em 3 resumos)', out.getvalue())
+        with open(path, encoding='utf-8') as archive:
+            rows = [json.loads(line) for line in archive]
+        self.assertEqual(sorted(row['id'] for row in rows), sorted(pruned))
+        self.assertEqual(set(rows[0]), set(ARCHIVE_FIELDS))
+        self.assertTrue(all(row['is_read'] for row in rows))
+        self.assertFalse(Notification.objects.filter(pk__in=pruned).exists())
+        self.assertEqual(Notification.objects.filter(pk__in=kept).count(), len(kept))
+
+    def test_command_rejects_invalid_options(self):
+        for args in (['--days', '-1'], ['--batch-size', '0']):
+            with self.assertRaises(CommandError):
+                call_command('prune_notifications', *args, stdout=io.StringIO())
+
+
+# ============== TILES DO MAPA ==============
+
+def png_bytes(width, height):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (40, 90, 160)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class ViewportTilesTests(SimpleTestCase):
+    # 600x300: zoom 2 = 3x2 tiles, zoom 1 = 300x150 (2x1), zoom 0 = 150x75 (1x1)
+    tileset = MapTileSet(source_hash='abc', width=600, height=300, tile_size=256, max_zoom=2)
+
+    def coords(self, zoom, *bounds):
+        return [(x, y) for x, y, _ in viewport_tiles(self.tileset, zoom, *bounds)]
+
+    def test_levels(self):
+        self.assertEqual(max_zoom_for(600, 300), 2)
+        self.assertEqual(max_zoom_for(256, 256), 0)
+        self.assertEqual(max_zoom_for(257, 10), 1)
+        self.assertEqual([level_size(self.tileset, zoom) for zoom in range(3)], [(150, 75), (300, 150), (600, 300)])
+
+    def test_tiles_covering_the_viewport(self):
+        self.assertEqual(self.coords(2, 300, 0, 520, 100), [(1, 0), (2, 0)])
+        self.assertEqual(self.coords(2, 0, 260, 10, 300), [(0, 1)])
+        # No zoom 1 cada tile cobre 512 px do original
+        self.assertEqual(self.coords(1, 300, 0, 520, 100), [(0, 0), (1, 0)])
+        self.assertEqual(self.coords(0, 300, 0, 520, 100), [(0, 0)])
+        self.assertEqual(
+            viewport_tiles(self.tileset, 2, 0, 0, 1, 1), [(0, 0, 'tiles/abc/2/0/0.webp')],
+        )
+
+    def test_edges_are_clamped(self):
+        # A borda direita/inferior é exclusiva
+        self.assertEqual(self.coords(2, 0, 0, 512, 256), [(0, 0), (1, 0)])
+        everything = [(x, y) for y in range(2) for x in range(3)]
+        self.assertEqual(self.coords(2, -1000, -1000, 10000, 10000), everything)
+        self.assertEqual(self.coords(0, -1000, -1000, 10000, 10000), [(0, 0)])
+        self.assertEqual(self.coords(2, 5000, 0, 6000, 300), [])
+        self.assertEqual(self.coords(2, 0, -500, 600, -100), [])
+
+    def test_too_many_tiles_raises(self):
+        huge = MapTileSet(source_hash='abc', width=256 * 30, height=256 * 30, tile_size=256, max_zoom=5)
+        with self.assertRaises(ValueError):
+            viewport_tiles(huge, 5, 0, 0, huge.width, huge.height)
+        self.assertEqual(len(viewport_tiles(huge, 4, 0, 0, huge.width, huge.height)), 15 * 15)
+
+
+class MapTilesTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(self.settings(MEDIA_ROOT=media_root.name, IMAGE_DERIVATIVE_WORKERS=0))
+        self.fixture = build_table(players=1, npcs=0)
+        self.campaign = self.fixture.campaign
+        self.url = f'/api/campaigns/{self.campaign.id}/map_tiles/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.fixture.players[0])
+
+    def upload_map(self, width=600, height=300):
+        # IMAGE_DERIVATIVE_WORKERS=0: o fatiamento roda nos on_commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.campaign.map_image.save('mapa.png', ContentFile(png_bytes(width, height)))
+        return MapTileSet.objects.get(source_name=self.campaign.map_image.name)
+
+    def test_pyramid_has_one_level_per_halving(self):
+        tileset = self.upload_map()
+
+        self.assertEqual((tileset.width, tileset.height, tileset.max_zoom), (600, 300, 2))
+        root = default_storage.path(f'tiles/{tileset.source_hash}')
+        counts = {
+            zoom: sum(len(files) for _, _, files in os.walk(os.path.join(root, str(zoom))))
+            for zoom in range(3)
+        }
+        self.assertEqual(counts, {0: 1, 1: 2, 2: 6})
+        # Tiles da borda são cortados no tamanho do mapa
+        with Image.open(os.path.join(root, '2', '2', '1.webp')) as tile:
+            self.assertEqual(tile.size, (600 - 512, 300 - 256))
+        with Image.open(os.path.join(root, '0', '0', '0.webp')) as tile:
+            self.assertEqual(tile.size, (150, 75))
+
+    def test_same_content_is_sliced_once(self):
+        first = self.upload_map()
+        name = default_storage.save('outro-mapa.png', ContentFile(png_bytes(600, 300)))
+        with mock.patch('api.tiles._slice') as slice_:
+            generate_tiles(name)
+        slice_.assert_not_called()
+        second = MapTileSet.objects.get(source_name=name)
+        self.assertEqual((second.source_hash, second.max_zoom), (first.source_hash, first.max_zoom))
+
+    def test_endpoint_describes_pyramid_and_lists_viewport_tiles(self):
+        self.assertEqual(self.client.get(self.url).data, {'status': 'none'})
+        with self.captureOnCommitCallbacks():
+            self.campaign.map_image.save('mapa.png', ContentFile(png_bytes(600, 300)))
+        self.assertEqual(self.client.get(self.url).data['status'], 'processing')
+        generate_tiles(self.campaign.map_image.name)
+        tileset = MapTileSet.objects.get(source_name=self.campaign.map_image.name)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['status'], 'ready')
+        self.assertEqual((response.data['width'], response.data['max_zoom']), (600, 2))
+        self.assertNotIn('tiles', response.data)
+
+        response = self.client.get(self.url, {'zoom': 2, 'left': 300, 'top': 0, 'right': 520, 'bottom': 100})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['level_width'], response.data['level_height']), (600, 300))
+        self.assertEqual([(tile['x'], tile['y']) for tile in response.data['tiles']], [(1, 0), (2, 0)])
+        self.assertTrue(response.data['tiles'][0]['url'].endswith(f'tiles/{tileset.source_hash}/2/1/0.webp'))
+
+        # Sem retângulo: o mapa inteiro; fora do mapa: nada
+        response = self.client.get(self.url, {'zoom': 1})
+        self.assertEqual(len(response.data['tiles']), 2)
+        response = self.client.get(self.url, {'zoom': 2, 'left': -900, 'top': -900, 'right': 9000, 'bottom': 9000})
+        self.assertEqual(len(response.data['tiles']), 6)
+        response = self.client.get(self.url, {'zoom': 2, 'left': 5000, 'right': 6000})
+        self.assertEqual(response.data['tiles'], [])
+
+    def test_endpoint_rejects_bad_viewports(self):
+        self.upload_map()
+        for params in ({'zoom': 3}, {'zoom': -1}, {'zoom': 'x'}, {'zoom': 1, 'left': 'nan'}, {'zoom': 1, 'right': 'inf'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
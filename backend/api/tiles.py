@@ -0,0 +1,144 @@
+"""
+Pirâmide de tiles dos mapas de campanha e de sessão.
+
+Depois do upload (ver signals) o mapa é fatiado em segundo plano em tiles
+WebP de TILE_SIZE px: o zoom máximo é a resolução original e cada nível
+abaixo tem metade da largura e da altura, até caber num tile só (zoom 0).
+Os tiles ficam em ``tiles/<sha256 do mapa>/<z>/<x>/<y>.webp``, então o mesmo
+mapa em várias sessões/campanhas é fatiado uma vez e as URLs podem ficar em
+cache para sempre. O cliente pede só os tiles do viewport (CampaignViewSet.map_tiles).
+"""
+import logging
+import math
+import os
+import shutil
+import uuid
+
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .events import publish_map
+from .images import run_in_background
+from .models import Campaign, MapTileSet, Session
+from .storage import stored_file_hash
+
+logger = logging.getLogger(__name__)
+
+TILE_SIZE = 256
+TILE_QUALITY = 80
+TILES_PREFIX = 'tiles'
+MAX_VIEWPORT_TILES = 400
+
+TILED_FIELDS = {
+    Campaign: ('map_image',),
+    Session: ('map_image',),
+}
+
+
+def tile_name(source_hash, zoom, x, y):
+    return f'{TILES_PREFIX}/{source_hash}/{zoom}/{x}/{y}.webp'
+
+
+def max_zoom_for(width, height, tile_size=TILE_SIZE):
+    zoom = 0
+    while max(width, height) > tile_size * 2 ** zoom:
+        zoom += 1
+    return zoom
+
+
+def level_size(tileset, zoom):
+    """(largura, altura) do mapa no nível ``zoom``"""
+    scale = 2 ** (tileset.max_zoom - zoom)
+    return math.ceil(tileset.width / scale), math.ceil(tileset.height / scale)
+
+
+def _write_level(image, directory, zoom):
+    for x in range(math.ceil(image.width / TILE_SIZE)):
+        column = os.path.join(directory, str(zoom), str(x))
+        os.makedirs(column, exist_ok=True)
+        for y in range(math.ceil(image.height / TILE_SIZE)):
+            box = (
+                x * TILE_SIZE, y * TILE_SIZE,
+                min((x + 1) * TILE_SIZE, image.width), min((y + 1) * TILE_SIZE, image.height),
+            )
+            image.crop(box).save(os.path.join(column, f'{y}.webp'), 'WEBP', quality=TILE_QUALITY, method=4)
+
+
+def generate_tiles(name):
+    """Fatia o mapa ``name`` (já gravado no storage); reaproveita tiles do mesmo conteúdo"""
+    if MapTileSet.objects.filter(source_name=name).exists():
+        return
+    try:
+        source_hash = stored_file_hash(name)
+        directory = default_storage.path(f'{TILES_PREFIX}/{source_hash}')
+        existing = MapTileSet.objects.filter(source_hash=source_hash).first()
+        if existing is not None and os.path.isdir(directory):
+            width, height = existing.width, existing.height
+        else:
+            with default_storage.open(name, 'rb') as fh:
+                image = Image.open(fh)
+                image.load()
+            width, height = _slice(ImageOps.exif_transpose(image), directory)
+    except (FileNotFoundError, UnidentifiedImageError, OSError):
+        logger.warning('Mapa %s não pôde ser fatiado.', name)
+        return
+
+    MapTileSet.objects.get_or_create(
+        source_name=name,
+        defaults={
+            'source_hash': source_hash, 'width': width, 'height': height,
+            'tile_size': TILE_SIZE, 'max_zoom': max_zoom_for(width, height),
+        },
+    )
+    # Os clientes recarregam o mapa e passam a pedir tiles
+    for campaign in Campaign.objects.filter(map_image=name):
+        publish_map(campaign)
+
+
+def _slice(image, directory):
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    width, height = image.size
+    # Fatia num diretório temporário e renomeia: ninguém vê uma pirâmide pela metade
+    staging = default_storage.path(f'{TILES_PREFIX}/.tmp-{uuid.uuid4().hex}')
+    try:
+        level = image
+        for zoom in range(max_zoom_for(width, height), -1, -1):
+            _write_level(level, staging, zoom)
+            if zoom:
+                level = level.resize((math.ceil(level.width / 2), math.ceil(level.height / 2)), Image.LANCZOS)
+        try:
+            os.rename(staging, directory)
+        except OSError:
+            # Outro worker terminou o mesmo mapa antes
+            pass
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return width, height
+
+
+def schedule_tiles(names):
+    for name in {name for name in names if name}:
+        run_in_background(generate_tiles, name)
+
+
+def viewport_tiles(tileset, zoom, left, top, right, bottom):
+    """
+    Tiles do nível ``zoom`` que cobrem o retângulo (coordenadas do mapa em
+    resolução original). Retorna [(x, y, nome)] ou levanta ValueError se
+    passar de MAX_VIEWPORT_TILES.
+    """
+    scale = 2 ** (tileset.max_zoom - zoom)
+    level_width, level_height = level_size(tileset, zoom)
+    columns = math.ceil(level_width / tileset.tile_size)
+    rows = math.ceil(level_height / tileset.tile_size)
+    span = tileset.tile_size * scale
+    first_x, last_x = max(0, int(left // span)), min(columns - 1, int(max(left, right - 1) // span))
+    first_y, last_y = max(0, int(top // span)), min(rows - 1, int(max(top, bottom - 1) // span))
+    if max(0, last_x - first_x + 1) * max(0, last_y - first_y + 1) > MAX_VIEWPORT_TILES:
+        raise ValueError
+    return [
+        (x, y, tile_name(tileset.source_hash, zoom, x, y))
+        for y in range(first_y, last_y + 1)
+        for x in range(first_x, last_x + 1)
+    ]
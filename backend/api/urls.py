@@ -3,9 +3,9 @@ from rest_framework.routers import DefaultRouter
 
 from .views import (
     RegisterView, LoginView, MeView,
-    CampaignViewSet, CampaignPollView,
+    CampaignViewSet, CampaignPollView, CampaignEventStreamView,
     CharacterViewSet, CharacterNoteViewSet,
-    ItemViewSet, DiceRollViewSet, NotificationViewSet,
+    ItemViewSet, ItemTradeViewSet, DiceRollViewSet, NotificationViewSet,
     SkillViewSet, AbilityViewSet, AdvantageViewSet, PersonalityTraitViewSet,
     BleachSpellViewSet,
     StandViewSet, CursedTechniqueViewSet, ZanpakutoViewSet, PowerIdeaViewSet, SkillIdeaViewSet,
@@ -17,6 +17,7 @@ router.register('campaigns', CampaignViewSet, basename='campaign')
 router.register('characters', CharacterViewSet, basename='character')
 router.register('notes', CharacterNoteViewSet, basename='note')
 router.register('items', ItemViewSet, basename='item')
+router.register('item-trades', ItemTradeViewSet, basename='item-trade')
 router.register('rolls', DiceRollViewSet, basename='roll')
 router.register('notifications', NotificationViewSet, basename='notification')
 router.register('messages', MessageViewSet, basename='message')
@@ -40,6 +41,7 @@ urlpatterns = [
     
     # Polling
     path('campaigns/<int:campaign_id>/poll/', CampaignPollView.as_view(), name='campaign-poll'),
+    path('campaigns/<int:campaign_id>/events/', CampaignEventStreamView.as_view(), name='campaign-events'),
     
     # Router
     path('', include(router.urls)),
@@ -1,63 +1,91 @@
+import asyncio
+import hashlib
+import math
+import mimetypes
+import os
 import random
+import re
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
+from django.core import signing
+from django.core.exceptions import SuspiciousFileOperation, ValidationError as DjangoValidationError
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
 from django.db import transaction, models
+from django.db.models.functions import Coalesce
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse,
+)
 from django.utils import timezone
+from django.utils.cache import parse_etags, quote_etag
+from django.utils.http import http_date, parse_http_date_safe
+from django.views import View
+from django.views.decorators.http import require_safe
 from rest_framework import status, viewsets
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import action
-from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from .catalogs import CachedCatalogMixin
+from .dice import RollSpec, change_fate_points, create_dice_rolls
+from .events import (
+    EVENT_RESYNC, broker, publish_map, publish_map_patch, publish_projection, publish_roll_requests,
+)
+from .jsonpatch import apply_patch, map_patches_since, remember_map_patch
+from .notifications import (
+    add_unread, build_notification, get_unread_count, mark_notifications_read, notify, remove_unread,
+    send_notifications,
+)
+from .pagination import HistoryPaginationMixin
+from .permissions import get_authorization_context
+from .roll_stats import roll_stats
+from .storage import is_immutable
+from .tiles import level_size, viewport_tiles
 from .models import (
     Profile, Campaign, CampaignBan, Character, CharacterNote, Item, RollRequest,
     Skill, Ability, Advantage, PersonalityTrait,
     BleachSpell, CharacterBleachSpell, BleachSpellOffer,
     Stand, CursedTechnique, Zanpakuto, PowerIdea, SkillIdea,
-    DiceRoll, Notification, ItemTrade, Session, Message
+    DiceRoll, Notification, NotificationCounter, ItemTrade, Session, Message, MapTileSet,
 )
 from .serializers import (
     RegisterSerializer, UserSerializer,
     CampaignSerializer, CampaignListSerializer, ProjectionSerializer, CampaignMapSerializer,
     CharacterPublicSerializer, CharacterMasterSerializer,
+    CharacterSummarySerializer, CharacterMasterSummarySerializer,
     CharacterCreateSerializer, CharacterStatsUpdateSerializer,
     CharacterNoteSerializer, ItemSerializer, ItemTransferSerializer,
     SkillSerializer, SkillPublicSerializer, AbilitySerializer, AdvantageSerializer, PersonalityTraitSerializer,
     PersonalityTraitPublicSerializer, SkillIdeaSerializer, MessageSerializer,
     BleachSpellSerializer, BleachSpellOfferSerializer,
     StandSerializer, CursedTechniqueSerializer, CursedTechniquePublicSerializer, ZanpakutoSerializer, PowerIdeaSerializer,
-    DiceRollSerializer, DiceRollMasterSerializer, DiceRollCreateSerializer, RollRequestSerializer,
+    DiceRollSerializer, DiceRollMasterSerializer, DiceRollCreateSerializer, DiceRollBatchSerializer,
+    RollRequestSerializer, RollGroupRequestSerializer,
     NotificationSerializer, ItemTradeSerializer, SessionSerializer,
 )
 
 
 def is_game_master(user):
     """Verifica se o usuário é mestre"""
-    if not user or not user.is_authenticated:
-        return False
-    if user.is_staff or user.is_superuser:
-        return True
-    try:
-        return user.profile.is_game_master
-    except Profile.DoesNotExist:
-        return False
+    return get_authorization_context(user).is_game_master
 
 
 def is_campaign_master(user, campaign):
     """Verifica se o usuário é o mestre da campanha específica"""
-    return campaign.owner_id == user.id or is_game_master(user)
+    return get_authorization_context(user).is_campaign_master(campaign)
 
 
 def is_user_banned_from_campaign(user, campaign):
     if not user or not user.is_authenticated:
         return False
-    return CampaignBan.objects.filter(
-        campaign=campaign,
-        user=user,
-        is_active=True,
-    ).exists()
+    return get_authorization_context(user).is_banned_from(campaign)
 
 
 def ensure_not_banned(user, campaign):
@@ -71,67 +99,55 @@ def ensure_not_banned(user, campaign):
         raise PermissionDenied('Você foi banido desta campanha.')
 
 
-def create_dice_roll(*, character, skill_id=None, description='', use_fate_point=False):
-    """Cria uma rolagem de dados para um personagem."""
-    # Rolar 4 dados FATE (-1, 0, +1)
-    dice_results = [random.choice([-1, 0, 1]) for _ in range(4)]
-    dice_total = sum(dice_results)
-
-    if use_fate_point:
-        if character.fate_points <= 0:
-            raise ValidationError('Sem fate points disponíveis.')
-        character.fate_points -= 1
-        character.save()
-        dice_results = [1, 1, 1, 1]
-        final_total = 4
-    else:
-        final_total = dice_total
-
-    skill = None
-    hidden_bonus = 0
-    if skill_id:
-        try:
-            skill = Skill.objects.get(id=skill_id)
-        except Skill.DoesNotExist:
-            raise ValidationError('Skill não encontrada.')
-        if skill.campaign_id and skill.campaign_id != character.campaign_id:
-            raise ValidationError('Skill inválida para esta campanha.')
-        hidden_bonus += skill.bonus
-
-        stat_map = {
-            'forca': character.forca,
-            'destreza': character.destreza,
-            'vigor': character.vigor,
-            'inteligencia': character.inteligencia,
-            'sabedoria': character.sabedoria,
-            'carisma': character.carisma,
-        }
-        if skill.use_status.lower() in stat_map:
-            hidden_bonus += stat_map[skill.use_status.lower()]
-            # Bônus de traços de personalidade
-            trait_bonus = character.personality_traits.filter(
-                use_status__iexact=skill.use_status
-            ).aggregate(total=models.Sum('bonus'))['total'] or 0
-            hidden_bonus += trait_bonus
+def _character_prefetches():
+    """Prefetches da ficha, por campo aninhado dos serializers de personagem"""
+    offers = BleachSpellOffer.objects.select_related('chosen_spell').prefetch_related('options')
+    return {
+        'skills': ('skills',),
+        'abilities': ('abilities',),
+        'advantages': ('advantages',),
+        'personality_traits': ('personality_traits',),
+        'items': ('items',),
+        'notes': ('notes__author',),
+        'stands': ('stands__abilities',),
+        'cursed_techniques': ('cursed_techniques__abilities',),
+        'zanpakutos': ('zanpakutos__shikai_abilities', 'zanpakutos__bankai_abilities'),
+        'bleach_spells': ('bleach_spell_links__spell',),
+        'bleach_spell_offers': (
+            models.Prefetch('bleach_spell_offers', queryset=offers),
+            models.Prefetch(
+                'bleach_spell_offers',
+                queryset=offers.filter(is_open=True),
+                to_attr='open_bleach_spell_offers',
+            ),
+        ),
+    }
+
+
+def character_queryset(relations=None):
+    """
+    Personagens com tudo que os serializers de ficha leem pré-carregado.
+
+    ``relations`` limita o prefetch aos campos aninhados que a resposta vai
+    usar (ver SparseFieldsetMixin.requested_relations); None = todos.
+    """
+    lookups = [
+        lookup
+        for name, field_lookups in _character_prefetches().items()
+        if relations is None or name in relations
+        for lookup in field_lookups
+    ]
+    return Character.objects.select_related('campaign', 'owner').prefetch_related(*lookups)
 
-    hidden_total = final_total + hidden_bonus
 
-    roll = DiceRoll.objects.create(
+def create_dice_roll(*, character, skill_id=None, description='', use_fate_point=False):
+    """Cria uma rolagem de dados para um personagem."""
+    return create_dice_rolls([RollSpec(
         character=character,
-        campaign=character.campaign,
-        dice_1=dice_results[0],
-        dice_2=dice_results[1],
-        dice_3=dice_results[2],
-        dice_4=dice_results[3],
-        dice_total=dice_total,
-        used_fate_point=use_fate_point,
-        final_total=final_total,
-        skill_used=skill,
-        description=description or '',
-        hidden_bonus=hidden_bonus,
-        hidden_total=hidden_total,
-    )
-    return roll
+        skill_id=skill_id,
+        description=description,
+        use_fate_point=use_fate_point,
+    )])[0]
 
 
 def get_power_slot_info(character, idea_type):
@@ -152,6 +168,15 @@ def get_power_slot_info(character, idea_type):
     return existing, max_slots, label
 
 
+UNLOCK_NOTIFICATIONS = (
+    ('stand_unlocked', 'Stand Liberado', 'Seu Stand foi liberado. Você já pode criá-lo.'),
+    ('cursed_energy_unlocked', 'Tecnica Inata Liberada', 'Sua tecnica inata foi liberada.'),
+    ('zanpakuto_unlocked', 'Zanpakutou Liberada', 'Sua Zanpakutou foi liberada.'),
+    ('shikai_unlocked', 'Shikai Liberada', 'Sua Shikai foi liberada.'),
+    ('bankai_unlocked', 'Bankai Liberada', 'Sua Bankai foi liberada.'),
+)
+
+
 BLEACH_KIDOU_TIERS = {
     1: {'pa_cost': 4000, 'label': '4.000 P.A'},
     2: {'pa_cost': 8000, 'label': '8.000 P.A'},
@@ -266,18 +291,29 @@ class MeView(APIView):
 
 # ============== CAMPAIGN ==============
 
+def _map_conflict(current_version):
+    return Response(
+        {'detail': 'O mapa foi alterado por outra requisição.', 'map_version': current_version},
+        status=status.HTTP_409_CONFLICT,
+    )
+
+
 class CampaignViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         user = self.request.user
+        # map_data pode ter megabytes: só é lido pelas ações do mapa, sob demanda
+        queryset = Campaign.objects.select_related('owner').defer('map_data').annotate(
+            player_count=models.Count('characters', filter=models.Q(characters__is_npc=False)),
+        ).order_by('-created_at')
         if is_game_master(user):
-            return Campaign.objects.all().order_by('-created_at')
+            return queryset
         # Jogadores podem ver todas as campanhas disponíveis (exceto banidas)
-        return Campaign.objects.exclude(
+        return queryset.exclude(
             bans__user=user,
             bans__is_active=True,
-        ).order_by('-created_at')
+        )
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -453,9 +489,9 @@ class CampaignViewSet(viewsets.ModelViewSet):
             description=description,
         )
 
-        Notification.objects.create(
+        notify(
             campaign=campaign,
-            recipient=character.owner,
+            recipients=[character.owner_id],
             notification_type='system',
             title='Solicitação de rolagem',
             message=f'O mestre solicitou uma rolagem para {character.name}.',
@@ -464,6 +500,109 @@ class CampaignViewSet(viewsets.ModelViewSet):
 
         return Response(RollRequestSerializer(roll_request).data, status=status.HTTP_201_CREATED)
 
+    @action(detail=True, methods=['post'])
+    def request_roll_group(self, request, pk=None):
+        """Mestre solicita a mesma rolagem para vários jogadores (ou todos) de uma vez"""
+        campaign = self.get_object()
+        if not is_campaign_master(request.user, campaign):
+            raise PermissionDenied('Apenas o mestre pode solicitar rolagens.')
+
+        character_ids = request.data.get('character_ids')
+        if not character_ids:
+            raise ValidationError('Informe character_ids (lista ou "all").')
+
+        # Uma query: personagens da campanha cujos donos não estão banidos
+        characters = Character.objects.filter(campaign=campaign, is_npc=False).filter(~models.Exists(
+            CampaignBan.objects.filter(user=models.OuterRef('owner'), campaign=campaign, is_active=True)
+        )).order_by('name')
+        if character_ids != 'all':
+            if not isinstance(character_ids, list):
+                raise ValidationError('character_ids deve ser uma lista ou "all".')
+            try:
+                wanted = {int(character_id) for character_id in character_ids}
+            except (TypeError, ValueError):
+                raise ValidationError('character_ids inválido.')
+            characters = list(characters.filter(id__in=wanted))
+            if len(characters) != len(wanted):
+                raise ValidationError('Personagem não encontrado ou jogador banido desta campanha.')
+        else:
+            characters = list(characters)
+        if not characters:
+            raise ValidationError('Nenhum jogador para solicitar rolagem.')
+
+        skill_id = request.data.get('skill_id')
+        skill = None
+        if skill_id:
+            try:
+                skill = Skill.objects.get(id=skill_id)
+            except Skill.DoesNotExist:
+                raise ValidationError('Skill não encontrada.')
+            if skill.campaign_id and skill.campaign_id != campaign.id:
+                raise ValidationError('Skill inválida para esta campanha.')
+
+        description = request.data.get('description', '')
+        group_id = uuid.uuid4()
+
+        with transaction.atomic():
+            roll_requests = RollRequest.objects.bulk_create(
+                RollRequest(
+                    campaign=campaign,
+                    character=character,
+                    requested_by=request.user,
+                    skill=skill,
+                    description=description,
+                    group_id=group_id,
+                )
+                for character in characters
+            )
+            # bulk_create não dispara post_save
+            publish_roll_requests(roll_requests)
+            send_notifications(
+                build_notification(
+                    campaign=campaign,
+                    recipient=character.owner_id,
+                    notification_type='system',
+                    title='Solicitação de rolagem',
+                    message=f'O mestre solicitou uma rolagem para {character.name}.',
+                    related_character=character,
+                )
+                for character in characters
+            )
+
+        return Response({
+            'group_id': group_id,
+            'requests': RollRequestSerializer(roll_requests, many=True).data,
+        }, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get'], url_path=r'roll_groups/(?P<group_id>[0-9a-f-]+)')
+    def roll_group(self, request, pk=None, group_id=None):
+        """Andamento de um grupo de solicitações (mestre)"""
+        campaign = self.get_object()
+        if not is_campaign_master(request.user, campaign):
+            raise PermissionDenied('Apenas o mestre pode acompanhar solicitações.')
+        try:
+            group_id = uuid.UUID(group_id)
+        except ValueError:
+            raise ValidationError('group_id inválido.')
+
+        roll_requests = RollRequest.objects.filter(
+            campaign=campaign, group_id=group_id,
+        ).select_related('character', 'skill', 'roll').order_by('character__name')
+        totals = roll_requests.aggregate(
+            total=models.Count('id'),
+            completed=models.Count('id', filter=models.Q(is_open=False)),
+        )
+        if not totals['total']:
+            raise NotFound('Grupo não encontrado.')
+
+        return Response({
+            'group_id': group_id,
+            'total': totals['total'],
+            'completed': totals['completed'],
+            'open': totals['total'] - totals['completed'],
+            'requests': RollGroupRequestSerializer(roll_requests, many=True).data,
+        })
+
     @action(detail=True, methods=['post'])
     def complete_roll(self, request, pk=None):
         """Jogador completa uma solicitação de rolagem"""
@@ -485,45 +624,48 @@ class CampaignViewSet(viewsets.ModelViewSet):
             raise PermissionDenied('Esta rolagem não é para você.')
 
         use_fate_point = bool(request.data.get('use_fate_point', False))
-        roll = create_dice_roll(
-            character=roll_request.character,
-            skill_id=roll_request.skill_id,
-            description=roll_request.description,
-            use_fate_point=use_fate_point,
-        )
+        with transaction.atomic():
+            roll = create_dice_roll(
+                character=roll_request.character,
+                skill_id=roll_request.skill_id,
+                description=roll_request.description,
+                use_fate_point=use_fate_point,
+            )
 
-        roll_request.is_open = False
-        roll_request.fulfilled_at = timezone.now()
-        roll_request.fulfilled_by = request.user
-        roll_request.roll = roll
-        roll_request.save()
+            roll_request.is_open = False
+            roll_request.fulfilled_at = timezone.now()
+            roll_request.fulfilled_by = request.user
+            roll_request.roll = roll
+            roll_request.save()
 
-        # Notificar todos os jogadores da campanha e o mestre
-        participant_ids = set(
-            Character.objects.filter(
-                campaign=campaign,
-                is_npc=False,
-            ).values_list('owner_id', flat=True)
-        )
-        participant_ids.add(campaign.owner_id)
-
-        for user_id in participant_ids:
-            if user_id == campaign.owner_id:
-                message = (
-                    f'{roll.character.name} rolou: {roll.final_total} '
-                    f'(Total oculto: {roll.hidden_total})'
-                )
-            else:
-                message = f'{roll.character.name} rolou: {roll.final_total}'
-            Notification.objects.create(
-                campaign=campaign,
-                recipient_id=user_id,
-                notification_type='roll',
-                title='Rolagem de Dados',
-                message=message,
-                related_character=roll.character,
-                related_roll=roll,
+            # Notificar todos os jogadores da campanha e o mestre
+            participant_ids = set(
+                Character.objects.filter(
+                    campaign=campaign,
+                    is_npc=False,
+                ).values_list('owner_id', flat=True)
             )
+            participant_ids.add(campaign.owner_id)
+
+            notifications = []
+            for user_id in participant_ids:
+                if user_id == campaign.owner_id:
+                    message = (
+                        f'{roll.character.name} rolou: {roll.final_total} '
+                        f'(Total oculto: {roll.hidden_total})'
+                    )
+                else:
+                    message = f'{roll.character.name} rolou: {roll.final_total}'
+                notifications.append(build_notification(
+                    campaign=campaign,
+                    recipient=user_id,
+                    notification_type='roll',
+                    title='Rolagem de Dados',
+                    message=message,
+                    related_character=roll.character,
+                    related_roll=roll,
+                ))
+            send_notifications(notifications)
 
         return Response(DiceRollSerializer(roll).data, status=status.HTTP_201_CREATED)
 
@@ -537,6 +679,22 @@ class CampaignViewSet(viewsets.ModelViewSet):
             'projection_updated_at': campaign.projection_updated_at,
         })
 
+    @action(detail=True, methods=['post'])
+    def event_token(self, request, pk=None):
+        """
+        Token assinado e de vida curta para abrir o canal de eventos.
+
+        EventSource não envia headers, então a credencial vai na URL (e nos
+        logs de acesso): em vez do token da API, vai este, que só abre o
+        canal desta campanha e vence em CAMPAIGN_EVENTS_TOKEN_MAX_AGE segundos.
+        """
+        campaign = self.get_object()
+        ensure_not_banned(request.user, campaign)
+        return Response({
+            'token': make_event_stream_token(request.user, campaign.id),
+            'expires_in': settings.CAMPAIGN_EVENTS_TOKEN_MAX_AGE,
+        })
+
     @action(detail=True, methods=['post'])
     def update_projection(self, request, pk=None):
         """Mestre atualiza a projeção"""
@@ -547,17 +705,37 @@ class CampaignViewSet(viewsets.ModelViewSet):
         serializer = ProjectionSerializer(campaign, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
         serializer.save()
+        publish_projection(campaign)
         return Response(serializer.data)
 
     @action(detail=True, methods=['get'])
     def map(self, request, pk=None):
-        """Retorna o mapa atual da campanha"""
+        """
+        Retorna o mapa atual da campanha.
+
+        Com ``?since_version=`` retorna só os patches aplicados depois dessa
+        versão (``patches``), se ainda estiverem no histórico; senão o mapa inteiro.
+        """
         campaign = self.get_object()
         ensure_not_banned(request.user, campaign)
+        since = request.query_params.get('since_version')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                raise ValidationError('Parâmetro since_version inválido.')
+            patches = map_patches_since(campaign.id, since, campaign.map_version)
+            if patches is not None:
+                return Response({
+                    'map_version': campaign.map_version,
+                    'map_updated_at': campaign.map_updated_at,
+                    'patches': patches,
+                })
         return Response({
             'map_image': campaign.map_image.url if campaign.map_image else None,
             'map_data': campaign.map_data or {},
             'map_updated_at': campaign.map_updated_at,
+            'map_version': campaign.map_version,
         })
 
     @action(detail=True, methods=['post'])
@@ -569,20 +747,116 @@ class CampaignViewSet(viewsets.ModelViewSet):
 
         serializer = CampaignMapSerializer(campaign, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        serializer.save(map_version=models.F('map_version') + 1)
+        campaign.refresh_from_db(fields=['map_version'])
+        publish_map(campaign)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['post'])
+    def patch_map(self, request, pk=None):
+        """
+        Mestre aplica um JSON Patch (RFC 6902) ao map_data.
+
+        Corpo: ``{"version": <map_version atual>, "operations": [...]}``. Se o
+        mapa mudou depois dessa versão responde 409 com a versão atual: o
+        cliente se atualiza (``map/?since_version=``) e tenta de novo. Os
+        outros participantes recebem só as operações (evento ``map_patch``).
+        """
+        campaign = self.get_object()
+        if not is_campaign_master(request.user, campaign):
+            raise PermissionDenied('Apenas o mestre pode atualizar o mapa.')
+
+        version = request.data.get('version')
+        if not isinstance(version, int) or isinstance(version, bool):
+            raise ValidationError({'version': 'Informe a versão atual do mapa.'})
+        if version != campaign.map_version:
+            return _map_conflict(campaign.map_version)
+
+        operations = request.data.get('operations')
+        map_data = apply_patch(campaign.map_data or {}, operations)
+        if not isinstance(map_data, dict):
+            raise ValidationError({'operations': 'O mapa deve continuar sendo um objeto.'})
+
+        new_version = version + 1
+        updated_at = timezone.now()
+        # Condicional na versão: dois patches simultâneos não se sobrescrevem
+        updated = Campaign.objects.filter(id=campaign.id, map_version=version).update(
+            map_data=map_data, map_version=new_version, map_updated_at=updated_at,
+        )
+        if not updated:
+            current = Campaign.objects.filter(id=campaign.id).values_list('map_version', flat=True).first()
+            return _map_conflict(current)
+
+        transaction.on_commit(lambda: remember_map_patch(campaign.id, new_version, operations))
+        publish_map_patch(campaign.id, new_version, operations, updated_at)
+        return Response({'map_version': new_version, 'map_updated_at': updated_at})
+
+    @action(detail=True, methods=['get'])
+    def map_tiles(self, request, pk=None):
+        """
+        Tiles do mapa visíveis no viewport.
+
+        Sem ``zoom`` retorna só a descrição da pirâmide. Com ``zoom`` (e
+        opcionalmente ``left``, ``top``, ``right``, ``bottom`` em pixels do mapa
+        original) retorna as URLs dos tiles que cobrem o retângulo.
+        """
+        campaign = self.get_object()
+        ensure_not_banned(request.user, campaign)
+        if not campaign.map_image:
+            return Response({'status': 'none'})
+        tileset = MapTileSet.objects.filter(source_name=campaign.map_image.name).first()
+        if tileset is None:
+            # Ainda fatiando: o cliente usa a imagem inteira até o evento de mapa
+            return Response({'status': 'processing', 'map_image': campaign.map_image.url})
+
+        data = {
+            'status': 'ready',
+            'map_image': campaign.map_image.url,
+            'width': tileset.width,
+            'height': tileset.height,
+            'tile_size': tileset.tile_size,
+            'min_zoom': 0,
+            'max_zoom': tileset.max_zoom,
+        }
+        if 'zoom' not in request.query_params:
+            return Response(data)
+
+        params = request.query_params
+        try:
+            zoom = int(params['zoom'])
+            bounds = [
+                float(params.get(name, default))
+                for name, default in (('left', 0), ('top', 0), ('right', tileset.width), ('bottom', tileset.height))
+            ]
+        except (TypeError, ValueError):
+            raise ValidationError('Parâmetros do viewport inválidos.')
+        if not all(math.isfinite(value) for value in bounds):
+            raise ValidationError('Parâmetros do viewport inválidos.')
+        if not 0 <= zoom <= tileset.max_zoom:
+            raise ValidationError(f'zoom deve estar entre 0 e {tileset.max_zoom}.')
+        try:
+            tiles = viewport_tiles(tileset, zoom, *bounds)
+        except ValueError:
+            raise ValidationError('Viewport grande demais para este zoom; use um zoom menor.')
+
+        data['zoom'] = zoom
+        data['level_width'], data['level_height'] = level_size(tileset, zoom)
+        data['tiles'] = [{'x': x, 'y': y, 'url': default_storage.url(name)} for x, y, name in tiles]
+        return Response(data)
+
     @action(detail=True, methods=['get'])
     def party(self, request, pk=None):
         """Retorna todos os personagens da campanha"""
         campaign = self.get_object()
-        characters = campaign.characters.filter(is_npc=False).order_by('name')
-        
         if is_campaign_master(request.user, campaign):
-            serializer = CharacterMasterSerializer(characters, many=True)
+            serializer_class = CharacterMasterSerializer
         else:
-            serializer = CharacterPublicSerializer(characters, many=True)
-        
+            serializer_class = CharacterPublicSerializer
+
+        characters = character_queryset(
+            serializer_class.requested_relations(request),
+        ).filter(campaign=campaign, is_npc=False).order_by('name')
+        serializer = serializer_class(characters, many=True, context={'request': request})
         return Response(serializer.data)
 
     @action(detail=True, methods=['get'])
@@ -592,8 +866,21 @@ class CampaignViewSet(viewsets.ModelViewSet):
         if not is_campaign_master(request.user, campaign):
             raise PermissionDenied('Apenas o mestre pode ver NPCs.')
         
-        npcs = campaign.characters.filter(is_npc=True).order_by('name')
-        serializer = CharacterMasterSerializer(npcs, many=True)
+        npcs = character_queryset(
+            CharacterMasterSerializer.requested_relations(request),
+        ).filter(campaign=campaign, is_npc=True).order_by('name')
+        serializer = CharacterMasterSerializer(npcs, many=True, context={'request': request})
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def summary(self, request, pk=None):
+        """Resumo leve da mesa: nome, imagem e fate points (status só para o mestre)"""
+        campaign = self.get_object()
+        characters = campaign.characters.select_related('owner').order_by('is_npc', 'name')
+        if is_campaign_master(request.user, campaign):
+            serializer = CharacterMasterSummarySerializer(characters, many=True)
+        else:
+            serializer = CharacterSummarySerializer(characters.filter(is_npc=False), many=True)
         return Response(serializer.data)
 
 
@@ -606,11 +893,11 @@ class CharacterViewSet(viewsets.ModelViewSet):
         user = self.request.user
         campaign_id = self.request.query_params.get('campaign')
         
-        qs = Character.objects.select_related('campaign', 'owner').prefetch_related(
-            'skills', 'abilities', 'advantages', 'personality_traits', 'items', 'notes',
-            'stands', 'zanpakutos', 'cursed_techniques',
-            'bleach_spell_links__spell', 'bleach_spell_offers__options'
-        )
+        serializer_class = self.get_serializer_class()
+        if hasattr(serializer_class, 'requested_relations'):
+            qs = character_queryset(serializer_class.requested_relations(self.request))
+        else:
+            qs = character_queryset()
         
         if campaign_id:
             try:
@@ -659,7 +946,8 @@ class CharacterViewSet(viewsets.ModelViewSet):
         serializer.save(owner=self.request.user, is_npc=is_npc)
 
     def perform_update(self, serializer):
-        character = self.get_object()
+        # O update já carregou a ficha (com os prefetches) em get_object
+        character = serializer.instance
         ensure_not_banned(self.request.user, character.campaign)
         if not is_game_master(self.request.user) and character.owner_id != self.request.user.id:
             raise PermissionDenied('Você não pode editar este personagem.')
@@ -718,51 +1006,18 @@ class CharacterViewSet(viewsets.ModelViewSet):
         serializer.save()
 
         # Notificações de desbloqueio
-        if not prev['stand_unlocked'] and character.stand_unlocked:
-            Notification.objects.create(
-                campaign=character.campaign,
-                recipient=character.owner,
-                notification_type='system',
-                title='Stand Liberado',
-                message='Seu Stand foi liberado. Você já pode criá-lo.',
-                related_character=character,
-            )
-        if not prev['cursed_energy_unlocked'] and character.cursed_energy_unlocked:
-            Notification.objects.create(
+        send_notifications(
+            build_notification(
                 campaign=character.campaign,
-                recipient=character.owner,
+                recipient=character.owner_id,
                 notification_type='system',
-                title='Tecnica Inata Liberada',
-                message='Sua tecnica inata foi liberada.',
-                related_character=character,
-            )
-        if not prev['zanpakuto_unlocked'] and character.zanpakuto_unlocked:
-            Notification.objects.create(
-                campaign=character.campaign,
-                recipient=character.owner,
-                notification_type='system',
-                title='Zanpakutou Liberada',
-                message='Sua Zanpakutou foi liberada.',
-                related_character=character,
-            )
-        if not prev['shikai_unlocked'] and character.shikai_unlocked:
-            Notification.objects.create(
-                campaign=character.campaign,
-                recipient=character.owner,
-                notification_type='system',
-                title='Shikai Liberada',
-                message='Sua Shikai foi liberada.',
-                related_character=character,
-            )
-        if not prev['bankai_unlocked'] and character.bankai_unlocked:
-            Notification.objects.create(
-                campaign=character.campaign,
-                recipient=character.owner,
-                notification_type='system',
-                title='Bankai Liberada',
-                message='Sua Bankai foi liberada.',
+                title=title,
+                message=message,
                 related_character=character,
             )
+            for field, title, message in UNLOCK_NOTIFICATIONS
+            if not prev[field] and getattr(character, field)
+        )
         if is_campaign_master(request.user, character.campaign):
             serializer = CharacterMasterSerializer(character)
         else:
@@ -776,9 +1031,12 @@ class CharacterViewSet(viewsets.ModelViewSet):
         if not is_campaign_master(request.user, character.campaign):
             raise PermissionDenied('Apenas o mestre pode adicionar fate points.')
         
-        amount = request.data.get('amount', 1)
-        character.fate_points += amount
-        character.save()
+        try:
+            amount = int(request.data.get('amount', 1))
+        except (TypeError, ValueError):
+            raise ValidationError('amount inválido.')
+        if not change_fate_points(character, amount):
+            raise ValidationError('Sem fate points disponíveis.')
         return Response({'fate_points': character.fate_points})
 
     @action(detail=True, methods=['post'])
@@ -825,9 +1083,9 @@ class CharacterViewSet(viewsets.ModelViewSet):
         offer.options.set(options)
 
         if character.owner_id != request.user.id:
-            Notification.objects.create(
+            notify(
                 campaign=character.campaign,
-                recipient=character.owner,
+                recipients=[character.owner_id],
                 notification_type='system',
                 title='Novos Kidou Liberados',
                 message='O mestre liberou novos kidous. Escolha 1 entre 3 opções.',
@@ -882,24 +1140,26 @@ class CharacterViewSet(viewsets.ModelViewSet):
             offer.save(update_fields=['is_open', 'chosen_spell', 'chosen_at'])
 
         if character.owner_id == request.user.id and character.campaign.owner_id != request.user.id:
-            Notification.objects.create(
+            notify(
                 campaign=character.campaign,
-                recipient=character.campaign.owner,
+                recipients=[character.campaign.owner_id],
                 notification_type='system',
                 title='Kidou Escolhido',
                 message=f'{character.name} escolheu um kidou.',
                 related_character=character,
             )
         elif character.owner_id != request.user.id:
-            Notification.objects.create(
+            notify(
                 campaign=character.campaign,
-                recipient=character.owner,
+                recipients=[character.owner_id],
                 notification_type='system',
                 title='Kidou Escolhido',
                 message='O mestre definiu seu kidou.',
                 related_character=character,
             )
 
+        # Recarrega: as magias e ofertas pré-carregadas mudaram
+        character = character_queryset().get(pk=character.pk)
         return Response(CharacterMasterSerializer(character).data)
 
     @action(detail=True, methods=['post'])
@@ -909,16 +1169,13 @@ class CharacterViewSet(viewsets.ModelViewSet):
         if character.owner_id != request.user.id and not is_campaign_master(request.user, character.campaign):
             raise PermissionDenied('Este não é seu personagem.')
         
-        if character.fate_points <= 0:
+        if not change_fate_points(character, -1):
             raise ValidationError('Sem fate points disponíveis.')
         
-        character.fate_points -= 1
-        character.save()
-        
         # Notifica o mestre
-        Notification.objects.create(
+        notify(
             campaign=character.campaign,
-            recipient=character.campaign.owner,
+            recipients=[character.campaign.owner_id],
             notification_type='fate',
             title='Fate Point Usado!',
             message=f'{character.name} usou um Fate Point para Mudar o Destino!',
@@ -1101,9 +1358,9 @@ class ItemViewSet(viewsets.ModelViewSet):
                 )
             
             # Notificar o mestre
-            Notification.objects.create(
+            notify(
                 campaign=from_character.campaign,
-                recipient=from_character.campaign.owner,
+                recipients=[from_character.campaign.owner_id],
                 notification_type='trade',
                 title='Troca de Item',
                 message=f'{from_character.name} transferiu {quantity}x {item.name} para {to_character.name}',
@@ -1172,10 +1429,44 @@ class ItemViewSet(viewsets.ModelViewSet):
         return Response(ItemSerializer(item).data)
 
 
+class ItemTradeViewSet(HistoryPaginationMixin, viewsets.ReadOnlyModelViewSet):
+    """Histórico de trocas de itens"""
+    serializer_class = ItemTradeSerializer
+    permission_classes = [IsAuthenticated]
+    history_limit = 100
+
+    def get_queryset(self):
+        user = self.request.user
+        campaign_id = self.request.query_params.get('campaign')
+        character_id = self.request.query_params.get('character')
+        qs = ItemTrade.objects.select_related('item', 'from_character', 'to_character')
+
+        if campaign_id:
+            try:
+                campaign = Campaign.objects.get(id=campaign_id)
+            except (Campaign.DoesNotExist, ValueError):
+                return qs.none()
+            ensure_not_banned(user, campaign)
+            qs = qs.filter(from_character__campaign_id=campaign.id)
+            if not is_campaign_master(user, campaign):
+                qs = qs.filter(models.Q(from_character__owner=user) | models.Q(to_character__owner=user))
+        elif not is_game_master(user):
+            qs = qs.filter(models.Q(from_character__owner=user) | models.Q(to_character__owner=user))
+
+        if character_id:
+            try:
+                character_id = int(character_id)
+            except ValueError:
+                return qs.none()
+            qs = qs.filter(models.Q(from_character_id=character_id) | models.Q(to_character_id=character_id))
+        return qs.order_by('-created_at')
+
+
 # ============== DICE ROLL ==============
 
-class DiceRollViewSet(viewsets.ModelViewSet):
+class DiceRollViewSet(HistoryPaginationMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
+    history_limit = 50
 
     def get_queryset(self):
         campaign_id = self.request.query_params.get('campaign')
@@ -1197,7 +1488,7 @@ class DiceRollViewSet(viewsets.ModelViewSet):
             ensure_not_banned(self.request.user, campaign)
             qs = qs.filter(campaign_id=campaign_id)
         
-        return qs.order_by('-created_at')[:50]
+        return qs.order_by('-created_at')
 
     def get_serializer_class(self):
         if is_game_master(self.request.user):
@@ -1232,9 +1523,9 @@ class DiceRollViewSet(viewsets.ModelViewSet):
         )
         
         # Notificar o mestre
-        Notification.objects.create(
+        notify(
             campaign=character.campaign,
-            recipient=character.campaign.owner,
+            recipients=[character.campaign.owner_id],
             notification_type='roll',
             title='Nova Rolagem',
             message=f'{character.name} rolou: {roll.final_total} (Total oculto: {roll.hidden_total})',
@@ -1245,6 +1536,77 @@ class DiceRollViewSet(viewsets.ModelViewSet):
         serializer = DiceRollMasterSerializer(roll)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Mestre rola para vários personagens (ou várias vezes o mesmo) de uma vez"""
+        batch_serializer = DiceRollBatchSerializer(data=request.data)
+        batch_serializer.is_valid(raise_exception=True)
+        entries = batch_serializer.validated_data['rolls']
+
+        characters = Character.objects.select_related('campaign').in_bulk(
+            {entry['character_id'] for entry in entries}
+        )
+        if len(characters) != len({entry['character_id'] for entry in entries}):
+            raise ValidationError('Personagem não encontrado.')
+        campaigns = {character.campaign for character in characters.values()}
+        if len(campaigns) != 1:
+            raise ValidationError('Todas as rolagens devem ser da mesma campanha.')
+        campaign = campaigns.pop()
+        if not is_campaign_master(request.user, campaign):
+            raise PermissionDenied('Apenas o mestre pode rolar em lote.')
+
+        with transaction.atomic():
+            rolls = create_dice_rolls(
+                RollSpec(
+                    character=characters[entry['character_id']],
+                    skill_id=entry.get('skill_id'),
+                    description=entry.get('description', ''),
+                    use_fate_point=entry.get('use_fate_point', False),
+                )
+                for entry in entries
+            )
+            send_notifications(
+                build_notification(
+                    campaign=campaign,
+                    recipient=campaign.owner_id,
+                    notification_type='roll',
+                    title='Nova Rolagem',
+                    message=f'{roll.character.name} rolou: {roll.final_total} (Total oculto: {roll.hidden_total})',
+                    related_character=roll.character,
+                    related_roll=roll,
+                )
+                for roll in rolls
+            )
+
+        serializer = DiceRollMasterSerializer(rolls, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """Estatísticas de rolagens da campanha (ou de um personagem) para o mestre"""
+        campaign_id = request.query_params.get('campaign')
+        if not campaign_id:
+            raise ValidationError('Informe campaign.')
+        try:
+            campaign = Campaign.objects.get(id=int(campaign_id))
+        except (Campaign.DoesNotExist, ValueError, TypeError):
+            raise ValidationError('Campanha não encontrada.')
+        if not is_campaign_master(request.user, campaign):
+            raise PermissionDenied('Apenas o mestre pode ver as estatísticas.')
+
+        character_id = request.query_params.get('character')
+        if character_id:
+            try:
+                character_id = int(character_id)
+            except (TypeError, ValueError):
+                raise ValidationError('character inválido.')
+            if not Character.objects.filter(id=character_id, campaign=campaign).exists():
+                raise ValidationError('Personagem não encontrado.')
+        else:
+            character_id = None
+
+        return Response(roll_stats(campaign, character_id))
+
     @action(detail=True, methods=['post'])
     def mark_seen(self, request, pk=None):
         """Mestre marca rolagem como vista"""
@@ -1259,9 +1621,10 @@ class DiceRollViewSet(viewsets.ModelViewSet):
 
 # ============== NOTIFICATIONS ==============
 
-class NotificationViewSet(viewsets.ModelViewSet):
+class NotificationViewSet(HistoryPaginationMixin, viewsets.ModelViewSet):
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
+    history_limit = 100
 
     def get_queryset(self):
         campaign_id = self.request.query_params.get('campaign')
@@ -1275,13 +1638,29 @@ class NotificationViewSet(viewsets.ModelViewSet):
             ensure_not_banned(self.request.user, campaign)
             qs = qs.filter(campaign_id=campaign_id)
         
-        return qs.order_by('-created_at')[:100]
+        return qs.order_by('-created_at')
+
+    def perform_update(self, serializer):
+        was_read = serializer.instance.is_read
+        with transaction.atomic():
+            notification = serializer.save()
+            if notification.is_read != was_read:
+                key = (notification.recipient_id, notification.campaign_id)
+                if notification.is_read:
+                    remove_unread(*key, 1)
+                else:
+                    add_unread({key: 1})
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            if not instance.is_read:
+                remove_unread(instance.recipient_id, instance.campaign_id, 1)
 
     @action(detail=False, methods=['get'])
     def unread_count(self, request):
         """Retorna contagem de notificações não lidas"""
         campaign_id = request.query_params.get('campaign')
-        qs = Notification.objects.filter(recipient=request.user, is_read=False)
         
         if campaign_id:
             try:
@@ -1289,16 +1668,15 @@ class NotificationViewSet(viewsets.ModelViewSet):
             except Campaign.DoesNotExist:
                 return Response({'count': 0})
             ensure_not_banned(request.user, campaign)
-            qs = qs.filter(campaign_id=campaign_id)
+            return Response({'count': get_unread_count(request.user, campaign.id)})
         
-        return Response({'count': qs.count()})
+        return Response({'count': get_unread_count(request.user)})
 
     @action(detail=True, methods=['post'])
     def mark_read(self, request, pk=None):
         """Marca notificação como lida"""
         notification = self.get_object()
-        notification.is_read = True
-        notification.save()
+        mark_notifications_read(Notification.objects.filter(pk=notification.pk))
         return Response({'status': 'Marcada como lida.'})
 
     @action(detail=False, methods=['post'])
@@ -1315,13 +1693,13 @@ class NotificationViewSet(viewsets.ModelViewSet):
             ensure_not_banned(request.user, campaign)
             qs = qs.filter(campaign_id=campaign_id)
         
-        qs.update(is_read=True)
+        mark_notifications_read(qs)
         return Response({'status': 'Todas marcadas como lidas.'})
 
 
 # ============== MESSAGES ==============
 
-class MessageViewSet(viewsets.ModelViewSet):
+class MessageViewSet(HistoryPaginationMixin, viewsets.ModelViewSet):
     serializer_class = MessageSerializer
     permission_classes = [IsAuthenticated]
     http_method_names = ['get', 'post', 'head', 'options']
@@ -1393,9 +1771,9 @@ class MessageViewSet(viewsets.ModelViewSet):
         serializer.save(sender=user)
 
         preview = content[:120]
-        Notification.objects.create(
+        notify(
             campaign=campaign,
-            recipient=recipient,
+            recipients=[recipient],
             notification_type='message',
             title='Mensagem Secreta',
             message=f'Nova mensagem de {user.username}: {preview}',
@@ -1403,7 +1781,8 @@ class MessageViewSet(viewsets.ModelViewSet):
 
 # ============== SKILLS, ABILITIES, ETC ==============
 
-class SkillViewSet(viewsets.ModelViewSet):
+class SkillViewSet(CachedCatalogMixin, viewsets.ModelViewSet):
+    catalog_name = 'skill'
     serializer_class = SkillSerializer
     permission_classes = [IsAuthenticated]
 
@@ -1429,7 +1808,8 @@ class SkillViewSet(viewsets.ModelViewSet):
         serializer.save()
 
 
-class AbilityViewSet(viewsets.ModelViewSet):
+class AbilityViewSet(CachedCatalogMixin, viewsets.ModelViewSet):
+    catalog_name = 'ability'
     serializer_class = AbilitySerializer
     permission_classes = [IsAuthenticated]
 
@@ -1450,7 +1830,9 @@ class AbilityViewSet(viewsets.ModelViewSet):
         serializer.save()
 
 
-class BleachSpellViewSet(viewsets.ReadOnlyModelViewSet):
+class BleachSpellViewSet(CachedCatalogMixin, viewsets.ReadOnlyModelViewSet):
+    catalog_name = 'bleachspell'
+    catalog_filter_params = ('type', 'tier')
     serializer_class = BleachSpellSerializer
     permission_classes = [IsAuthenticated]
 
@@ -1469,7 +1851,8 @@ class BleachSpellViewSet(viewsets.ReadOnlyModelViewSet):
         return qs
 
 
-class AdvantageViewSet(viewsets.ModelViewSet):
+class AdvantageViewSet(CachedCatalogMixin, viewsets.ModelViewSet):
+    catalog_name = 'advantage'
     serializer_class = AdvantageSerializer
     permission_classes = [IsAuthenticated]
 
@@ -1490,7 +1873,8 @@ class AdvantageViewSet(viewsets.ModelViewSet):
         serializer.save()
 
 
-class PersonalityTraitViewSet(viewsets.ModelViewSet):
+class PersonalityTraitViewSet(CachedCatalogMixin, viewsets.ModelViewSet):
+    catalog_name = 'personalitytrait'
     serializer_class = PersonalityTraitSerializer
     permission_classes = [IsAuthenticated]
 
@@ -1562,9 +1946,9 @@ class SkillIdeaViewSet(viewsets.ModelViewSet):
         )
 
         if campaign.owner_id != self.request.user.id:
-            Notification.objects.create(
+            notify(
                 campaign=campaign,
-                recipient=campaign.owner,
+                recipients=[campaign.owner_id],
                 notification_type='system',
                 title='Nova Ideia de Skill',
                 message=f'{character.name} enviou uma ideia de skill: {idea.name}',
@@ -1607,9 +1991,9 @@ class SkillIdeaViewSet(viewsets.ModelViewSet):
         idea.response_message = f'Ideia aprovada! Maestria: {mastery}.'
         idea.save()
 
-        Notification.objects.create(
+        notify(
             campaign=idea.campaign,
-            recipient=idea.character.owner,
+            recipients=[idea.character.owner_id],
             notification_type='system',
             title='Skill Aprovada',
             message=idea.response_message,
@@ -1636,9 +2020,9 @@ class SkillIdeaViewSet(viewsets.ModelViewSet):
         idea.response_message = response_message
         idea.save()
 
-        Notification.objects.create(
+        notify(
             campaign=idea.campaign,
-            recipient=idea.character.owner,
+            recipients=[idea.character.owner_id],
             notification_type='system',
             title='Skill Rejeitada',
             message=response_message,
@@ -1713,9 +2097,9 @@ class PowerIdeaViewSet(viewsets.ModelViewSet):
 
         # Notificar o mestre
         if campaign.owner_id != self.request.user.id:
-            Notification.objects.create(
+            notify(
                 campaign=campaign,
-                recipient=campaign.owner,
+                recipients=[campaign.owner_id],
                 notification_type='system',
                 title='Nova Ideia de Poder',
                 message=f'{character.name} enviou uma ideia de {idea.get_idea_type_display()}: {idea.name}',
@@ -1815,9 +2199,9 @@ class PowerIdeaViewSet(viewsets.ModelViewSet):
         idea.response_message = response_message
         idea.save()
 
-        Notification.objects.create(
+        notify(
             campaign=idea.campaign,
-            recipient=character.owner,
+            recipients=[character.owner_id],
             notification_type='system',
             title='Ideia Aprovada',
             message=response_message,
@@ -1844,9 +2228,9 @@ class PowerIdeaViewSet(viewsets.ModelViewSet):
         idea.response_message = response_message
         idea.save()
 
-        Notification.objects.create(
+        notify(
             campaign=idea.campaign,
-            recipient=idea.character.owner,
+            recipients=[idea.character.owner_id],
             notification_type='system',
             title='Ideia Rejeitada',
             message=response_message,
@@ -2002,30 +2386,149 @@ class SessionViewSet(viewsets.ModelViewSet):
         campaign = session.campaign
         campaign.map_data = session.map_data or {}
         campaign.map_image = session.map_image
+        campaign.map_version = models.F('map_version') + 1
         campaign.save()
+        campaign.refresh_from_db(fields=['map_version'])
+        publish_map(campaign)
         return Response({
             'map_image': campaign.map_image.url if campaign.map_image else None,
             'map_data': campaign.map_data or {},
             'map_updated_at': campaign.map_updated_at,
+            'map_version': campaign.map_version,
         })
 
 
 # ============== POLLING ENDPOINT ==============
 
+def poll_state_queryset(user):
+    """Campanha anotada com tudo que muda o resultado do polling (uma consulta)"""
+    unread = Notification.objects.filter(
+        campaign=models.OuterRef('pk'),
+        recipient=user,
+        is_read=False,
+    )
+    rolls = DiceRoll.objects.filter(campaign=models.OuterRef('pk'))
+    open_requests = RollRequest.objects.filter(
+        campaign=models.OuterRef('pk'),
+        character__owner=user,
+        is_open=True,
+    )
+    return Campaign.objects.defer('map_data').annotate(
+        user_is_banned=models.Exists(CampaignBan.objects.filter(
+            campaign=models.OuterRef('pk'),
+            user=user,
+            is_active=True,
+        )),
+        last_notification_id=_subquery_max_id(unread),
+        unread_count=Coalesce(
+            models.Subquery(NotificationCounter.objects.filter(
+                campaign=models.OuterRef('pk'),
+                user=user,
+            ).values('unread')[:1]),
+            0,
+        ),
+        last_roll_id=models.Subquery(rolls.order_by('-id').values('id')[:1]),
+        unseen_roll_count=_subquery_count(rolls.filter(seen_by_master=False)),
+        last_roll_request_id=models.Subquery(open_requests.order_by('-id').values('id')[:1]),
+        open_roll_request_count=_subquery_count(open_requests),
+    )
+
+
+def _subquery_max_id(qs):
+    # MAX() agregado deixa o SQLite usar o índice parcial de não lidas
+    return models.Subquery(
+        qs.order_by().values('campaign').annotate(last=models.Max('id')).values('last')
+    )
+
+
+def _subquery_count(qs):
+    return Coalesce(
+        models.Subquery(
+            qs.order_by().values('campaign').annotate(total=models.Count('id')).values('total')
+        ),
+        0,
+    )
+
+
+POLL_DELTA_LIMIT = 50
+
+
+def parse_poll_cursor(raw):
+    """Cursor do polling: 'notificação.rolagem.solicitação' (maiores ids já vistos)"""
+    try:
+        marks = tuple(int(part) for part in raw.split('.'))
+    except (TypeError, ValueError):
+        raise ValidationError('Cursor inválido.')
+    if len(marks) != 3 or any(mark < 0 for mark in marks):
+        raise ValidationError('Cursor inválido.')
+    return marks
+
+
+def format_poll_cursor(marks):
+    return '.'.join(str(mark) for mark in marks)
+
+
+def _poll_delta(qs, mark):
+    """Itens acima do cursor (mais novo primeiro) e se ainda sobrou algo"""
+    items = list(qs.filter(id__gt=mark).order_by('id')[:POLL_DELTA_LIMIT + 1])
+    has_more = len(items) > POLL_DELTA_LIMIT
+    items = items[:POLL_DELTA_LIMIT]
+    items.reverse()
+    return items, has_more
+
+
+def poll_version_stamp(campaign, is_master, since=None):
+    """Versão da resposta do polling para este usuário"""
+    parts = [
+        campaign.projection_updated_at.isoformat(),
+        campaign.map_updated_at.isoformat(),
+        campaign.last_notification_id,
+        campaign.unread_count,
+        since or '',
+    ]
+    if is_master:
+        parts += ['m', campaign.last_roll_id, campaign.unseen_roll_count]
+    else:
+        parts += ['p', campaign.last_roll_request_id, campaign.open_roll_request_count]
+    raw = ':'.join(str(part) for part in parts)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
 class CampaignPollView(APIView):
     """Endpoint para polling a cada 3 segundos"""
     permission_classes = [IsAuthenticated]
 
     def get(self, request, campaign_id):
         try:
-            campaign = Campaign.objects.get(id=campaign_id)
+            campaign = poll_state_queryset(request.user).get(id=campaign_id)
         except Campaign.DoesNotExist:
             return Response({'detail': 'Campanha não encontrada.'}, status=404)
 
-        ensure_not_banned(request.user, campaign)
-        
-        since = request.query_params.get('since')  # timestamp ISO
-        
+        if campaign.user_is_banned and not is_game_master(request.user):
+            raise PermissionDenied('Você foi banido desta campanha.')
+
+        raw_cursor = request.query_params.get('cursor')
+        cursor = parse_poll_cursor(raw_cursor) if raw_cursor else None
+        since = None
+        if cursor is None and request.query_params.get('since'):
+            # Legado: o cursor tem precedência. Mesma leitura que o filtro em created_at
+            # sempre fez (ISO, data sem hora, 'AAAA-MM-DD HH:MM'...); só o inválido vira 400
+            try:
+                since = models.DateTimeField().to_python(request.query_params['since'])
+            except DjangoValidationError:
+                raise ValidationError('Parâmetro since inválido.')
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+        is_master = is_campaign_master(request.user, campaign)
+
+        # Nada mudou desde a última resposta: 304 sem rodar serializers
+        etag = quote_etag(poll_version_stamp(campaign, is_master, raw_cursor or since))
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            response['Cache-Control'] = 'private, no-cache'
+            return response
+
         data = {
             'projection': {
                 'image': campaign.projection_image.url if campaign.projection_image else None,
@@ -2035,10 +2538,12 @@ class CampaignPollView(APIView):
             'map': {
                 'image': campaign.map_image.url if campaign.map_image else None,
                 'updated_at': campaign.map_updated_at,
+                'version': campaign.map_version,
             },
             'notifications': [],
             'recent_rolls': [],
             'roll_requests': [],
+            'has_more': False,
         }
         
         # Notificações do usuário
@@ -2047,30 +2552,265 @@ class CampaignPollView(APIView):
             recipient=request.user,
             is_read=False,
         )
-        if since:
-            notifications_qs = notifications_qs.filter(created_at__gt=since)
-        
-        data['notifications'] = NotificationSerializer(
-            notifications_qs.order_by('-created_at')[:10], many=True
-        ).data
-        
-        # Rolagens recentes (para o mestre)
-        if is_campaign_master(request.user, campaign):
-            rolls_qs = DiceRoll.objects.filter(campaign=campaign)
-            if since:
-                rolls_qs = rolls_qs.filter(created_at__gt=since)
-            
-            data['recent_rolls'] = DiceRollMasterSerializer(
-                rolls_qs.order_by('-created_at')[:10], many=True
-            ).data
+        if is_master:
+            feed_qs = DiceRoll.objects.filter(campaign=campaign).select_related('character', 'skill_used')
         else:
-            requests_qs = RollRequest.objects.filter(
+            feed_qs = RollRequest.objects.filter(
                 campaign=campaign,
                 is_open=True,
                 character__owner=request.user,
+            ).select_related('character', 'skill')
+
+        if cursor is not None:
+            # Modo incremental: só o que passou do cursor, do mais antigo ao mais novo
+            notification_mark, roll_mark, request_mark = cursor
+            feed_mark = roll_mark if is_master else request_mark
+            notifications, notifications_more = _poll_delta(notifications_qs, notification_mark)
+            feed, feed_more = _poll_delta(feed_qs, feed_mark)
+            data['has_more'] = notifications_more or feed_more
+            next_cursor = (
+                max([notification_mark] + [n.id for n in notifications]),
+                max([roll_mark] + [r.id for r in feed]) if is_master else roll_mark,
+                request_mark if is_master else max([request_mark] + [r.id for r in feed]),
+            )
+        else:
+            if since:
+                notifications_qs = notifications_qs.filter(created_at__gt=since)
+                if is_master:
+                    feed_qs = feed_qs.filter(created_at__gt=since)
+            notifications = notifications_qs.order_by('-created_at')[:10]
+            feed = feed_qs.order_by('-created_at')[:10]
+            next_cursor = (
+                campaign.last_notification_id or 0,
+                campaign.last_roll_id or 0,
+                campaign.last_roll_request_id or 0,
             )
-            data['roll_requests'] = RollRequestSerializer(
-                requests_qs.order_by('-created_at')[:10], many=True
-            ).data
+
+        data['notifications'] = NotificationSerializer(notifications, many=True).data
+        # Rolagens recentes (para o mestre)
+        if is_master:
+            data['recent_rolls'] = DiceRollMasterSerializer(feed, many=True).data
+        else:
+            data['roll_requests'] = RollRequestSerializer(feed, many=True).data
+        data['cursor'] = format_poll_cursor(next_cursor)
         
-        return Response(data)
+        response = Response(data)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+# ============== EVENT STREAM (SSE) ==============
+
+class CampaignEventStreamView(View):
+    """Canal push da campanha: substitui o polling quando o servidor é ASGI"""
+
+    async def get(self, request, campaign_id):
+        if not isinstance(request, ASGIRequest):
+            # Em WSGI o stream seguraria um worker; o cliente volta ao polling
+            return JsonResponse(
+                {'detail': 'Canal de eventos indisponível neste servidor.'},
+                status=503,
+            )
+
+        user = await _authenticate_event_stream(request, campaign_id)
+        if user is None:
+            return JsonResponse({'detail': 'Credenciais não fornecidas.'}, status=401)
+
+        try:
+            campaign = await Campaign.objects.aget(id=campaign_id)
+        except Campaign.DoesNotExist:
+            return JsonResponse({'detail': 'Campanha não encontrada.'}, status=404)
+
+        try:
+            await sync_to_async(ensure_not_banned)(user, campaign)
+        except PermissionDenied as exc:
+            return JsonResponse({'detail': str(exc.detail)}, status=403)
+
+        is_master = await sync_to_async(is_campaign_master)(user, campaign)
+        subscriber = broker.subscribe(campaign.id, user.id, is_master)
+
+        response = StreamingHttpResponse(
+            _event_stream(subscriber),
+            content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+EVENT_STREAM_TOKEN_SALT = 'api.campaign-events'
+
+
+def make_event_stream_token(user, campaign_id):
+    return signing.dumps({'user': user.id, 'campaign': campaign_id}, salt=EVENT_STREAM_TOKEN_SALT)
+
+
+async def _authenticate_event_stream(request, campaign_id):
+    """
+    EventSource não envia headers: aceita ``?stream_token=`` (ver
+    CampaignViewSet.event_token) além do Authorization e da sessão.
+    """
+    stream_token = request.GET.get('stream_token')
+    if stream_token:
+        try:
+            claims = signing.loads(
+                stream_token, salt=EVENT_STREAM_TOKEN_SALT, max_age=settings.CAMPAIGN_EVENTS_TOKEN_MAX_AGE,
+            )
+        except signing.BadSignature:
+            return None
+        if claims.get('campaign') != campaign_id:
+            return None
+        return await User.objects.filter(id=claims.get('user'), is_active=True).afirst()
+
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Token '):
+        key = auth[len('Token '):].strip()
+        token = await Token.objects.select_related('user').filter(key=key).afirst()
+        if token is None or not token.user.is_active:
+            return None
+        return token.user
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
+
+async def _event_stream(subscriber):
+    keepalive = getattr(settings, 'CAMPAIGN_EVENTS_KEEPALIVE', 15)
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'
+                continue
+            yield event.encode()
+            if event.event_type == EVENT_RESYNC:
+                # Cliente deve refazer o carregamento completo e reconectar
+                return
+    finally:
+        broker.unsubscribe(subscriber)
+
+
+# ============== MÍDIA ==============
+
+MEDIA_IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+MEDIA_REVALIDATE_CACHE = 'public, no-cache'
+_BYTE_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class _FileRange:
+    """
+    Trecho ``[start, start + length)`` de um arquivo aberto.
+
+    Expõe ``fileno`` para o ``wsgi.file_wrapper`` do servidor usar sendfile a
+    partir da posição atual (limitado pelo Content-Length); quem lê por
+    ``read`` nunca passa do fim do trecho.
+    """
+
+    def __init__(self, fh, start, length):
+        fh.seek(start)
+        self.fh = fh
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        chunk = self.fh.read(size)
+        self.remaining -= len(chunk)
+        return chunk
+
+    def fileno(self):
+        return self.fh.fileno()
+
+    def close(self):
+        self.fh.close()
+
+
+def _parse_byte_range(header, size):
+    """(início, fim) inclusivos; None para ignorar o Range; ValueError se insatisfazível"""
+    match = _BYTE_RANGE.match(header.strip())
+    if not match or not any(match.groups()):
+        # Vários trechos ou formato desconhecido: responde o arquivo inteiro
+        return None
+    first, last = match.groups()
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise ValueError
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError
+    return start, end
+
+
+def _media_etag(name, stat):
+    if is_immutable(name):
+        return quote_etag(os.path.splitext(os.path.basename(name))[0])
+    return quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serve MEDIA_ROOT sem depender do DEBUG.
+
+    Nomes com hash (blobs e derivadas) vão com cache imutável de um ano; os
+    demais são revalidados por ETag/Last-Modified (304). Aceita um trecho
+    por ``Range`` (206) para mapas grandes. O arquivo vai como FileResponse,
+    então servidores WSGI com ``wsgi.file_wrapper`` o enviam com sendfile.
+    """
+    try:
+        full_path = default_storage.path(path)
+        fh = open(full_path, 'rb')
+    except (SuspiciousFileOperation, FileNotFoundError, IsADirectoryError, NotADirectoryError, PermissionError):
+        raise Http404('Arquivo não encontrado.')
+    stat = os.fstat(fh.fileno())
+    etag = _media_etag(path, stat)
+    last_modified = http_date(stat.st_mtime)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': last_modified,
+        'Cache-Control': MEDIA_IMMUTABLE_CACHE if is_immutable(path) else MEDIA_REVALIDATE_CACHE,
+        'Accept-Ranges': 'bytes',
+    }
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        not_modified = etag in parse_etags(if_none_match) or if_none_match.strip() == '*'
+    else:
+        since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        not_modified = since is not None and int(stat.st_mtime) <= since
+    if not_modified:
+        fh.close()
+        response = HttpResponseNotModified()
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if request.headers.get('Range') and (if_range is None or if_range.strip() in (etag, last_modified)):
+        try:
+            byte_range = _parse_byte_range(request.headers['Range'], stat.st_size)
+        except ValueError:
+            fh.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if byte_range is None:
+        response = FileResponse(fh, content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(_FileRange(fh, start, length), status=206, content_type=content_type)
+        response['Content-Length'] = length
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    for header, value in headers.items():
+        response[header] = value
+    return response
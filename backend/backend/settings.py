@@ -2,6 +2,7 @@
 Django settings for backend project.
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -36,6 +37,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.authorization_context_middleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -95,6 +97,20 @@ STATIC_URL = 'static/'
 # Media files (uploads)
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# O próprio Django serve MEDIA_URL (cache longo, ETag, Range); desligue se um
+# proxy (nginx etc.) servir MEDIA_ROOT diretamente
+SERVE_MEDIA = True
+
+# Uploads gravados pelo hash do conteúdo (api/storage.py); órfãos saem com
+# manage.py collect_media_garbage
+STORAGES = {
+    'default': {
+        'BACKEND': 'api.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
 
 # Django REST Framework
 REST_FRAMEWORK = {
@@ -110,5 +126,36 @@ REST_FRAMEWORK = {
 # CORS
 CORS_ALLOW_ALL_ORIGINS = True
 
+# Canal de eventos da campanha (SSE, requer servidor ASGI)
+CAMPAIGN_EVENTS_BROKER = 'api.events.InProcessBroker'
+CAMPAIGN_EVENTS_KEEPALIVE = 15  # segundos entre pings
+CAMPAIGN_EVENTS_QUEUE_SIZE = 100  # eventos pendentes por conexão
+CAMPAIGN_EVENTS_TOKEN_MAX_AGE = 60  # segundos para abrir o canal com o stream_token
+
+# Cache (catálogos, modificadores, estatísticas). Memória local por padrão;
+# com REDIS_URL definido usa Redis, compartilhado entre processos (requer o pacote redis)
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'fdv',
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+
+# Miniaturas/WebP das imagens enviadas (api/images.py); 0 processa na própria requisição
+IMAGE_DERIVATIVE_WORKERS = 2
+
+# Retenção de notificações (manage.py prune_notifications)
+NOTIFICATION_RETENTION_DAYS = 30
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
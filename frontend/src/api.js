@@ -16,6 +16,95 @@ export function mediaUrl(url) {
   return `${MEDIA_BASE}/${url}`
 }
 
+// srcset das derivadas (image_variants) para o navegador escolher o tamanho
+export function imageSrcSet(variants, format = 'webp') {
+  const widths = variants?.[format]
+  if (!widths) return undefined
+  return Object.entries(widths)
+    .map(([width, url]) => `${mediaUrl(url)} ${width}w`)
+    .join(', ')
+}
+
+// JSON Patch (RFC 6902) numa cópia do documento; lança erro se uma operação falhar
+function parsePointer(pointer) {
+  if (pointer === '') return []
+  return pointer.slice(1).split('/').map(token => token.replace(/~1/g, '/').replace(/~0/g, '~'))
+}
+
+function patchParent(document, tokens) {
+  let container = document
+  tokens.slice(0, -1).forEach(token => {
+    if (container === null || typeof container !== 'object' || !(token in container)) {
+      throw new Error(`Caminho inexistente: /${tokens.join('/')}`)
+    }
+    container = container[token]
+  })
+  if (container === null || typeof container !== 'object') {
+    throw new Error(`Caminho inexistente: /${tokens.join('/')}`)
+  }
+  return [container, tokens[tokens.length - 1]]
+}
+
+function patchGet(document, tokens) {
+  if (!tokens.length) return document
+  const [container, key] = patchParent(document, tokens)
+  if (!(key in container)) throw new Error(`Caminho inexistente: /${tokens.join('/')}`)
+  return container[key]
+}
+
+function patchAdd(document, tokens, value) {
+  if (!tokens.length) return value
+  const [container, key] = patchParent(document, tokens)
+  if (Array.isArray(container)) {
+    container.splice(key === '-' ? container.length : Number(key), 0, value)
+  } else {
+    container[key] = value
+  }
+  return document
+}
+
+function patchRemove(document, tokens) {
+  const [container, key] = patchParent(document, tokens)
+  const value = patchGet(document, tokens)
+  if (Array.isArray(container)) {
+    container.splice(Number(key), 1)
+  } else {
+    delete container[key]
+  }
+  return value
+}
+
+export function applyJsonPatch(document, operations) {
+  let result = structuredClone(document)
+  operations.forEach(({ op, path, from, value }) => {
+    const tokens = parsePointer(path)
+    if (op === 'add') {
+      result = patchAdd(result, tokens, structuredClone(value))
+    } else if (op === 'remove') {
+      patchRemove(result, tokens)
+    } else if (op === 'replace') {
+      if (!tokens.length) {
+        result = structuredClone(value)
+      } else {
+        patchGet(result, tokens)
+        const [container, key] = patchParent(result, tokens)
+        container[key] = structuredClone(value)
+      }
+    } else if (op === 'move') {
+      result = patchAdd(result, tokens, patchRemove(result, parsePointer(from)))
+    } else if (op === 'copy') {
+      result = patchAdd(result, tokens, structuredClone(patchGet(result, parsePointer(from))))
+    } else if (op === 'test') {
+      if (JSON.stringify(patchGet(result, tokens)) !== JSON.stringify(value)) {
+        throw new Error(`Teste falhou em ${path}`)
+      }
+    } else {
+      throw new Error(`Operação desconhecida: ${op}`)
+    }
+  })
+  return result
+}
+
 // Helpers
 function getToken() {
   const auth = localStorage.getItem('auth')
@@ -120,6 +209,22 @@ export async function requestRoll(campaignId, characterId, skillId, description
   })
 }
 
+// characterIds: lista de ids ou 'all' para todos os jogadores
+export async function requestRollGroup(campaignId, characterIds, skillId, description = '') {
+  return request(`/campaigns/${campaignId}/request_roll_group/`, {
+    method: 'POST',
+    body: JSON.stringify({
+      character_ids: characterIds,
+      skill_id: skillId,
+      description,
+    }),
+  })
+}
+
+export async function getRollGroup(campaignId, groupId) {
+  return request(`/campaigns/${campaignId}/roll_groups/${groupId}/`)
+}
+
 export async function completeRollRequest(campaignId, requestId, useFatePoint = false) {
   return request(`/campaigns/${campaignId}/complete_roll/`, {
     method: 'POST',
@@ -161,8 +266,16 @@ export async function updateProjection(campaignId, formData) {
   })
 }
 
-export async function getMap(campaignId) {
-  return request(`/campaigns/${campaignId}/map/`)
+// Com sinceVersion o servidor pode responder só os patches que faltam ({ patches })
+export async function getMap(campaignId, sinceVersion = null) {
+  const query = sinceVersion != null ? `?since_version=${sinceVersion}` : ''
+  return request(`/campaigns/${campaignId}/map/${query}`)
+}
+
+// Sem viewport: descrição da pirâmide; com { zoom, left, top, right, bottom }: tiles visíveis
+export async function getMapTiles(campaignId, viewport = null) {
+  const query = viewport ? `?${new URLSearchParams(viewport)}` : ''
+  return request(`/campaigns/${campaignId}/map_tiles/${query}`)
 }
 
 export async function updateMap(campaignId, formData) {
@@ -173,6 +286,30 @@ export async function updateMap(campaignId, formData) {
   })
 }
 
+// Operações JSON Patch sobre o map_data; falha (409) se o mapa não estiver mais em `version`
+export async function patchMap(campaignId, version, operations) {
+  return request(`/campaigns/${campaignId}/patch_map/`, {
+    method: 'POST',
+    body: JSON.stringify({ version, operations }),
+  })
+}
+
+// Resposta de getMap (inteira ou só patches) aplicada sobre o mapa atual
+export function mergeMapResponse(current, response) {
+  if (!response?.patches) return response
+  if (!current) return current
+  const mapData = response.patches.reduce(
+    (data, patch) => applyJsonPatch(data, patch.operations),
+    current.map_data || {},
+  )
+  return {
+    ...current,
+    map_data: mapData,
+    map_version: response.map_version,
+    map_updated_at: response.map_updated_at,
+  }
+}
+
 // ============== SESSIONS ==============
 
 export async function getSessions(campaignId) {
@@ -225,6 +362,10 @@ export async function getNPCs(campaignId) {
   return request(`/campaigns/${campaignId}/npcs/`)
 }
 
+export async function getCampaignSummary(campaignId) {
+  return request(`/campaigns/${campaignId}/summary/`)
+}
+
 // ============== CHARACTERS ==============
 
 export async function getCharacters(campaignId) {
@@ -375,6 +516,16 @@ export async function markRollSeen(rollId) {
   return request(`/rolls/${rollId}/mark_seen/`, { method: 'POST' })
 }
 
+export async function getRollStats(campaignId, characterId = null) {
+  const query = characterId ? `&character=${characterId}` : ''
+  return request(`/rolls/stats/?campaign=${campaignId}${query}`)
+}
+
+export async function getItemTrades(campaignId, cursor = null) {
+  const query = cursor ? `&cursor=${encodeURIComponent(cursor)}` : ''
+  return request(`/item-trades/?campaign=${campaignId}&page_size=50${query}`)
+}
+
 // ============== NOTIFICATIONS ==============
 
 export async function getNotifications(campaignId) {
@@ -529,9 +680,67 @@ export async function setRelease(characterId, data) {
   })
 }
 
+// ============== EVENTOS (SSE) ==============
+
+const CAMPAIGN_EVENT_TYPES = ['projection', 'map', 'map_patch', 'notification', 'roll', 'roll_request', 'resync']
+
+// Token assinado de vida curta: o token da API não vai na URL (nem nos logs)
+export async function getEventToken(campaignId) {
+  return request(`/campaigns/${campaignId}/event_token/`, { method: 'POST' })
+}
+
+export function subscribeCampaignEvents(campaignId, { onOpen, onEvent, onClose } = {}) {
+  if (typeof EventSource === 'undefined') return null
+  let source = null
+  let closed = false
+
+  const connect = async () => {
+    let token
+    try {
+      ({ token } = await getEventToken(campaignId))
+    } catch {
+      onClose?.()
+      return
+    }
+    if (closed) return
+    source = new EventSource(`${API_BASE}/campaigns/${campaignId}/events/?stream_token=${encodeURIComponent(token)}`)
+
+    source.onopen = () => onOpen?.()
+    source.onerror = () => {
+      onClose?.()
+      // Servidor sem ASGI responde 503 e o EventSource desiste: fica o polling
+      if (source.readyState === EventSource.CLOSED) return
+      // A reconexão automática reusaria um token vencido: reconecta com outro
+      source.close()
+      setTimeout(() => {
+        if (!closed) connect()
+      }, 3000)
+    }
+    CAMPAIGN_EVENT_TYPES.forEach(type => {
+      source.addEventListener(type, (event) => {
+        let data = null
+        try {
+          data = JSON.parse(event.data)
+        } catch {
+          data = null
+        }
+        onEvent?.(type, data)
+      })
+    })
+  }
+
+  connect()
+  return {
+    close: () => {
+      closed = true
+      source?.close()
+    },
+  }
+}
+
 // ============== POLLING ==============
 
-export async function pollCampaign(campaignId, since) {
-  const query = since ? `?since=${since}` : ''
+export async function pollCampaign(campaignId, cursor) {
+  const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : ''
   return request(`/campaigns/${campaignId}/poll/${query}`)
 }
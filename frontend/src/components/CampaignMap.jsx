@@ -296,10 +296,36 @@ export default function CampaignMap({
     })
   }
 
+  // Mover um grupo manda só as coordenadas dele; se o patch não servir, salva o mapa inteiro
+  const saveGroupPosition = async (groupId) => {
+    const index = mapRef.current.groups.findIndex(group => group.id === groupId)
+    const group = mapRef.current.groups[index]
+    const stored = mapData?.map_data?.groups?.[index]
+    if (!campaign || mapData?.map_version == null || !group || stored?.id !== group.id) {
+      saveMapData(mapRef.current)
+      return
+    }
+    const operations = [
+      { op: 'test', path: `/groups/${index}/id`, value: group.id },
+      { op: 'add', path: `/groups/${index}/x`, value: group.x },
+      { op: 'add', path: `/groups/${index}/y`, value: group.y },
+    ]
+    try {
+      const result = await api.patchMap(campaign.id, mapData.map_version, operations)
+      onMapUpdate?.(prev => (
+        prev && prev.map_version < result.map_version
+          ? { ...prev, ...result, map_data: api.applyJsonPatch(prev.map_data || {}, operations) }
+          : prev
+      ))
+    } catch {
+      saveMapData(mapRef.current)
+    }
+  }
+
   const handlePointerUp = () => {
     if (!draggingGroupId) return
     setDraggingGroupId(null)
-    saveMapData(mapRef.current)
+    saveGroupPosition(draggingGroupId)
   }
 
   const handleAddGroup = () => {
@@ -11,6 +11,7 @@ export default function NotificationBell({ notifications, onClear }) {
       case 'roll': return '🎲'
       case 'fate': return '✨'
       case 'system': return '📣'
+      case 'digest': return '🗂️'
       default: return '📢'
     }
   }
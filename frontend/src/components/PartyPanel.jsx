@@ -501,7 +501,12 @@ export default function PartyPanel({ party, campaign, skills, traits = [], power
               <div className="party-card-header">
                 <div className="party-avatar">
                   {char.image ? (
-                    <img src={api.mediaUrl(char.image)} alt={char.name} />
+                    <img
+                      src={api.mediaUrl(char.image)}
+                      srcSet={api.imageSrcSet(char.image_variants)}
+                      sizes="40px"
+                      alt={char.name}
+                    />
                   ) : (
                     <span>{char.name.charAt(0)}</span>
                   )}
@@ -1,4 +1,4 @@
-import { useState, useEffect, useCallback } from 'react'
+import { useState, useEffect, useCallback, useRef } from 'react'
 import { useParams, useNavigate } from 'react-router-dom'
 import { useAuth } from '../context/AuthContext'
 import * as api from '../api'
@@ -48,9 +48,52 @@ export default function CampaignPage() {
   const [activeTab, setActiveTab] = useState(isGameMaster ? 'party' : 'sheet')
   const [showRoller, setShowRoller] = useState(false)
   const [showMobileMenu, setShowMobileMenu] = useState(false)
+  const [streamConnected, setStreamConnected] = useState(false)
+  const pollNowRef = useRef(null)
+  const pollCursorRef = useRef(null)
+  const campaignMapRef = useRef(null)
+
+  useEffect(() => {
+    campaignMapRef.current = campaignMap
+  }, [campaignMap])
+
+  // Busca só o que falta desde a versão local (patches ou o mapa inteiro)
+  const refreshMap = useCallback(async () => {
+    const current = campaignMapRef.current
+    const response = await api.getMap(id, current?.map_version)
+    try {
+      setCampaignMap(api.mergeMapResponse(current, response) || null)
+    } catch {
+      setCampaignMap(await api.getMap(id) || null)
+    }
+  }, [id])
+
+  const applyMapPatchEvent = useCallback((data) => {
+    const current = campaignMapRef.current
+    if (!data || !current) return
+    // Patch do próprio mestre, já aplicado pela resposta do patch_map
+    if (data.version <= current.map_version) return
+    if (data.version === current.map_version + 1) {
+      try {
+        const next = {
+          ...current,
+          map_data: api.applyJsonPatch(current.map_data || {}, data.operations),
+          map_version: data.version,
+          map_updated_at: data.updated_at,
+        }
+        campaignMapRef.current = next
+        setCampaignMap(next)
+        return
+      } catch {
+        // Cópia local divergiu: cai no refresh
+      }
+    }
+    refreshMap().catch(err => console.error('Map refresh error:', err))
+  }, [refreshMap])
 
   // Load campaign data
   const loadData = useCallback(async () => {
+    pollCursorRef.current = null
     try {
       const [
         campaignData,
@@ -129,13 +172,37 @@ export default function CampaignPage() {
     }
   }, [projectionImage, projectionUpdatedAt, lastProjectionSeen])
 
-  // Polling every 3 seconds
+  // Canal de eventos: com ele aberto o polling vira só uma rede de segurança
+  useEffect(() => {
+    if (!campaign) return
+
+    const source = api.subscribeCampaignEvents(id, {
+      onOpen: () => setStreamConnected(true),
+      onEvent: (type, data) => {
+        if (type === 'map_patch') {
+          applyMapPatchEvent(data)
+          return
+        }
+        pollNowRef.current?.()
+      },
+      onClose: () => setStreamConnected(false),
+    })
+
+    return () => {
+      source?.close()
+      setStreamConnected(false)
+    }
+  }, [id, campaign, applyMapPatchEvent])
+
+  // Polling every 3 seconds (30 seconds while the event stream is open)
   useEffect(() => {
     if (!campaign) return
     
-    const interval = setInterval(async () => {
+    const poll = async () => {
       try {
-        const data = await api.pollCampaign(id)
+        const cursor = pollCursorRef.current
+        const data = await api.pollCampaign(id, cursor)
+        pollCursorRef.current = data.cursor || null
         
         // Update projection
         if (data.projection) {
@@ -144,8 +211,7 @@ export default function CampaignPage() {
 
         if (data.map?.updated_at) {
           if (!campaignMap?.map_updated_at || data.map.updated_at !== campaignMap.map_updated_at) {
-            const mapData = await api.getMap(id)
-            setCampaignMap(mapData || null)
+            await refreshMap()
           }
         }
         
@@ -170,16 +236,32 @@ export default function CampaignPage() {
         }
         
         if (!isGameMaster) {
-          setRollRequests(data.roll_requests || [])
+          if (cursor) {
+            // Resposta incremental: só chegam solicitações novas
+            if (data.roll_requests?.length > 0) {
+              setRollRequests(prev => {
+                const newIds = new Set(data.roll_requests.map(r => r.id))
+                return [...data.roll_requests, ...prev.filter(r => !newIds.has(r.id))]
+              })
+            }
+          } else {
+            setRollRequests(data.roll_requests || [])
+          }
         }
         
       } catch (err) {
         console.error('Polling error:', err)
       }
-    }, 3000)
+    }
+    pollNowRef.current = poll
+
+    const interval = setInterval(poll, streamConnected ? 30000 : 3000)
     
-    return () => clearInterval(interval)
-  }, [id, campaign, isGameMaster, myCharacter?.id, campaignMap?.map_updated_at])
+    return () => {
+      clearInterval(interval)
+      pollNowRef.current = null
+    }
+  }, [id, campaign, isGameMaster, myCharacter?.id, campaignMap?.map_updated_at, streamConnected, refreshMap])
 
   useEffect(() => {
     if (isGameMaster) return
@@ -1061,7 +1143,13 @@ function ItemsManagerPanel({ items, party, campaign, onUpdate }) {
             <div key={item.id} className="list-item">
               <div className="item-row">
                 {item.image && (
-                  <img src={api.mediaUrl(item.image)} alt={item.name} className="item-thumb" />
+                  <img
+                    src={api.mediaUrl(item.image)}
+                    srcSet={api.imageSrcSet(item.image_variants)}
+                    sizes="40px"
+                    alt={item.name}
+                    className="item-thumb"
+                  />
                 )}
                 <div className="item-info">
                   <strong>{item.name}</strong>
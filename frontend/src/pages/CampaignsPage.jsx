@@ -150,7 +150,12 @@ export default function CampaignsPage() {
                 >
                   <div className="campaign-image">
                     {campaign.image ? (
-                      <img src={api.mediaUrl(campaign.image)} alt={campaign.name} />
+                      <img
+                        src={api.mediaUrl(campaign.image)}
+                        srcSet={api.imageSrcSet(campaign.image_variants)}
+                        sizes="320px"
+                        alt={campaign.name}
+                      />
                     ) : (
                       <div className="campaign-placeholder">
                         <span>{typeInfo.icon}</span>